@@ -0,0 +1,115 @@
+"""
+Microbenchmark of the authentication overhead per request.
+
+Measures the `get_current_user` dependency for the main API key, a scoped key
+and cached and uncached JWTs, against the previous synchronous dependency run
+in the threadpool, and the whole in-process cost of an authenticated
+`GET /models`.
+
+Usage:
+    SESSION_SECRET=$(openssl rand -hex 32) python -m benchmarks.auth --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("PIPELINES_API_KEYS", json.dumps({"benchmark-app": "inference"}))
+
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+
+from config import API_KEY
+from utils.pipelines import auth
+
+
+def sync_get_current_user(credentials: HTTPAuthorizationCredentials):
+    # The dependency as it was before, which FastAPI ran in the threadpool
+    token = credentials.credentials
+    if token != API_KEY:
+        raise ValueError("Invalid API key")
+    return token
+
+
+def credentials(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+async def measure(name, call, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call()
+    wall = time.perf_counter() - start
+
+    return {
+        "case": name,
+        "requests": requests,
+        "wall_seconds": round(wall, 4),
+        "us_per_request": round(wall / requests * 1e6, 2),
+    }
+
+
+async def run(args):
+    cases = [
+        (
+            "sync dependency in threadpool",
+            lambda: run_in_threadpool(sync_get_current_user, credentials(API_KEY)),
+        ),
+        ("api key", lambda: auth.get_current_user(credentials(API_KEY))),
+        ("scoped api key", lambda: auth.get_current_user(credentials("benchmark-app"))),
+    ]
+
+    if auth.SESSION_SECRET.strip():
+        token = auth.create_token({"sub": "benchmark", "scopes": ["inference"]})
+
+        async def uncached_jwt():
+            auth.token_cache.entries.clear()
+            await auth.get_current_user(credentials(token))
+
+        cases += [
+            ("jwt (uncached)", uncached_jwt),
+            ("jwt (cached)", lambda: auth.get_current_user(credentials(token))),
+        ]
+
+    for name, call in cases:
+        print(json.dumps(await measure(name, call, args.requests)), flush=True)
+
+    import httpx
+
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://pipelines"
+        ) as client:
+            for name, headers in [
+                ("GET /models", {"Authorization": f"Bearer {API_KEY}"}),
+                ("GET / (no auth)", {}),
+            ]:
+                path = "/models" if "Authorization" in headers else "/"
+
+                async def request():
+                    response = await client.get(path, headers=headers)
+                    response.raise_for_status()
+
+                print(
+                    json.dumps(await measure(name, request, args.requests // 10)),
+                    flush=True,
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
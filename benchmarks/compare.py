@@ -0,0 +1,55 @@
+"""
+Compares two result files written by `benchmarks.suite --output`.
+
+Prints one row per scenario with the baseline value, the candidate value and
+the relative change of throughput, latency, time to first token and CPU cost.
+
+Usage:
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+
+COLUMNS = [
+    ("rps", lambda r: r["requests_per_second"]),
+    ("p50 ms", lambda r: (r["latency_ms"] or {}).get("p50")),
+    ("p99 ms", lambda r: (r["latency_ms"] or {}).get("p99")),
+    ("ttft p50 ms", lambda r: (r["ttft_ms"] or {}).get("p50")),
+    ("cpu ms/req", lambda r: r["cpu_ms_per_request"]),
+    ("cpu us/token", lambda r: r["cpu_us_per_token"]),
+]
+
+
+def change(before, after) -> str:
+    if before is None or after is None:
+        return "-"
+    if not before:
+        return f"{after}"
+    return f"{before} -> {after} ({(after - before) / before * 100:+.1f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline, "r") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    with open(args.candidate, "r") as f:
+        candidate = {r["scenario"]: r for r in json.load(f)["results"]}
+
+    for scenario, after in candidate.items():
+        before = baseline.get(scenario)
+        if before is None:
+            continue
+
+        print(scenario)
+        for name, value in COLUMNS:
+            print(f"  {name:<14} {change(value(before), value(after))}")
+
+
+if __name__ == "__main__":
+    main()
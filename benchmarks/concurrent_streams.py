@@ -0,0 +1,116 @@
+"""
+Measures how many concurrent streaming completions the server sustains for
+sync generator pipes (threadpool) versus async generator pipes (event loop).
+
+Each stream emits BENCH_CHUNKS chunks BENCH_CHUNK_DELAY seconds apart, so an
+unconstrained server finishes every batch in roughly chunks * delay seconds.
+
+Usage:
+    python -m benchmarks.concurrent_streams --concurrency 10,40,100,200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+BENCHMARK_PIPELINES = os.path.join(os.path.dirname(__file__), "pipelines")
+MODES = {"sync": "sync_stream_pipeline", "async": "async_stream_pipeline"}
+
+
+def load_app(pipelines: list):
+    """Imports the server with a temporary PIPELINES_DIR holding the given benchmark pipelines."""
+    pipelines_dir = tempfile.mkdtemp(prefix="pipelines-bench-")
+    for name in pipelines:
+        shutil.copy(os.path.join(BENCHMARK_PIPELINES, f"{name}.py"), pipelines_dir)
+
+    os.environ["PIPELINES_DIR"] = pipelines_dir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import main
+
+    return main.app, pipelines_dir
+
+
+async def run_stream(client, model: str) -> float:
+    start = time.perf_counter()
+    async with client.stream(
+        "POST",
+        "/chat/completions",
+        json={
+            "model": model,
+            "stream": True,
+            "messages": [{"role": "user", "content": "benchmark"}],
+        },
+    ) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            pass
+    return time.perf_counter() - start
+
+
+async def run(args):
+    import httpx
+
+    app, pipelines_dir = load_app(list(MODES.values()))
+    results = []
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=None
+            ) as client:
+                for mode, model in MODES.items():
+                    for concurrency in args.concurrency:
+                        start = time.perf_counter()
+                        durations = await asyncio.gather(
+                            *[run_stream(client, model) for _ in range(concurrency)]
+                        )
+                        wall = time.perf_counter() - start
+                        ideal = args.chunks * args.delay
+
+                        results.append(
+                            {
+                                "mode": mode,
+                                "concurrency": concurrency,
+                                "wall_seconds": round(wall, 3),
+                                "streams_per_second": round(concurrency / wall, 2),
+                                "mean_stream_seconds": round(
+                                    sum(durations) / len(durations), 3
+                                ),
+                                # Streams that were effectively running at the same time
+                                "sustained_streams": round(concurrency * ideal / wall, 1),
+                            }
+                        )
+                        print(json.dumps(results[-1]), flush=True)
+    finally:
+        shutil.rmtree(pipelines_dir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[10, 40, 100, 200],
+    )
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ["BENCH_CHUNKS"] = str(args.chunks)
+    os.environ["BENCH_CHUNK_DELAY"] = str(args.delay)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
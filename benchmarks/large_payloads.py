@@ -0,0 +1,156 @@
+"""
+Measures request ingestion of large multimodal chat payloads: histories with
+base64 images adding up to about 10 MB.
+
+Compares the previous path (OpenAIChatCompletionForm validation, a
+`model_dump()` per message for `messages` and of the whole form for `body`,
+once in the endpoint and once when calling the pipe) with
+`parse_chat_request`, by latency and peak Python memory (tracemalloc), and
+reports the in-process latency of a whole non-streamed completion.
+
+Usage:
+    python -m benchmarks.large_payloads --size-mb 10 --images 5 --repeat 20
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+BENCHMARK_PIPELINES = os.path.join(os.path.dirname(__file__), "pipelines")
+MODEL = "sync_stream_pipeline"
+
+
+def build_payload(size_mb: float, images: int) -> bytes:
+    image_size = int(size_mb * 1024 * 1024 * 3 / 4 / images)
+    messages = []
+    for i in range(images):
+        image = base64.b64encode(os.urandom(image_size)).decode("ascii")
+        messages.append(
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": f"What is in image {i}?"},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/png;base64,{image}"},
+                    },
+                ],
+            }
+        )
+        messages.append({"role": "assistant", "content": f"Image {i} shows noise."})
+    messages.append({"role": "user", "content": "Compare them."})
+
+    return json.dumps({"model": MODEL, "stream": False, "messages": messages}).encode()
+
+
+def legacy_parse(raw: bytes):
+    from schemas import OpenAIChatCompletionForm
+
+    form_data = OpenAIChatCompletionForm.model_validate(json.loads(raw))
+    messages = [message.model_dump() for message in form_data.messages]
+    body = form_data.model_dump()
+    pipe_body = form_data.model_dump()
+    return messages, body, pipe_body
+
+
+def fast_parse(raw: bytes):
+    from utils.pipelines.request import parse_chat_request
+
+    form_data = parse_chat_request(raw)
+    return form_data.messages, form_data.body, form_data.body
+
+
+def measure(name, parse, raw: bytes, repeat: int):
+    # Imports and warms up outside of the measurements
+    parse(raw)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(raw)
+        timings.append(time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    result = parse(raw)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "path": name,
+        "payload_mb": round(len(raw) / 1024 / 1024, 2),
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "max_ms": round(max(timings) * 1000, 2),
+        "retained_mb": round(current / 1024 / 1024, 2),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+async def measure_request(raw: bytes, repeat: int):
+    import httpx
+
+    pipelines_dir = tempfile.mkdtemp(prefix="pipelines-bench-")
+    shutil.copy(os.path.join(BENCHMARK_PIPELINES, f"{MODEL}.py"), pipelines_dir)
+    os.environ["PIPELINES_DIR"] = pipelines_dir
+    os.environ["BENCH_CHUNKS"] = "1"
+    os.environ["BENCH_CHUNK_DELAY"] = "0"
+
+    from main import app
+
+    timings = []
+    repeat += 1
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://pipelines"
+            ) as client:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/chat/completions",
+                        content=raw,
+                        headers={"Content-Type": "application/json"},
+                    )
+                    response.raise_for_status()
+                    timings.append(time.perf_counter() - start)
+        timings = timings[1:]
+    finally:
+        shutil.rmtree(pipelines_dir, ignore_errors=True)
+
+    return {
+        "path": "POST /chat/completions",
+        "payload_mb": round(len(raw) / 1024 / 1024, 2),
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "max_ms": round(max(timings) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    raw = build_payload(args.size_mb, args.images)
+
+    for name, parse in [("pydantic + model_dump", legacy_parse), ("parse_chat_request", fast_parse)]:
+        print(json.dumps(measure(name, parse, raw, args.repeat)), flush=True)
+
+    print(json.dumps(asyncio.run(measure_request(raw, args.repeat))), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+title: Benchmark Async Stream Pipeline
+description: Synthetic async generator pipe that streams tokens at a fixed rate. Used by the benchmarks only.
+"""
+
+from typing import List, AsyncGenerator
+
+import asyncio
+import os
+
+
+class Pipeline:
+    def __init__(self):
+        self.name = "Benchmark Async Stream"
+        self.chunks = int(os.getenv("BENCH_CHUNKS", "20"))
+        self.chunk_delay = float(os.getenv("BENCH_CHUNK_DELAY", "0.05"))
+
+    async def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> AsyncGenerator:
+        for i in range(self.chunks):
+            await asyncio.sleep(self.chunk_delay)
+            yield f"token{i} "
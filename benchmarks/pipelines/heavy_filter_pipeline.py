@@ -0,0 +1,37 @@
+"""
+title: Benchmark Heavy Filter Pipeline
+description: Filter attached to every model that hashes the messages BENCH_FILTER_ROUNDS times, standing in for CPU-bound filters such as PII detection. Used by the benchmarks only.
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel
+
+import hashlib
+import json
+import os
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        pipelines: List[str] = ["*"]
+        priority: int = 1
+
+    def __init__(self):
+        self.type = "filter"
+        self.name = "Benchmark Heavy Filter"
+        self.valves = self.Valves()
+        self.rounds = int(os.getenv("BENCH_FILTER_ROUNDS", "2000"))
+
+    def work(self, body: dict) -> str:
+        digest = json.dumps(body.get("messages", [])).encode("utf-8")
+        for _ in range(self.rounds):
+            digest = hashlib.sha256(digest).digest()
+        return digest.hex()
+
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        self.work(body)
+        return body
+
+    async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        self.work(body)
+        return body
@@ -0,0 +1,24 @@
+"""
+title: Benchmark Light Filter Pipeline
+description: Filter attached to every model that returns the body unchanged. Used by the benchmarks only.
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        pipelines: List[str] = ["*"]
+        priority: int = 0
+
+    def __init__(self):
+        self.type = "filter"
+        self.name = "Benchmark Light Filter"
+        self.valves = self.Valves()
+
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        return body
+
+    async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        return body
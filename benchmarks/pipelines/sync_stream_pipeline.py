@@ -0,0 +1,23 @@
+"""
+title: Benchmark Sync Stream Pipeline
+description: Synthetic sync generator pipe that streams tokens at a fixed rate. Used by the benchmarks only.
+"""
+
+from typing import List, Union, Generator, Iterator
+
+import os
+import time
+
+
+class Pipeline:
+    def __init__(self):
+        self.name = "Benchmark Sync Stream"
+        self.chunks = int(os.getenv("BENCH_CHUNKS", "20"))
+        self.chunk_delay = float(os.getenv("BENCH_CHUNK_DELAY", "0.05"))
+
+    def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[str, Generator, Iterator]:
+        for i in range(self.chunks):
+            time.sleep(self.chunk_delay)
+            yield f"token{i} "
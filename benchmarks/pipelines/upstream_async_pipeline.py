@@ -0,0 +1,49 @@
+"""
+title: Benchmark Upstream Async Pipeline
+description: Async generator pipe proxying the benchmark stub upstream with `aiohttp`. Used by the benchmarks only.
+"""
+
+from typing import List, Union, AsyncGenerator
+
+import aiohttp
+import os
+
+
+class Pipeline:
+    def __init__(self):
+        self.name = "Benchmark Upstream Async"
+        self.upstream_url = os.getenv("BENCH_UPSTREAM_URL", "http://127.0.0.1:9199/v1")
+        self.session = None
+
+    async def on_startup(self):
+        self.session = aiohttp.ClientSession()
+
+    async def on_shutdown(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[dict, AsyncGenerator]:
+        payload = {**body, "model": "bench-small"}
+        for key in ("user", "chat_id", "title"):
+            payload.pop(key, None)
+
+        if body["stream"]:
+            return self.stream(payload)
+
+        async with self.session.post(
+            f"{self.upstream_url}/chat/completions", json=payload
+        ) as r:
+            r.raise_for_status()
+            return await r.json()
+
+    async def stream(self, payload: dict) -> AsyncGenerator:
+        async with self.session.post(
+            f"{self.upstream_url}/chat/completions", json=payload
+        ) as r:
+            r.raise_for_status()
+            async for line in r.content:
+                line = line.strip()
+                if line:
+                    yield line.decode("utf-8")
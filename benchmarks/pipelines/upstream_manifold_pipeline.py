@@ -0,0 +1,55 @@
+"""
+title: Benchmark Upstream Manifold Pipeline
+description: Async manifold exposing the models of the benchmark stub upstream. Used by the benchmarks only.
+"""
+
+from typing import List, Union, AsyncGenerator
+
+import aiohttp
+import os
+
+
+class Pipeline:
+    def __init__(self):
+        self.type = "manifold"
+        self.name = "Benchmark: "
+        self.upstream_url = os.getenv("BENCH_UPSTREAM_URL", "http://127.0.0.1:9199/v1")
+        self.pipelines = [
+            {"id": "bench-small", "name": "Small"},
+            {"id": "bench-medium", "name": "Medium"},
+            {"id": "bench-large", "name": "Large"},
+        ]
+        self.session = None
+
+    async def on_startup(self):
+        self.session = aiohttp.ClientSession()
+
+    async def on_shutdown(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[dict, AsyncGenerator]:
+        payload = {**body, "model": model_id}
+        for key in ("user", "chat_id", "title"):
+            payload.pop(key, None)
+
+        if body["stream"]:
+            return self.stream(payload)
+
+        async with self.session.post(
+            f"{self.upstream_url}/chat/completions", json=payload
+        ) as r:
+            r.raise_for_status()
+            return await r.json()
+
+    async def stream(self, payload: dict) -> AsyncGenerator:
+        async with self.session.post(
+            f"{self.upstream_url}/chat/completions", json=payload
+        ) as r:
+            r.raise_for_status()
+            async for line in r.content:
+                line = line.strip()
+                if line:
+                    yield line.decode("utf-8")
@@ -0,0 +1,33 @@
+"""
+title: Benchmark Upstream Sync Pipeline
+description: Sync generator pipe proxying the benchmark stub upstream with `requests`, like the OpenAI example pipelines. Used by the benchmarks only.
+"""
+
+from typing import List, Union, Generator, Iterator
+
+import os
+import requests
+
+
+class Pipeline:
+    def __init__(self):
+        self.name = "Benchmark Upstream Sync"
+        self.upstream_url = os.getenv("BENCH_UPSTREAM_URL", "http://127.0.0.1:9199/v1")
+
+    def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[str, Generator, Iterator]:
+        payload = {**body, "model": "bench-small"}
+        for key in ("user", "chat_id", "title"):
+            payload.pop(key, None)
+
+        r = requests.post(
+            url=f"{self.upstream_url}/chat/completions",
+            json=payload,
+            stream=True,
+        )
+        r.raise_for_status()
+
+        if body["stream"]:
+            return (line for line in r.iter_lines() if line)
+        return r.json()
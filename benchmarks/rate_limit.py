@@ -0,0 +1,136 @@
+"""
+Benchmark of the rate limit filter with many simulated users.
+
+Replays requests from a large user population over simulated time against the
+previous per-user timestamp lists and the fixed-size sliding-window counters
+of `MemoryStore`, and reports the time per request and the Python memory held
+by the limiter at the end, including after every user has gone idle.
+
+Usage:
+    python -m benchmarks.rate_limit --users 100000 --requests 1000000
+"""
+
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILTER = os.path.join(ROOT, "examples", "filters", "rate_limit_filter_pipeline.py")
+
+# The defaults of the filter: 10 per minute, 1000 per hour and 100 per 15 minutes
+LIMITS = [(10, 60), (1000, 3600), (100, 15 * 60)]
+
+
+class TimestampLists:
+    """The previous implementation: a list of request timestamps per user."""
+
+    def __init__(self):
+        self.user_requests = {}
+
+    async def acquire(self, user_id: str, now: float) -> bool:
+        if user_id in self.user_requests:
+            self.user_requests[user_id] = [
+                req
+                for req in self.user_requests[user_id]
+                if any(now - req < window for _, window in LIMITS)
+            ]
+        user_reqs = self.user_requests.get(user_id, [])
+        for limit, window in LIMITS:
+            if sum(1 for req in user_reqs if now - req < window) >= limit:
+                return False
+        self.user_requests.setdefault(user_id, []).append(now)
+        return True
+
+
+class Counters:
+    """The filter's MemoryStore, on simulated time."""
+
+    def __init__(self, module):
+        self.now = 0.0
+        self.store = module.MemoryStore(clock=lambda: self.now)
+
+    async def acquire(self, user_id: str, now: float) -> bool:
+        self.now = now
+        return await self.store.acquire(user_id, LIMITS)
+
+
+def load_filter():
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("rate_limit_filter_pipeline", FILTER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def replay(limiter, requests, seconds) -> int:
+    allowed = 0
+    for i, user_id in enumerate(requests):
+        if await limiter.acquire(user_id, 1_000_000 + i * seconds / len(requests)):
+            allowed += 1
+    return allowed
+
+
+async def measure(name, create, requests, seconds):
+    start = time.perf_counter()
+    allowed = await replay(create(), requests, seconds)
+    wall = time.perf_counter() - start
+
+    # Memory is measured on a second run, as tracing slows every allocation down
+    gc.collect()
+    tracemalloc.start()
+    limiter = create()
+    await replay(limiter, requests, seconds)
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+
+    # One more request after everyone has been idle for a day
+    await limiter.acquire("late_user", 1_000_000 + seconds + 86400)
+    gc.collect()
+    idle, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "limiter": name,
+        "requests": len(requests),
+        "allowed": allowed,
+        "us_per_request": round(wall / len(requests) * 1e6, 2),
+        "held_mb": round(held / 1024 / 1024, 2),
+        "held_after_idle_mb": round(idle / 1024 / 1024, 2),
+    }
+
+
+async def run(args):
+    module = load_filter()
+
+    rng = random.Random(0)
+    # Skewed activity: a few heavy users and a long tail
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(args.users)]
+    requests = [f"user-{i}" for i in rng.choices(range(args.users), weights, k=args.requests)]
+
+    for name, create in [
+        ("timestamp lists", TimestampLists),
+        ("MemoryStore", lambda: Counters(module)),
+    ]:
+        print(json.dumps(await measure(name, create, requests, args.seconds)), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=1000000)
+    parser.add_argument("--seconds", type=float, default=3600, help="simulated duration")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Microbenchmark of SSE chunk encoding throughput (chunks/sec on one core).
+
+Compares the per-token `stream_message_template` + `json.dumps` path with
+`StreamEncoder`, with and without coalescing.
+
+Usage:
+    python -m benchmarks.sse_encoder --chunks 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pipelines.main import stream_message_template
+from utils.pipelines.stream import StreamEncoder
+
+
+MODEL = "benchmark_manifold.gpt-4o"
+
+
+def template_encode(tokens):
+    for token in tokens:
+        line = stream_message_template(MODEL, token)
+        yield f"data: {json.dumps(line)}\n\n"
+
+
+def encoder_encode(tokens, **kwargs):
+    encoder = StreamEncoder(MODEL, **kwargs)
+    for token in tokens:
+        chunk = encoder.encode(token)
+        if chunk:
+            yield chunk
+    yield encoder.finish()
+
+
+def measure(name, encode, tokens):
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    frames = 0
+    size = 0
+    for frame in encode(tokens):
+        frames += 1
+        size += len(frame)
+    cpu = time.process_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+
+    return {
+        "encoder": name,
+        "chunks": len(tokens),
+        "frames": frames,
+        "bytes": size,
+        "cpu_seconds": round(cpu, 4),
+        "chunks_per_cpu_second": round(len(tokens) / cpu) if cpu else None,
+        "wall_seconds": round(wall, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=200000)
+    args = parser.parse_args()
+
+    tokens = [f" tok{i % 97}" for i in range(args.chunks)]
+
+    for name, encode in [
+        ("stream_message_template", template_encode),
+        ("StreamEncoder", encoder_encode),
+        (
+            "StreamEncoder(coalesce_bytes=64)",
+            lambda t: encoder_encode(t, coalesce_bytes=64),
+        ),
+    ]:
+        print(json.dumps(measure(name, encode, tokens)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Load-test suite for the server against a local OpenAI-compatible stub upstream.
+
+Starts the stub upstream (benchmarks.upstream) in this process and the server
+with uvicorn in a subprocess, serving synthetic pipelines: a sync generator
+pipe, an async pipe and a manifold proxying the stub, plus a light and a heavy
+filter attached to every model. Each scenario is run with a fixed number of
+requests at a fixed concurrency and reports requests/sec, p50/p90/p99 latency,
+time to first token for streams, and the server's CPU time per request and
+per token (Linux only, read from /proc).
+
+Tokens are the SSE data frames received for streams and the upstream's
+completion tokens for non-streamed responses.
+
+Usage:
+    python -m benchmarks.suite --requests 200 --concurrency 20 --output results.json
+    python -m benchmarks.suite --scenarios chat-stream --tokens 100 --rate 500
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import List, Optional
+
+from benchmarks.upstream import start_upstream
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_PIPELINES = os.path.join(os.path.dirname(__file__), "pipelines")
+PIPELINES = [
+    "upstream_sync_pipeline",
+    "upstream_async_pipeline",
+    "upstream_manifold_pipeline",
+    "light_filter_pipeline",
+    "heavy_filter_pipeline",
+]
+CHAT_MODELS = {
+    "sync": "upstream_sync_pipeline",
+    "async": "upstream_async_pipeline",
+    "manifold": "upstream_manifold_pipeline.bench-small",
+}
+MESSAGES = [
+    {"role": "system", "content": "You are a benchmark."},
+    {"role": "user", "content": "Count to fifty."},
+]
+
+
+def scenarios() -> List[dict]:
+    result = [{"name": "models", "method": "GET", "path": "/models"}]
+
+    for stream in (True, False):
+        for kind, model in CHAT_MODELS.items():
+            result.append(
+                {
+                    "name": f"chat-{'stream' if stream else 'json'}-{kind}",
+                    "method": "POST",
+                    "path": "/chat/completions",
+                    "stream": stream,
+                    "json": {"model": model, "stream": stream, "messages": MESSAGES},
+                }
+            )
+
+    filter_form = {
+        "body": {"model": CHAT_MODELS["async"], "messages": MESSAGES},
+        "user": {"id": "benchmark", "role": "user"},
+    }
+    for name in ("light", "heavy"):
+        result.append(
+            {
+                "name": f"filter-inlet-{name}",
+                "method": "POST",
+                "path": f"/{name}_filter_pipeline/filter/inlet",
+                "json": filter_form,
+            }
+        )
+    result.append(
+        {
+            "name": "filter-chain-inlet",
+            "method": "POST",
+            "path": "/filters/inlet",
+            "json": filter_form,
+        }
+    )
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time of a process, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # Fields after the parenthesized command name, utime and stime are 14 and 15
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: List[float]) -> Optional[dict]:
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50) * 1000, 3),
+        "p90": round(percentile(values, 90) * 1000, 3),
+        "p99": round(percentile(values, 99) * 1000, 3),
+        "mean": round(sum(values) / len(values) * 1000, 3),
+    }
+
+
+async def start_server(pipelines_dir: str, upstream_url: str, log_path: str):
+    port = free_port()
+    env = {
+        **os.environ,
+        "PIPELINES_DIR": pipelines_dir,
+        "BENCH_UPSTREAM_URL": upstream_url,
+    }
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_ready(client, process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("Server did not become ready")
+
+
+async def measure(client, scenario: dict, default_tokens: int) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+
+    if scenario.get("stream"):
+        async with client.stream(
+            scenario["method"], scenario["path"], json=scenario.get("json")
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:") or line == "data: [DONE]":
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += 1
+    else:
+        response = await client.request(
+            scenario["method"], scenario["path"], json=scenario.get("json")
+        )
+        response.raise_for_status()
+        if scenario["path"] == "/chat/completions":
+            usage = response.json().get("usage") or {}
+            tokens = usage.get("completion_tokens", default_tokens)
+
+    return {"latency": time.perf_counter() - start, "ttft": ttft, "tokens": tokens}
+
+
+async def run_scenario(client, pid: int, scenario: dict, args) -> dict:
+    for _ in range(args.warmup):
+        await measure(client, scenario, args.tokens)
+
+    remaining = args.requests
+    samples = []
+    errors = 0
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                samples.append(await measure(client, scenario, args.tokens))
+            except Exception:
+                errors += 1
+
+    cpu_start = process_cpu_seconds(pid)
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    wall = time.perf_counter() - start
+    cpu_end = process_cpu_seconds(pid)
+
+    tokens = sum(sample["tokens"] for sample in samples)
+    cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+
+    return {
+        "scenario": scenario["name"],
+        "method": scenario["method"],
+        "path": scenario["path"],
+        "stream": bool(scenario.get("stream")),
+        "concurrency": args.concurrency,
+        "requests": len(samples),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(samples) / wall, 2),
+        "latency_ms": summarize([sample["latency"] for sample in samples]),
+        "ttft_ms": summarize(
+            [sample["ttft"] for sample in samples if sample["ttft"] is not None]
+        ),
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / wall, 2) if tokens else None,
+        "server_cpu_seconds": round(cpu, 3) if cpu is not None else None,
+        "cpu_ms_per_request": (
+            round(cpu / len(samples) * 1000, 4) if cpu is not None and samples else None
+        ),
+        "cpu_us_per_token": (
+            round(cpu / tokens * 1_000_000, 2) if cpu is not None and tokens else None
+        ),
+    }
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k != "output"},
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+
+    selected = [
+        scenario
+        for scenario in scenarios()
+        if not args.scenarios
+        or any(scenario["name"].startswith(prefix) for prefix in args.scenarios)
+    ]
+
+    pipelines_dir = tempfile.mkdtemp(prefix="pipelines-bench-")
+    for name in PIPELINES:
+        shutil.copy(os.path.join(BENCHMARK_PIPELINES, f"{name}.py"), pipelines_dir)
+    log_path = os.path.join(pipelines_dir, "server.log")
+
+    runner, upstream_url = await start_upstream(tokens=args.tokens, rate=args.rate)
+    process, server_url = await start_server(pipelines_dir, upstream_url, log_path)
+
+    results = []
+    try:
+        async with httpx.AsyncClient(
+            base_url=server_url,
+            headers={"Authorization": f"Bearer {args.api_key}"},
+            timeout=None,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        ) as client:
+            await wait_until_ready(client, process)
+
+            for scenario in selected:
+                result = await run_scenario(client, process.pid, scenario, args)
+                results.append(result)
+                print(json.dumps(result), flush=True)
+    except Exception:
+        with open(log_path, "r") as f:
+            print(f.read()[-4000:], file=sys.stderr)
+        raise
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await runner.cleanup()
+        shutil.rmtree(pipelines_dir, ignore_errors=True)
+
+    return {"meta": metadata(args), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per completion")
+    parser.add_argument(
+        "--rate", type=float, default=500, help="upstream tokens per second per stream"
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=None,
+        help="comma-separated scenario name prefixes, e.g. chat-stream,filter",
+    )
+    parser.add_argument(
+        "--api-key", default=os.getenv("PIPELINES_API_KEY", "0p3n-w3bu!")
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+OpenAI-compatible stub upstream that streams synthetic tokens at a fixed rate.
+
+Serves `GET /v1/models` and `POST /v1/chat/completions` (streaming and
+non-streaming). Each completion produces `max_tokens` tokens (default
+--tokens), one every 1/--rate seconds.
+
+Usage:
+    python -m benchmarks.upstream --port 9199 --tokens 50 --rate 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from aiohttp import web
+
+
+MODELS = ["bench-small", "bench-medium", "bench-large"]
+
+
+def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> bytes:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}
+        ],
+    }
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def create_app(tokens: int = 50, rate: float = 200) -> web.Application:
+    interval = 1 / rate if rate > 0 else 0
+
+    async def models(request: web.Request):
+        return web.json_response(
+            {"object": "list", "data": [{"id": model, "object": "model"} for model in MODELS]}
+        )
+
+    async def chat_completions(request: web.Request):
+        body = await request.json()
+        model = body.get("model", MODELS[0])
+        count = int(body.get("max_tokens") or tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4()}"
+
+        if not body.get("stream", False):
+            await asyncio.sleep(interval * count)
+            return web.json_response(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": "".join(f"tok{i} " for i in range(count)),
+                            },
+                            "logprobs": None,
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"completion_tokens": count},
+                }
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(count):
+            if interval:
+                await asyncio.sleep(interval)
+            await response.write(chunk(completion_id, model, {"content": f"tok{i} "}))
+        await response.write(chunk(completion_id, model, {}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/v1/models", models)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start_upstream(host: str = "127.0.0.1", port: int = 0, tokens: int = 50, rate: float = 200):
+    """Starts the stub on the running event loop and returns the runner and its base URL."""
+    runner = web.AppRunner(create_app(tokens, rate), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9199)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=200, help="tokens per second")
+    args = parser.parse_args()
+
+    web.run_app(
+        create_app(args.tokens, args.rate), host=args.host, port=args.port, access_log=None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import json
 
 ####################################
 # Load .env file
@@ -13,3 +14,112 @@ except ImportError:
 
 API_KEY = os.getenv("PIPELINES_API_KEY", "0p3n-w3bu!")
 PIPELINES_DIR = os.getenv("PIPELINES_DIR", "./pipelines")
+
+# Additional API keys and their scopes ("admin" or "inference"), as plain keys or SHA-256
+# digests, e.g. '{"sk-app": "inference", "sha256:9f86d0...": ["admin"]}'; API_KEY is admin
+API_KEYS = json.loads(os.getenv("PIPELINES_API_KEYS", "{}"))
+
+# Seconds a manifold's `pipelines()` result is cached before being refreshed in the background
+MANIFOLD_PIPELINES_TTL = float(os.getenv("PIPELINES_MANIFOLD_TTL", "300"))
+
+# Default number of concurrent requests per pipeline (0 means unlimited), overridable per
+# pipeline or manifold model with a JSON mapping, e.g. '{"my_manifold.gpt-4o": 2}'. Limits
+# and queues apply per worker process.
+CONCURRENCY_LIMIT = int(os.getenv("PIPELINES_CONCURRENCY_LIMIT", "0"))
+CONCURRENCY_LIMITS = json.loads(os.getenv("PIPELINES_CONCURRENCY_LIMITS", "{}"))
+
+# Requests over the limit wait in a bounded FIFO queue before being rejected with a 429
+MAX_QUEUE_SIZE = int(os.getenv("PIPELINES_MAX_QUEUE_SIZE", "100"))
+MAX_QUEUE_WAIT = float(os.getenv("PIPELINES_MAX_QUEUE_WAIT", "30"))
+
+# Optionally coalesce streamed tokens into one SSE frame per time (ms) or size (chars) window
+STREAM_COALESCE_MS = float(os.getenv("PIPELINES_STREAM_COALESCE_MS", "0"))
+STREAM_COALESCE_BYTES = int(os.getenv("PIPELINES_STREAM_COALESCE_BYTES", "0"))
+
+# Watch PIPELINES_DIR and reload only the pipeline files that changed
+PIPELINES_WATCH = os.getenv("PIPELINES_WATCH", "false").lower() == "true"
+PIPELINES_WATCH_INTERVAL = float(os.getenv("PIPELINES_WATCH_INTERVAL", "2"))
+
+# Pipelines are imported in parallel and their on_startup hooks are time-boxed; hooks that
+# run longer continue in the background and /ready reports 503 until they finish
+PIPELINES_STARTUP_WORKERS = int(os.getenv("PIPELINES_STARTUP_WORKERS", "8"))
+PIPELINES_STARTUP_TIMEOUT = float(os.getenv("PIPELINES_STARTUP_TIMEOUT", "60"))
+
+# Marker cache of frontmatter requirement sets that have already been installed
+PIPELINES_REQUIREMENTS_CACHE = os.getenv(
+    "PIPELINES_REQUIREMENTS_CACHE", os.path.join(PIPELINES_DIR, ".requirements.json")
+)
+
+# Register pipelines from static metadata and only import them on first use or warm-up
+PIPELINES_LAZY_LOAD = os.getenv("PIPELINES_LAZY_LOAD", "false").lower() == "true"
+PIPELINES_MANIFEST = os.getenv(
+    "PIPELINES_MANIFEST", os.path.join(PIPELINES_DIR, ".manifest.json")
+)
+
+# Keep valves and pipelines consistent across uvicorn workers through a shared state directory
+PIPELINES_WORKERS = int(os.getenv("PIPELINES_WORKERS", "1"))
+PIPELINES_SYNC = (
+    os.getenv("PIPELINES_SYNC", str(PIPELINES_WORKERS > 1)).lower() == "true"
+)
+PIPELINES_SYNC_INTERVAL = float(os.getenv("PIPELINES_SYNC_INTERVAL", "0.5"))
+PIPELINES_STATE_DIR = os.getenv(
+    "PIPELINES_STATE_DIR", os.path.join(PIPELINES_DIR, ".state")
+)
+
+# Opt-in cache of chat completion responses for pipelines that declare themselves `cacheable`,
+# kept in memory (LRU) and optionally persisted to PIPELINES_CACHE_DIR
+PIPELINES_CACHE = os.getenv("PIPELINES_CACHE", "false").lower() == "true"
+PIPELINES_CACHE_SIZE = int(os.getenv("PIPELINES_CACHE_SIZE", "1024"))
+PIPELINES_CACHE_TTL = float(os.getenv("PIPELINES_CACHE_TTL", "3600"))
+PIPELINES_CACHE_DIR = os.getenv("PIPELINES_CACHE_DIR", "")
+
+# Content-addressed cache of the images in chat messages shared by provider pipelines (see
+# utils.pipelines.assets), bounded in memory and optionally persisted to PIPELINES_ASSET_CACHE_DIR
+PIPELINES_ASSET_CACHE_SIZE = int(os.getenv("PIPELINES_ASSET_CACHE_SIZE", str(256 * 1024 * 1024)))
+PIPELINES_ASSET_CACHE_DIR = os.getenv("PIPELINES_ASSET_CACHE_DIR", "")
+PIPELINES_ASSET_CACHE_DISK_SIZE = int(
+    os.getenv("PIPELINES_ASSET_CACHE_DISK_SIZE", str(1024 * 1024 * 1024))
+)
+PIPELINES_ASSET_MAX_SIZE = int(os.getenv("PIPELINES_ASSET_MAX_SIZE", str(20 * 1024 * 1024)))
+PIPELINES_ASSET_FETCH_CONCURRENCY = int(os.getenv("PIPELINES_ASSET_FETCH_CONCURRENCY", "8"))
+
+# Let identical concurrent chat completions from the same user share one pipe call
+PIPELINES_SINGLE_FLIGHT = os.getenv("PIPELINES_SINGLE_FLIGHT", "false").lower() == "true"
+
+# Log level of the server, per-pipeline levels as JSON (e.g. '{"my_manifold": "DEBUG"}'), the
+# fraction of per-chunk debug records kept, and the level `print` output is logged at (empty
+# leaves stdout alone)
+PIPELINES_LOG_LEVEL = os.getenv("PIPELINES_LOG_LEVEL", "WARNING")
+PIPELINES_LOG_LEVELS = json.loads(os.getenv("PIPELINES_LOG_LEVELS", "{}"))
+PIPELINES_LOG_CHUNK_SAMPLE = float(os.getenv("PIPELINES_LOG_CHUNK_SAMPLE", "0.01"))
+PIPELINES_PRINT_LEVEL = os.getenv("PIPELINES_PRINT_LEVEL", "")
+
+# Seconds a chat completion may take (0 disables it); clients can shorten it with the
+# X-Request-Timeout header or a `request_timeout` body field. Streams are also ended when the
+# first chunk or the next chunk takes longer than the TTFT or idle timeout (0 disables them).
+# All three can be overridden per pipeline with `request_timeout`, `ttft_timeout` and
+# `idle_timeout` attributes or valves.
+PIPELINES_REQUEST_TIMEOUT = float(os.getenv("PIPELINES_REQUEST_TIMEOUT", "900"))
+PIPELINES_TTFT_TIMEOUT = float(os.getenv("PIPELINES_TTFT_TIMEOUT", "0"))
+PIPELINES_IDLE_TIMEOUT = float(os.getenv("PIPELINES_IDLE_TIMEOUT", "0"))
+
+# Offline batches uploaded to POST /batches are kept here and run with this many concurrent
+# requests per pipeline unless the batch sets its own limits
+PIPELINES_BATCH_DIR = os.getenv(
+    "PIPELINES_BATCH_DIR", os.path.join(PIPELINES_DIR, ".batches")
+)
+PIPELINES_BATCH_CONCURRENCY = int(os.getenv("PIPELINES_BATCH_CONCURRENCY", "4"))
+
+# Valves of every pipeline are stored in one SQLite database, keeping this many versions of
+# each for rollback; existing {PIPELINES_DIR}/{module}/valves.json files are migrated on load
+PIPELINES_VALVES_DB = os.getenv(
+    "PIPELINES_VALVES_DB", os.path.join(PIPELINES_DIR, ".valves.db")
+)
+PIPELINES_VALVES_HISTORY = int(os.getenv("PIPELINES_VALVES_HISTORY", "50"))
+
+# Pipeline files installed from URLs are limited to this many bytes, and bulk installs fetch
+# this many URLs at a time
+PIPELINES_MAX_DOWNLOAD_SIZE = int(
+    os.getenv("PIPELINES_MAX_DOWNLOAD_SIZE", str(10 * 1024 * 1024))
+)
+PIPELINES_DOWNLOAD_CONCURRENCY = int(os.getenv("PIPELINES_DOWNLOAD_CONCURRENCY", "8"))
@@ -0,0 +1,177 @@
+"""
+title: Context Window Filter Pipeline
+author: open-webui
+date: 2024-10-18
+version: 1.0
+license: MIT
+description: Trims the conversation history to a per-model token budget, keeping system messages and the latest turns.
+requirements: tiktoken
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        # List target pipeline ids (models) that this filter will be connected to.
+        # If you want to connect this filter to all pipelines, you can set pipelines to ["*"]
+        pipelines: List[str] = []
+
+        # Assign a priority level to the filter pipeline.
+        # The priority level determines the order in which the filter pipelines are executed.
+        # The lower the number, the higher the priority.
+        priority: int = 0
+
+        # Token budget of the messages sent to a model, by model id (with or without the
+        # manifold prefix), and for every other model
+        max_tokens_per_model: Dict[str, int] = {}
+        max_tokens: int = 8192
+
+        # tiktoken encoding used for models tiktoken does not know
+        encoding: str = "cl100k_base"
+
+        # Estimated tokens of an image part
+        image_tokens: int = 1000
+
+    def __init__(self):
+        # Pipeline filters are only compatible with Open WebUI
+        # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
+        self.type = "filter"
+
+        # Optionally, you can set the id and name of the pipeline.
+        # Best practice is to not specify the id so that it can be automatically inferred from the filename, so that users can install multiple versions of the same pipeline.
+        # The identifier must be unique across all pipelines.
+        # The identifier must be an alphanumeric string that can include underscores or hyphens. It cannot contain spaces, special characters, slashes, or backslashes.
+        # self.id = "context_window_filter_pipeline"
+        self.name = "Context Window Filter"
+
+        self.valves = self.Valves(
+            **{
+                "pipelines": os.getenv("CONTEXT_WINDOW_PIPELINES", "*").split(","),
+                "max_tokens": int(os.getenv("CONTEXT_WINDOW_MAX_TOKENS", "8192")),
+            }
+        )
+
+        # Token counts by message hash, so each turn only tokenizes its new messages
+        self.token_counts = OrderedDict()
+        self.max_token_counts = 10000
+        self.encodings = {}
+
+    async def on_startup(self):
+        # This function is called when the server is started.
+        print(f"on_startup:{__name__}")
+        pass
+
+    async def on_shutdown(self):
+        # This function is called when the server is stopped.
+        print(f"on_shutdown:{__name__}")
+        pass
+
+    async def on_valves_updated(self):
+        self.token_counts.clear()
+        self.encodings.clear()
+
+    def get_encoding(self, model: str):
+        """The tiktoken encoding of a model, or None to estimate four characters per token."""
+        model = model.split(".", 1)[-1]
+        if model not in self.encodings:
+            try:
+                import tiktoken
+
+                try:
+                    self.encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    self.encodings[model] = tiktoken.get_encoding(self.valves.encoding)
+            except ImportError:
+                print("tiktoken not installed, estimating token counts")
+                self.encodings[model] = None
+            except Exception as e:
+                # tiktoken downloads encodings on first use, which fails when offline
+                print(f"Failed to load the tiktoken encoding of {model}, estimating token counts: {e}")
+                self.encodings[model] = None
+        return self.encodings[model]
+
+    def get_budget(self, model: str) -> int:
+        budgets = self.valves.max_tokens_per_model
+        if model in budgets:
+            return budgets[model]
+        return budgets.get(model.split(".", 1)[-1], self.valves.max_tokens)
+
+    def count_tokens(self, message: dict, encoding) -> int:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            texts = [part.get("text", "") for part in content if part.get("type") == "text"]
+            images = sum(1 for part in content if part.get("type") == "image_url")
+        else:
+            texts = [str(content or "")]
+            images = len(message.get("images") or [])
+
+        # Images are estimated, so only the text needs to be part of the key
+        key = hashlib.sha256(
+            "\0".join(
+                [encoding.name if encoding else "", message.get("role", ""), str(images), *texts]
+            ).encode("utf-8")
+        ).hexdigest()
+
+        count = self.token_counts.get(key)
+        if count is not None:
+            self.token_counts.move_to_end(key)
+            return count
+
+        if encoding is not None:
+            tokens = sum(len(encoding.encode(text, disallowed_special=())) for text in texts)
+        else:
+            tokens = sum(len(text) // 4 + 1 for text in texts)
+        # Every message also costs a few tokens of role and separators
+        count = tokens + images * self.valves.image_tokens + 4
+
+        self.token_counts[key] = count
+        while len(self.token_counts) > self.max_token_counts:
+            self.token_counts.popitem(last=False)
+        return count
+
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        print(f"inlet:{__name__}")
+
+        messages = body.get("messages", [])
+        model = body.get("model", "")
+        encoding = self.get_encoding(model)
+        budget = self.get_budget(model)
+
+        counts = [self.count_tokens(message, encoding) for message in messages]
+        total = sum(counts)
+        if total <= budget:
+            return body
+
+        # System messages and the latest message are always kept, then as many of the latest
+        # turns as fit in what is left
+        keep = [message.get("role") == "system" for message in messages]
+        keep[-1] = True
+        remaining = budget - sum(count for count, kept in zip(counts, keep) if kept)
+        for index in range(len(messages) - 2, -1, -1):
+            if keep[index]:
+                continue
+            if counts[index] > remaining:
+                break
+            keep[index] = True
+            remaining -= counts[index]
+
+        # The window starts with a user message, not with an answer to a dropped one
+        for index, message in enumerate(messages):
+            if not keep[index] or message.get("role") == "system":
+                continue
+            if message.get("role") == "user" or index == len(messages) - 1:
+                break
+            keep[index] = False
+
+        body["messages"] = [message for message, kept in zip(messages, keep) if kept]
+        print(
+            f"Trimmed {len(messages) - len(body['messages'])} of {len(messages)} messages "
+            f"({total} tokens) to fit {budget} tokens for {model}"
+        )
+        return body
@@ -8,11 +8,13 @@ description: A pipeline for dynamically processing images when current model is
 requirements: pydantic, aiohttp
 """
 
+from collections import OrderedDict
 from typing import List, Optional
 from pydantic import BaseModel
+import hashlib
 import json
 import aiohttp
-from utils.pipelines.main import get_last_user_message
+from utils.pipelines.assets import asset_key
 
 class Pipeline:
     class Valves(BaseModel):
@@ -30,6 +32,10 @@ class Pipeline:
                 "pipelines": ["*"],  # Connect to all pipelines
             }
         )
+        # Vision model output per image message, keyed by the content hashes of its images,
+        # so images in the history are only sent to the vision model once
+        self.descriptions = OrderedDict()
+        self.max_descriptions = 256
 
     async def on_startup(self):
         print(f"on_startup:{__name__}")
@@ -67,25 +73,36 @@ class Pipeline:
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"pipe:{__name__}")
 
-        images = []
-
         # Ensure the body is a dictionary
         if isinstance(body, str):
             body = json.loads(body)
         
         model = body.get("model", "")
 
-        # Get the content of the most recent message
-        user_message = get_last_user_message(body["messages"])
-
         if model in self.valves.model_to_override:
             messages = body.get("messages", [])
             for message in messages:
                 if "images" in message:
-                    images.extend(message["images"])
-                    raw_llava_response = await self.process_images_with_llava(images, user_message, self.valves.vision_model,self.valves.ollama_base_url)
+                    images = message["images"]
+                    key = self.description_key(images, message.get("content", ""))
+                    raw_llava_response = self.descriptions.get(key)
+                    if raw_llava_response is None:
+                        raw_llava_response = await self.process_images_with_llava(images, message.get("content", ""), self.valves.vision_model,self.valves.ollama_base_url)
+                        if raw_llava_response:
+                            self.remember_description(key, raw_llava_response)
+                    else:
+                        self.descriptions.move_to_end(key)
                     llava_response = f"REPEAT THIS BACK: {raw_llava_response}"
                     message["content"] = llava_response
                     message.pop("images", None)  # This will safely remove the 'images' key if it exists
         
         return body
+
+    def description_key(self, images: List[str], content: str) -> str:
+        parts = [self.valves.vision_model, str(content), *[asset_key(image) for image in images]]
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def remember_description(self, key: str, description: str):
+        self.descriptions[key] = description
+        while len(self.descriptions) > self.max_descriptions:
+            self.descriptions.popitem(last=False)
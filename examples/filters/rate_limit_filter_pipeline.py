@@ -1,10 +1,137 @@
 import os
-from typing import List, Optional
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
-from schemas import OpenAIChatMessage
+import math
 import time
 
 
+# A limit of `limit` requests per `window` seconds
+Limit = Tuple[int, float]
+
+
+def sliding_window(state: array, offset: int, limit: Limit, now: float) -> float:
+    """
+    Advances the sliding-window counter at `offset` in `state` (window index,
+    previous window count, current window count) to `now` and returns the
+    estimated number of requests in the last `window` seconds: the current
+    window's count plus the previous one's, weighted by how much of it still
+    overlaps.
+    """
+    _, window = limit
+    index = math.floor(now / window)
+    if index == state[offset] + 1:
+        state[offset + 1], state[offset + 2] = state[offset + 2], 0
+    elif index != state[offset]:
+        state[offset + 1], state[offset + 2] = 0, 0
+    state[offset] = index
+
+    overlap = 1 - (now / window - index)
+    return state[offset + 1] * overlap + state[offset + 2]
+
+
+class MemoryStore:
+    """
+    Rate limit counters of one process: one array of floats per user (the
+    time of its last request, then three per limit), evicted once the user
+    has been idle for long enough that every counter would be back to zero.
+    Also serves as an in-process stand-in for RedisStore in tests.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        # user_id -> counters, least recently active first
+        self.users: "OrderedDict[str, array]" = OrderedDict()
+
+    async def acquire(self, user_id: str, limits: List[Limit]) -> bool:
+        """Counts a request of the user and returns True, or False if a limit is exceeded."""
+        now = self.clock()
+        self.evict(now, 2 * max(window for _, window in limits))
+
+        state = self.users.get(user_id)
+        if state is None or len(state) != 1 + 3 * len(limits):
+            state = array("d", [now] + [-2, 0, 0] * len(limits))
+        state[0] = now
+        self.users[user_id] = state
+        self.users.move_to_end(user_id)
+
+        for i, limit in enumerate(limits):
+            if sliding_window(state, 1 + 3 * i, limit, now) + 1 > limit[0]:
+                return False
+
+        for i in range(len(limits)):
+            state[3 + 3 * i] += 1
+        return True
+
+    def evict(self, now: float, idle: float):
+        while self.users:
+            user_id, state = next(iter(self.users.items()))
+            if now - state[0] < idle:
+                break
+            del self.users[user_id]
+
+
+class RedisStore:
+    """
+    Rate limit counters shared by every worker and server through Redis (or
+    any server implementing EVALSHA), so limits hold across processes. Each
+    user is one hash, checked and updated atomically by a Lua script and
+    expired once idle.
+    """
+
+    # KEYS[1]: the user's hash. ARGV: idle TTL in ms, then the limit and window of each limit.
+    SCRIPT = """
+    local time = redis.call("TIME")
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local count = (#ARGV - 1) / 2
+    local states = {}
+
+    for i = 1, count do
+        local limit = tonumber(ARGV[2 * i])
+        local window = tonumber(ARGV[2 * i + 1])
+        local stored = redis.call("HMGET", KEYS[1], "i" .. i, "p" .. i, "c" .. i)
+        local index = math.floor(now / window)
+        local previous = tonumber(stored[2]) or 0
+        local current = tonumber(stored[3]) or 0
+        local stored_index = tonumber(stored[1]) or -2
+        if index == stored_index + 1 then
+            previous, current = current, 0
+        elseif index ~= stored_index then
+            previous, current = 0, 0
+        end
+        local overlap = 1 - (now / window - index)
+        if previous * overlap + current + 1 > limit then
+            return 0
+        end
+        states[i] = {index, previous, current + 1}
+    end
+
+    for i = 1, count do
+        redis.call("HSET", KEYS[1], "i" .. i, states[i][1], "p" .. i, states[i][2], "c" .. i, states[i][3])
+    end
+    redis.call("PEXPIRE", KEYS[1], ARGV[1])
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "pipelines:rate_limit:"):
+        import redis.asyncio
+
+        self.client = redis.asyncio.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def acquire(self, user_id: str, limits: List[Limit]) -> bool:
+        idle_ms = int(2 * max(window for _, window in limits) * 1000)
+        args = [idle_ms]
+        for limit, window in limits:
+            args.extend([limit, window])
+        return bool(await self.script(keys=[f"{self.prefix}{user_id}"], args=args))
+
+    async def close(self):
+        await self.client.aclose()
+
+
 class Pipeline:
     class Valves(BaseModel):
         # List target pipeline ids (models) that this filter will be connected to.
@@ -22,6 +149,9 @@ class Pipeline:
         sliding_window_limit: Optional[int] = None
         sliding_window_minutes: Optional[int] = None
 
+        # Share the limits across workers through Redis (empty keeps them per process)
+        redis_url: str = ""
+
     def __init__(self):
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -50,11 +180,12 @@ class Pipeline:
                 "sliding_window_minutes": int(
                     os.getenv("RATE_LIMIT_SLIDING_WINDOW_MINUTES", 15)
                 ),
+                "redis_url": os.getenv("RATE_LIMIT_REDIS_URL", ""),
             }
         )
 
-        # Tracking data - user_id -> (timestamps of requests)
-        self.user_requests = {}
+        # Tracking data - fixed-size request counters per user
+        self.store = self.create_store()
 
     async def on_startup(self):
         # This function is called when the server is started.
@@ -64,64 +195,47 @@ class Pipeline:
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
-        pass
+        if isinstance(self.store, RedisStore):
+            await self.store.close()
 
-    def prune_requests(self, user_id: str):
-        """Prune old requests that are outside of the sliding window period."""
-        now = time.time()
-        if user_id in self.user_requests:
-            self.user_requests[user_id] = [
-                req
-                for req in self.user_requests[user_id]
-                if (
-                    (self.valves.requests_per_minute is not None and now - req < 60)
-                    or (self.valves.requests_per_hour is not None and now - req < 3600)
-                    or (
-                        self.valves.sliding_window_limit is not None
-                        and now - req < self.valves.sliding_window_minutes * 60
-                    )
-                )
-            ]
-
-    def log_request(self, user_id: str):
-        """Log a new request for a user."""
-        now = time.time()
-        if user_id not in self.user_requests:
-            self.user_requests[user_id] = []
-        self.user_requests[user_id].append(now)
-
-    def rate_limited(self, user_id: str) -> bool:
-        """Check if a user is rate limited."""
-        self.prune_requests(user_id)
-
-        user_reqs = self.user_requests.get(user_id, [])
+    async def on_valves_updated(self):
+        if isinstance(self.store, RedisStore):
+            await self.store.close()
+        self.store = self.create_store()
 
-        if self.valves.requests_per_minute is not None:
-            requests_last_minute = sum(1 for req in user_reqs if time.time() - req < 60)
-            if requests_last_minute >= self.valves.requests_per_minute:
-                return True
+    def create_store(self):
+        if self.valves.redis_url:
+            return RedisStore(self.valves.redis_url)
+        return MemoryStore()
 
+    def limits(self) -> List[Limit]:
+        limits = []
+        if self.valves.requests_per_minute is not None:
+            limits.append((self.valves.requests_per_minute, 60))
         if self.valves.requests_per_hour is not None:
-            requests_last_hour = sum(1 for req in user_reqs if time.time() - req < 3600)
-            if requests_last_hour >= self.valves.requests_per_hour:
-                return True
-
-        if self.valves.sliding_window_limit is not None:
-            requests_in_window = len(user_reqs)
-            if requests_in_window >= self.valves.sliding_window_limit:
-                return True
-
-        return False
+            limits.append((self.valves.requests_per_hour, 3600))
+        if (
+            self.valves.sliding_window_limit is not None
+            and self.valves.sliding_window_minutes
+        ):
+            limits.append(
+                (self.valves.sliding_window_limit, self.valves.sliding_window_minutes * 60)
+            )
+        return limits
+
+    async def rate_limited(self, user_id: str) -> bool:
+        """Check if a user is rate limited, counting the request if it is not."""
+        limits = self.limits()
+        if not limits:
+            return False
+        return not await self.store.acquire(user_id, limits)
 
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"pipe:{__name__}")
-        print(body)
-        print(user)
 
-        if user.get("role", "admin") == "user":
-            user_id = user["id"] if user and "id" in user else "default_user"
-            if self.rate_limited(user_id):
+        if user and user.get("role", "admin") == "user":
+            user_id = user["id"] if "id" in user else "default_user"
+            if await self.rate_limited(user_id):
                 raise Exception("Rate limit exceeded. Please try again later.")
 
-            self.log_request(user_id)
         return body
@@ -5,13 +5,11 @@ date: 2024-08-18
 version: 1.0
 license: MIT
 description: A pipeline for generating text and processing images using the AWS Bedrock API(By Anthropic claude).
-requirements: requests, boto3
+requirements: boto3
 environment_variables: AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION_NAME
 """
-import base64
 import json
 import logging
-from io import BytesIO
 from typing import List, Union, Generator, Iterator
 
 import boto3
@@ -19,8 +17,8 @@ import boto3
 from pydantic import BaseModel
 
 import os
-import requests
 
+from utils.pipelines.assets import ImageAsset, load_images
 from utils.pipelines.main import pop_system_message
 
 
@@ -118,8 +116,19 @@ class Pipeline:
         logging.info(f"pop_system_message: {json.dumps(messages)}")
 
         try:
+            image_urls = [
+                item["image_url"]["url"]
+                for message in messages
+                if isinstance(message.get("content"), list)
+                for item in message["content"]
+                if item["type"] == "image_url"
+            ]
+            if len(image_urls) > 20:
+                raise ValueError("Maximum of 20 images per API call exceeded")
+            # Decoded or downloaded once per image, concurrently, and cached across turns
+            images = iter(load_images(image_urls))
+
             processed_messages = []
-            image_count = 0
             for message in messages:
                 processed_content = []
                 if isinstance(message.get("content"), list):
@@ -127,11 +136,7 @@ class Pipeline:
                         if item["type"] == "text":
                             processed_content.append({"text": item["text"]})
                         elif item["type"] == "image_url":
-                            if image_count >= 20:
-                                raise ValueError("Maximum of 20 images per API call exceeded")
-                            processed_image = self.process_image(item["image_url"])
-                            processed_content.append(processed_image)
-                            image_count += 1
+                            processed_content.append(self.process_image(next(images)))
                 else:
                     processed_content = [{"text": message.get("content", "")}]
 
@@ -150,19 +155,10 @@ class Pipeline:
         except Exception as e:
             return f"Error: {e}"
 
-    def process_image(self, image: str):
-        img_stream = None
-        if image["url"].startswith("data:image"):
-            if ',' in image["url"]:
-                base64_string = image["url"].split(',')[1]
-            image_data = base64.b64decode(base64_string)
-
-            img_stream = BytesIO(image_data)
-        else:
-            img_stream = requests.get(image["url"]).content
+    def process_image(self, image: ImageAsset):
         return {
-            "image": {"format": "png" if image["url"].endswith(".png") else "jpeg",
-                      "source": {"bytes": img_stream.read()}}
+            "image": {"format": image.format,
+                      "source": {"bytes": image.data}}
         }
 
     def stream_response(self, model_id: str, payload: dict) -> Generator:
@@ -13,6 +13,7 @@ usage_instructions:
   - For use outside of Google Cloud: Set the GOOGLE_APPLICATION_CREDENTIALS environment variable to the path of the service account key file.
 """
 
+import logging
 import os
 from typing import Iterator, List, Union
 
@@ -30,6 +31,10 @@ from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_community.vectorstores import BigQueryVectorSearch
 from langchain_community.vectorstores.utils import DistanceStrategy
 
+from utils.pipelines.assets import load_image
+
+logger = logging.getLogger(__name__)
+
 class Pipeline:
     """Google GenAI pipeline"""
 
@@ -103,8 +108,8 @@ class Pipeline:
             if not model_id.startswith("gemini-"):
                 return f"Error: Invalid model name format: {model_id}"
 
-            print(f"Pipe function called for model: {model_id}")
-            print(f"Stream mode: {body.get('stream', False)}")
+            logger.debug("Pipe function called for model: %s", model_id)
+            logger.debug("Stream mode: %s", body.get("stream", False))
             # print(f"User Message: {user_message}")
 
             relevant_docs = self.retrieve_relevant_laws(user_message)
@@ -126,7 +131,7 @@ class Pipeline:
                 # システムメッセージとして先頭に追加する
                 messages.insert(0, {"role": "system", "content": laws_context})
 
-            print(f"Mesage: {messages}")
+            logger.debug("Message: %s", messages)
 
             system_message = next(
                 (msg["content"] for msg in messages if msg["role"] == "system"), None
@@ -175,13 +180,13 @@ class Pipeline:
                 return response.text
 
         except Exception as e:
-            print(f"Error generating content: {e}")
+            logger.error("Error generating content: %s", e)
             return f"An error occurred: {str(e)}"
 
     def stream_response(self, response):
         for chunk in response:
             if chunk.text:
-                print(f"Chunk: {chunk.text}")
+                logger.debug("Chunk: %s", chunk.text)
                 yield chunk.text
 
     def build_conversation_history(self, messages: List[dict]) -> List[Content]:
@@ -200,8 +205,11 @@ class Pipeline:
                     elif content["type"] == "image_url":
                         image_url = content["image_url"]["url"]
                         if image_url.startswith("data:image"):
-                            image_data = image_url.split(",")[1]
-                            parts.append(Part.from_image(image_data))
+                            # Decoded once and cached across turns of the conversation
+                            image = load_image(image_url)
+                            parts.append(
+                                Part.from_data(data=image.data, mime_type=image.mime_type)
+                            )
                         else:
                             parts.append(Part.from_uri(image_url))
             else:
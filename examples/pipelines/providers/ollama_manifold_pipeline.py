@@ -1,5 +1,6 @@
 from typing import List, Union, Generator, Iterator
 from schemas import OpenAIChatMessage
+from utils.pipelines.deadline import remaining_time
 import os
 
 from pydantic import BaseModel
@@ -87,6 +88,8 @@ class Pipeline:
                 url=f"{self.valves.OLLAMA_BASE_URL}/v1/chat/completions",
                 json={**body, "model": model_id},
                 stream=True,
+                # Give up on the upstream when the request's deadline passes
+                timeout=remaining_time(),
             )
 
             r.raise_for_status()
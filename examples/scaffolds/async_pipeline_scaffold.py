@@ -0,0 +1,72 @@
+from typing import List, Union, AsyncGenerator
+from schemas import OpenAIChatMessage
+from pydantic import BaseModel
+
+import asyncio
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        pass
+
+    def __init__(self):
+        # Optionally, you can set the id and name of the pipeline.
+        # Best practice is to not specify the id so that it can be automatically inferred from the filename, so that users can install multiple versions of the same pipeline.
+        # The identifier must be unique across all pipelines.
+        # The identifier must be an alphanumeric string that can include underscores or hyphens. It cannot contain spaces, special characters, slashes, or backslashes.
+        # self.id = "async_pipeline_example"
+
+        # The name of the pipeline.
+        self.name = "Async Pipeline Example"
+
+        # Optionally, let the server cache responses when PIPELINES_CACHE is enabled.
+        # Set it to True, or to a function of the request body to decide per request.
+        # self.cacheable = lambda body: body.get("temperature") == 0
+
+        # Optionally, override the server's request deadline and streaming timeouts (in seconds).
+        # Call `utils.pipelines.deadline.remaining_time()` in `pipe` to bound your own upstream calls.
+        # self.request_timeout = 300
+        # self.ttft_timeout = 60
+        # self.idle_timeout = 30
+        pass
+
+    async def on_startup(self):
+        # This function is called when the server is started.
+        print(f"on_startup:{__name__}")
+        pass
+
+    async def on_shutdown(self):
+        # This function is called when the server is stopped.
+        print(f"on_shutdown:{__name__}")
+        pass
+
+    async def on_cancel(self, body: dict):
+        # This function is called when the client disconnects before a streamed response is complete.
+        # The generator returned by `pipe` is closed as well, so `finally` blocks in it run;
+        # use this hook to abort upstream work that is not tied to the generator.
+        print(f"on_cancel:{__name__}")
+        pass
+
+    async def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[str, AsyncGenerator]:
+        # Async pipes run directly on the server's event loop instead of a worker thread,
+        # so a long stream does not hold on to one of the limited threadpool slots.
+        # Never call blocking code (e.g. `requests`, `time.sleep`) in here; use async clients such as `httpx.AsyncClient` or `aiohttp` instead.
+        print(f"pipe:{__name__}")
+
+        # If you'd like to check for title generation, you can add the following check
+        if body.get("title", False):
+            print("Title Generation Request")
+            return f"{__name__} title"
+
+        if body.get("stream", False):
+            return self.stream_response(user_message)
+
+        return f"{__name__} response to: {user_message}"
+
+    async def stream_response(self, user_message: str) -> AsyncGenerator:
+        # Yield chunks as they arrive from your upstream; each one is sent as its own SSE frame.
+        for word in f"{__name__} response to: {user_message}".split(" "):
+            await asyncio.sleep(0)
+            yield f"{word} "
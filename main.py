@@ -3,130 +3,228 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.concurrency import run_in_threadpool
 
 
-from starlette.responses import StreamingResponse, Response
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from pydantic import BaseModel, ConfigDict
-from typing import List, Union, Generator, Iterator
+from typing import List, Optional, Union, Generator, Iterator, AsyncGenerator, AsyncIterator
 
 
-from utils.pipelines.auth import bearer_security, get_current_user
-from utils.pipelines.main import get_last_user_message, stream_message_template
-from utils.pipelines.misc import convert_to_raw_url
+from utils.pipelines.auth import (
+    bearer_security,
+    get_admin_user,
+    get_current_user,
+    get_inference_user,
+)
+from utils.pipelines.main import get_last_user_message
+from utils.pipelines.assets import image_cache
+from utils.pipelines.install import InstallError, PipelineInstaller
+from utils.pipelines.request import (
+    OPENAPI_EXTRA as CHAT_REQUEST_OPENAPI,
+    ChatCompletionRequest,
+    parse_chat_request,
+)
+from utils.pipelines.registry import PipelineRegistry
+from utils.pipelines.stream import (
+    ABANDON_ON_CANCEL,
+    StreamEncoder,
+    aclose_iterator,
+    close_iterator,
+    iterate_in_thread,
+)
+from utils.pipelines.watch import PipelineDirectoryTracker
+from utils.pipelines.lifecycle import StartupReport, FAILED, LAZY, start_pipeline
+from utils.pipelines.manifest import LazyPipeline, PipelineManifest
+from utils.pipelines.coordination import SharedState
+from utils.pipelines.requirements import (
+    RequirementsCache,
+    collect_requirements,
+    ensure_module_requirements,
+    ensure_requirements,
+    parse_frontmatter,
+    split_requirements,
+)
+from utils.pipelines.admission import (
+    Admission,
+    AdmissionController,
+    AdmissionRejected,
+    admission_hold,
+    current_admission,
+)
+from utils.pipelines.cache import ResponseCache, cache_key, is_cacheable
+from utils.pipelines.singleflight import SingleFlight
+from utils.pipelines.batch import BatchManager
+from utils.pipelines.valves import ValveStore
+from utils.pipelines.deadline import (
+    TIMEOUT_FIELD,
+    TIMEOUT_HEADER,
+    Deadline,
+    StreamTimeouts,
+    current_deadline,
+    pipeline_timeout,
+    request_timeout,
+    with_timeouts,
+)
+from utils.pipelines.logs import (
+    DeferredQueueHandler,
+    Sampler,
+    current_logger,
+    current_pipeline,
+    setup_logging,
+)
+from utils.pipelines.metrics import (
+    ABANDONED_CHUNKS,
+    FILTER_DURATION,
+    REQUEST_DURATION,
+    REQUESTS,
+    REQUESTS_IN_FLIGHT,
+    STREAM_CHUNK_RATE,
+    STREAM_CHUNKS,
+    STREAMS_ABORTED,
+    TIME_TO_FIRST_CHUNK,
+    TIMEOUTS,
+    ServerTiming,
+    admission_metrics,
+    asset_cache_metrics,
+    cache_metrics,
+    log_metrics,
+    metrics,
+    single_flight_metrics,
+)
 
+from anyio import to_thread
 from contextlib import asynccontextmanager
+from functools import partial
 from concurrent.futures import ThreadPoolExecutor
-from schemas import FilterForm, OpenAIChatCompletionForm
-from urllib.parse import urlparse
+from schemas import FilterForm, FilterChainForm
 
 import shutil
-import aiohttp
+import httpx
+import asyncio
 import os
 import importlib.util
+import inspect
 import logging
 import time
 import json
 import uuid
 import sys
-import subprocess
 
 
-from config import API_KEY, PIPELINES_DIR
+from config import (
+    API_KEY,
+    PIPELINES_DIR,
+    MANIFOLD_PIPELINES_TTL,
+    CONCURRENCY_LIMIT,
+    CONCURRENCY_LIMITS,
+    MAX_QUEUE_SIZE,
+    MAX_QUEUE_WAIT,
+    STREAM_COALESCE_MS,
+    STREAM_COALESCE_BYTES,
+    PIPELINES_WATCH,
+    PIPELINES_WATCH_INTERVAL,
+    PIPELINES_STARTUP_WORKERS,
+    PIPELINES_STARTUP_TIMEOUT,
+    PIPELINES_REQUIREMENTS_CACHE,
+    PIPELINES_LAZY_LOAD,
+    PIPELINES_MANIFEST,
+    PIPELINES_SYNC,
+    PIPELINES_SYNC_INTERVAL,
+    PIPELINES_STATE_DIR,
+    PIPELINES_CACHE,
+    PIPELINES_CACHE_SIZE,
+    PIPELINES_CACHE_TTL,
+    PIPELINES_CACHE_DIR,
+    PIPELINES_SINGLE_FLIGHT,
+    PIPELINES_LOG_LEVEL,
+    PIPELINES_LOG_LEVELS,
+    PIPELINES_LOG_CHUNK_SAMPLE,
+    PIPELINES_PRINT_LEVEL,
+    PIPELINES_REQUEST_TIMEOUT,
+    PIPELINES_TTFT_TIMEOUT,
+    PIPELINES_IDLE_TIMEOUT,
+    PIPELINES_BATCH_DIR,
+    PIPELINES_BATCH_CONCURRENCY,
+    PIPELINES_VALVES_DB,
+    PIPELINES_VALVES_HISTORY,
+    PIPELINES_MAX_DOWNLOAD_SIZE,
+    PIPELINES_DOWNLOAD_CONCURRENCY,
+)
+
+setup_logging(PIPELINES_LOG_LEVEL, PIPELINES_LOG_LEVELS, PIPELINES_PRINT_LEVEL)
+chunk_log_sampler = Sampler(PIPELINES_LOG_CHUNK_SAMPLE)
 
 if not os.path.exists(PIPELINES_DIR):
     os.makedirs(PIPELINES_DIR)
 
 
-PIPELINES = {}
 PIPELINE_MODULES = {}
 PIPELINE_NAMES = {}
 
+registry = PipelineRegistry(manifold_ttl=MANIFOLD_PIPELINES_TTL)
+pipeline_files = PipelineDirectoryTracker(PIPELINES_DIR)
+reload_lock = asyncio.Lock()
 
-def get_all_pipelines():
-    pipelines = {}
-    for pipeline_id in PIPELINE_MODULES.keys():
-        pipeline = PIPELINE_MODULES[pipeline_id]
-
-        if hasattr(pipeline, "type"):
-            if pipeline.type == "manifold":
-                manifold_pipelines = []
-
-                # Check if pipelines is a function or a list
-                if callable(pipeline.pipelines):
-                    manifold_pipelines = pipeline.pipelines()
-                else:
-                    manifold_pipelines = pipeline.pipelines
-
-                for p in manifold_pipelines:
-                    manifold_pipeline_id = f'{pipeline_id}.{p["id"]}'
-
-                    manifold_pipeline_name = p["name"]
-                    if hasattr(pipeline, "name"):
-                        manifold_pipeline_name = (
-                            f"{pipeline.name}{manifold_pipeline_name}"
-                        )
-
-                    pipelines[manifold_pipeline_id] = {
-                        "module": pipeline_id,
-                        "type": pipeline.type if hasattr(pipeline, "type") else "pipe",
-                        "id": manifold_pipeline_id,
-                        "name": manifold_pipeline_name,
-                        "valves": (
-                            pipeline.valves if hasattr(pipeline, "valves") else None
-                        ),
-                    }
-            if pipeline.type == "filter":
-                pipelines[pipeline_id] = {
-                    "module": pipeline_id,
-                    "type": (pipeline.type if hasattr(pipeline, "type") else "pipe"),
-                    "id": pipeline_id,
-                    "name": (
-                        pipeline.name if hasattr(pipeline, "name") else pipeline_id
-                    ),
-                    "pipelines": (
-                        pipeline.valves.pipelines
-                        if hasattr(pipeline, "valves")
-                        and hasattr(pipeline.valves, "pipelines")
-                        else []
-                    ),
-                    "priority": (
-                        pipeline.valves.priority
-                        if hasattr(pipeline, "valves")
-                        and hasattr(pipeline.valves, "priority")
-                        else 0
-                    ),
-                    "valves": pipeline.valves if hasattr(pipeline, "valves") else None,
-                }
-        else:
-            pipelines[pipeline_id] = {
-                "module": pipeline_id,
-                "type": (pipeline.type if hasattr(pipeline, "type") else "pipe"),
-                "id": pipeline_id,
-                "name": (pipeline.name if hasattr(pipeline, "name") else pipeline_id),
-                "valves": pipeline.valves if hasattr(pipeline, "valves") else None,
-            }
-
-    return pipelines
+startup_report = StartupReport()
+startup_executor = ThreadPoolExecutor(
+    max_workers=PIPELINES_STARTUP_WORKERS, thread_name_prefix="pipelines-startup"
+)
+requirements_cache = RequirementsCache(PIPELINES_REQUIREMENTS_CACHE)
+
+pipeline_manifest = PipelineManifest(PIPELINES_MANIFEST)
+lazy_load_locks = {}
+
+# Coordinates valve and pipeline changes between the workers of one deployment
+shared_state = SharedState(PIPELINES_STATE_DIR) if PIPELINES_SYNC else None
+admission = AdmissionController(
+    default_limit=CONCURRENCY_LIMIT,
+    max_queue_size=MAX_QUEUE_SIZE,
+    max_queue_wait=MAX_QUEUE_WAIT,
+    limits=CONCURRENCY_LIMITS,
+)
+metrics.collector(lambda: admission_metrics(admission.stats()))
+metrics.collector(lambda: log_metrics(DeferredQueueHandler.dropped))
+metrics.collector(lambda: asset_cache_metrics(image_cache.stats()))
+
+response_cache = (
+    ResponseCache(PIPELINES_CACHE_SIZE, PIPELINES_CACHE_TTL, PIPELINES_CACHE_DIR)
+    if PIPELINES_CACHE
+    else None
+)
+if response_cache is not None:
+    metrics.collector(lambda: cache_metrics(response_cache.stats()))
 
+single_flight = SingleFlight() if PIPELINES_SINGLE_FLIGHT else None
+if single_flight is not None:
+    metrics.collector(lambda: single_flight_metrics(single_flight.stats()))
 
-def parse_frontmatter(content):
-    frontmatter = {}
-    for line in content.split("\n"):
-        if ":" in line:
-            key, value = line.split(":", 1)
-            frontmatter[key.strip().lower()] = value.strip()
-    return frontmatter
+batch_manager = BatchManager(PIPELINES_BATCH_DIR)
+valve_store = ValveStore(PIPELINES_VALVES_DB, history=PIPELINES_VALVES_HISTORY)
+installer = PipelineInstaller(
+    PIPELINES_MAX_DOWNLOAD_SIZE, concurrency=PIPELINES_DOWNLOAD_CONCURRENCY
+)
 
 
 def install_frontmatter_requirements(requirements):
     if requirements:
-        req_list = [req.strip() for req in requirements.split(",")]
-        for req in req_list:
-            print(f"Installing requirement: {req}")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", req])
+        ensure_requirements(split_requirements(requirements), requirements_cache)
     else:
         print("No requirements found in frontmatter.")
 
 
 async def load_module_from_path(module_name, module_path):
+    # Importing runs arbitrary module-level code, keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(
+        startup_executor, import_module_from_path, module_name, module_path
+    )
+
+
+def import_module_from_path(module_name, module_path):
+    start = time.monotonic()
 
     try:
         # Read the module content
@@ -150,12 +248,18 @@ async def load_module_from_path(module_name, module_path):
         module = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(module)
         print(f"Loaded module: {module.__name__}")
+        startup_report.record(module_name, "import", time.monotonic() - start)
+
         if hasattr(module, "Pipeline"):
-            return module.Pipeline()
+            start = time.monotonic()
+            pipeline = module.Pipeline()
+            startup_report.record(module_name, "construct", time.monotonic() - start)
+            return pipeline
         else:
             raise Exception("No Pipeline class found")
     except Exception as e:
         print(f"Error loading module: {module_name}")
+        startup_report.set_status(module_name, FAILED, str(e))
 
         # Move the file to the error folder
         failed_pipelines_folder = os.path.join(PIPELINES_DIR, "failed")
@@ -163,68 +267,197 @@ async def load_module_from_path(module_name, module_path):
             os.makedirs(failed_pipelines_folder)
 
         failed_file_path = os.path.join(failed_pipelines_folder, f"{module_name}.py")
-        os.rename(module_path, failed_file_path)
+        try:
+            os.rename(module_path, failed_file_path)
+        except FileNotFoundError:
+            # Already moved by another worker
+            pass
         print(e)
     return None
 
 
+async def load_pipeline(module_name, directory=PIPELINES_DIR, lazy=PIPELINES_LAZY_LOAD):
+    module_path = os.path.join(directory, f"{module_name}.py")
+
+    if lazy:
+        metadata = pipeline_manifest.get(module_path)
+        if (
+            metadata
+            and metadata["lazy"]
+            and metadata["frontmatter"].get("lazy", "true").lower() != "false"
+        ):
+            pipeline = LazyPipeline(module_name, metadata)
+            pipeline_id = pipeline.id if hasattr(pipeline, "id") else module_name
+            startup_report.set_status(pipeline_id, LAZY)
+            logging.info(f"Registered lazy module: {module_name}")
+            return pipeline
+
+    pipeline = await load_module_from_path(module_name, module_path)
+    if pipeline:
+        # Overwrite pipeline.valves with the stored values
+        stored_valves = valve_store.get(module_name)
+        if stored_valves is None:
+            stored_valves = await asyncio.to_thread(
+                valve_store.migrate, module_name, directory
+            )
+        if stored_valves and hasattr(pipeline, "valves"):
+            ValvesModel = pipeline.valves.__class__
+            # Create a ValvesModel instance using default values and overwrite with the stored ones
+            combined_valves = {
+                **pipeline.valves.model_dump(),
+                **stored_valves,
+            }
+            valves = ValvesModel(**combined_valves)
+            pipeline.valves = valves
+
+            logging.info(f"Updated valves for module: {module_name}")
+
+        pipeline_id = pipeline.id if hasattr(pipeline, "id") else module_name
+        startup_report.rename(module_name, pipeline_id)
+        logging.info(f"Loaded module: {module_name}")
+    else:
+        logging.warning(f"No Pipeline class found in {module_name}")
+
+    return pipeline
+
+
 async def load_modules_from_directory(directory):
     global PIPELINE_MODULES
     global PIPELINE_NAMES
 
-    for filename in os.listdir(directory):
-        if filename.endswith(".py"):
-            module_name = filename[:-3]  # Remove the .py extension
-            module_path = os.path.join(directory, filename)
-
-            # Create subfolder matching the filename without the .py extension
-            subfolder_path = os.path.join(directory, module_name)
-            if not os.path.exists(subfolder_path):
-                os.makedirs(subfolder_path)
-                logging.info(f"Created subfolder: {subfolder_path}")
-
-            # Create a valves.json file if it doesn't exist
-            valves_json_path = os.path.join(subfolder_path, "valves.json")
-            if not os.path.exists(valves_json_path):
-                with open(valves_json_path, "w") as f:
-                    json.dump({}, f)
-                logging.info(f"Created valves.json in: {subfolder_path}")
-
-            pipeline = await load_module_from_path(module_name, module_path)
-            if pipeline:
-                # Overwrite pipeline.valves with values from valves.json
-                if os.path.exists(valves_json_path):
-                    with open(valves_json_path, "r") as f:
-                        valves_json = json.load(f)
-                        if hasattr(pipeline, "valves"):
-                            ValvesModel = pipeline.valves.__class__
-                            # Create a ValvesModel instance using default values and overwrite with valves_json
-                            combined_valves = {
-                                **pipeline.valves.model_dump(),
-                                **valves_json,
-                            }
-                            valves = ValvesModel(**combined_valves)
-                            pipeline.valves = valves
-
-                            logging.info(f"Updated valves for module: {module_name}")
-
-                pipeline_id = pipeline.id if hasattr(pipeline, "id") else module_name
-                PIPELINE_MODULES[pipeline_id] = pipeline
-                PIPELINE_NAMES[pipeline_id] = module_name
-                logging.info(f"Loaded module: {module_name}")
-            else:
-                logging.warning(f"No Pipeline class found in {module_name}")
+    # Populate fresh dictionaries and swap them in at the end so that requests
+    # served during a reload keep seeing the previous set of pipelines.
+    modules = {}
+    names = {}
+
+    module_names = [
+        filename[:-3]  # Remove the .py extension
+        for filename in os.listdir(directory)
+        if filename.endswith(".py")
+    ]
+
+    # The valves of every pipeline are read in one query
+    await asyncio.to_thread(valve_store.load)
+
+    # Resolve the requirements of every pipeline in one batch up front, so the
+    # per-module checks during import are cache hits
+    failed = {}
+    try:
+        failed = await asyncio.get_running_loop().run_in_executor(
+            startup_executor,
+            ensure_module_requirements,
+            collect_requirements(directory),
+            requirements_cache,
+        )
+    except Exception as e:
+        logging.error(f"Failed to install pipeline requirements: {e}")
+
+    # Only the pipelines whose requirements could not be installed are skipped
+    for module_name, error in failed.items():
+        logging.error(f"Skipping {module_name}: its requirements could not be installed")
+        startup_report.set_status(module_name, FAILED, error)
+    module_names = [name for name in module_names if name not in failed]
+
+    # Import every module in parallel worker threads
+    pipelines = await asyncio.gather(
+        *[load_pipeline(module_name, directory) for module_name in module_names]
+    )
+
+    for module_name, pipeline in zip(module_names, pipelines):
+        if pipeline:
+            pipeline_id = pipeline.id if hasattr(pipeline, "id") else module_name
+            modules[pipeline_id] = pipeline
+            names[pipeline_id] = module_name
+
+    PIPELINE_MODULES = modules
+    PIPELINE_NAMES = names
+    pipeline_files.reset()
+    if PIPELINES_LAZY_LOAD:
+        pipeline_manifest.prune()
+
 
-    global PIPELINES
-    PIPELINES = get_all_pipelines()
+async def ensure_loaded(pipeline_id: str):
+    """
+    Returns the pipeline registered as `pipeline_id`, importing and starting it
+    first if it was registered lazily.
+    """
+    global PIPELINE_MODULES
+
+    pipeline = PIPELINE_MODULES.get(pipeline_id)
+    if not getattr(pipeline, "lazy", False):
+        return pipeline
+
+    lock = lazy_load_locks.setdefault(pipeline_id, asyncio.Lock())
+    async with lock:
+        current = PIPELINE_MODULES.get(pipeline_id)
+        if current is not pipeline:
+            # Loaded by a concurrent request, or replaced by a reload
+            return await ensure_loaded(pipeline_id) if current else None
+
+        logging.info(f"Loading lazy pipeline: {pipeline_id}")
+        loaded = await load_pipeline(pipeline.module_name, lazy=False)
+        if not loaded:
+            PIPELINE_MODULES = {
+                p: m for p, m in PIPELINE_MODULES.items() if p != pipeline_id
+            }
+            registry.rebuild(PIPELINE_MODULES)
+            return None
+
+        await start_pipeline(
+            pipeline_id,
+            loaded,
+            startup_report,
+            PIPELINES_STARTUP_TIMEOUT,
+            on_ready=rebuild_registry,
+        )
+
+        # Swapped in under the reload lock, so a reload cannot replace the stand-in
+        # between the check and the swap and leave `loaded` running unreferenced
+        async with reload_lock:
+            swapped = PIPELINE_MODULES.get(pipeline_id) is pipeline
+            if swapped:
+                PIPELINE_MODULES = {**PIPELINE_MODULES, pipeline_id: loaded}
+                registry.invalidate(pipeline_id)
+                registry.rebuild(PIPELINE_MODULES)
+
+        if not swapped and hasattr(loaded, "on_shutdown"):
+            # Replaced by a reload while importing; release what on_startup acquired
+            try:
+                await loaded.on_shutdown()
+            except Exception as e:
+                logging.error(f"Error shutting down {pipeline_id}: {e}")
+
+        return PIPELINE_MODULES.get(pipeline_id)
+
+
+def rebuild_registry():
+    registry.rebuild(PIPELINE_MODULES)
 
 
 async def on_startup():
+    startup_report.reset()
     await load_modules_from_directory(PIPELINES_DIR)
 
-    for module in PIPELINE_MODULES.values():
-        if hasattr(module, "on_startup"):
-            await module.on_startup()
+    # Run every on_startup concurrently, each one time-boxed
+    await asyncio.gather(
+        *[
+            start_pipeline(
+                pipeline_id,
+                module,
+                startup_report,
+                PIPELINES_STARTUP_TIMEOUT,
+                on_ready=rebuild_registry,
+            )
+            for pipeline_id, module in PIPELINE_MODULES.items()
+            if not getattr(module, "lazy", False)
+        ]
+    )
+
+    # Manifolds commonly populate their model list in on_startup, so the
+    # registry is only built once every module has started.
+    registry.invalidate()
+    registry.rebuild(PIPELINE_MODULES)
+    startup_report.log_summary()
 
 
 async def on_shutdown():
@@ -234,25 +467,163 @@ async def on_shutdown():
 
 
 async def reload():
-    await on_shutdown()
-    # Clear existing pipelines
-    PIPELINES.clear()
-    PIPELINE_MODULES.clear()
-    PIPELINE_NAMES.clear()
-    # Load pipelines afresh
-    await on_startup()
+    async with reload_lock:
+        await on_shutdown()
+        # Load pipelines afresh; the registry snapshot is swapped once they are ready
+        await on_startup()
+
+
+async def reload_changed():
+    """
+    Reloads only the pipeline files that were added, changed or removed since
+    the last load. Every other pipeline stays loaded and warm.
+    """
+    global PIPELINE_MODULES
+    global PIPELINE_NAMES
+
+    async with reload_lock:
+        changes = pipeline_files.changes()
+        if not changes:
+            return changes
+
+        logging.info(
+            f"Reloading pipelines: added={changes.added} changed={changes.changed} removed={changes.removed}"
+        )
+
+        modules = dict(PIPELINE_MODULES)
+        names = dict(PIPELINE_NAMES)
+
+        for module_name in changes.changed + changes.removed:
+            for pipeline_id in [p for p, n in names.items() if n == module_name]:
+                pipeline = modules.pop(pipeline_id)
+                names.pop(pipeline_id)
+                registry.invalidate(pipeline_id)
+                startup_report.remove(pipeline_id)
+
+                if hasattr(pipeline, "on_shutdown"):
+                    try:
+                        await pipeline.on_shutdown()
+                    except Exception as e:
+                        logging.error(f"Error shutting down {pipeline_id}: {e}")
+
+        for module_name in changes.added + changes.changed:
+            pipeline = await load_pipeline(module_name)
+            if not pipeline:
+                continue
+
+            pipeline_id = pipeline.id if hasattr(pipeline, "id") else module_name
+            if not getattr(pipeline, "lazy", False):
+                await start_pipeline(
+                    pipeline_id,
+                    pipeline,
+                    startup_report,
+                    PIPELINES_STARTUP_TIMEOUT,
+                    on_ready=rebuild_registry,
+                )
+
+            modules[pipeline_id] = pipeline
+            names[pipeline_id] = module_name
+
+        PIPELINE_MODULES = modules
+        PIPELINE_NAMES = names
+        registry.rebuild(PIPELINE_MODULES)
+
+        # Files that failed to load were moved out of the directory
+        pipeline_files.reset()
+        return changes
+
+
+async def reload_valves(pipeline_id: str):
+    """Re-reads the valves of a pipeline from the valve store."""
+    pipeline = PIPELINE_MODULES.get(pipeline_id)
+    if pipeline_id not in PIPELINE_NAMES:
+        return
+
+    # Refreshed even for lazy stand-ins, which take their valves from the store once loaded
+    stored_valves = await asyncio.to_thread(
+        valve_store.refresh, PIPELINE_NAMES[pipeline_id]
+    )
+    if not hasattr(pipeline, "valves") or getattr(pipeline, "lazy", False):
+        return
+
+    ValvesModel = pipeline.valves.__class__
+    pipeline.valves = ValvesModel(
+        **{**pipeline.valves.model_dump(), **(stored_valves or {})}
+    )
+
+    if hasattr(pipeline, "on_valves_updated"):
+        await pipeline.on_valves_updated()
+
+    registry.invalidate(pipeline_id)
+    registry.rebuild(PIPELINE_MODULES)
+
+
+async def publish_change(type: str, **data):
+    """Lets the other workers of this deployment know about a change made here."""
+    if shared_state is not None:
+        await asyncio.to_thread(shared_state.publish, type, **data)
+
+
+async def sync_workers():
+    async for event in shared_state.watch(PIPELINES_SYNC_INTERVAL):
+        logging.info(f"Applying change from another worker: {event}")
+        try:
+            if event["type"] == "valves":
+                await reload_valves(event["pipeline_id"])
+            elif event["type"] == "files":
+                await reload_changed()
+            else:
+                await reload()
+        except Exception as e:
+            logging.error(f"Failed to apply change from another worker: {e}")
+
+
+async def watch_pipelines():
+    async for _ in pipeline_files.watch(PIPELINES_WATCH_INTERVAL):
+        try:
+            await reload_changed()
+        except Exception as e:
+            logging.error(f"Failed to reload pipelines: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await on_startup()
+
+    background_tasks = []
+    if MANIFOLD_PIPELINES_TTL > 0:
+        background_tasks.append(
+            asyncio.create_task(registry.run_manifold_refresher())
+        )
+    if PIPELINES_WATCH:
+        background_tasks.append(asyncio.create_task(watch_pipelines()))
+    if shared_state is not None:
+        background_tasks.append(asyncio.create_task(sync_workers()))
+
+    # Batches call the server's own endpoints in-process
+    batch_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+        base_url="http://pipelines",
+        headers={"Authorization": f"Bearer {API_KEY}"},
+        timeout=None,
+    )
+    await batch_manager.start_all(batch_client)
+
     yield
+
+    await batch_manager.stop_all()
+    await batch_client.aclose()
+    for task in background_tasks:
+        task.cancel()
     await on_shutdown()
+    valve_store.close()
+    await installer.close()
+    image_cache.close()
 
 
 app = FastAPI(docs_url="/docs", redoc_url=None, lifespan=lifespan)
 
-app.state.PIPELINES = PIPELINES
+app.state.registry = registry
 
 
 origins = ["*"]
@@ -269,11 +640,13 @@ app.add_middleware(
 
 @app.middleware("http")
 async def check_url(request: Request, call_next):
-    start_time = int(time.time())
-    app.state.PIPELINES = get_all_pipelines()
+    timing = request.state.timing = ServerTiming()
     response = await call_next(request)
-    process_time = int(time.time()) - start_time
-    response.headers["X-Process-Time"] = str(process_time)
+    # Streaming responses are returned once their first chunk is ready, so
+    # this covers everything up to the first byte of the body
+    response.headers["X-Process-Time"] = f"{timing.elapsed:.6f}"
+    if timing.phases:
+        response.headers["Server-Timing"] = timing.header()
 
     return response
 
@@ -284,7 +657,6 @@ async def get_models(user: str = Depends(get_current_user)):
     """
     Returns the available pipelines
     """
-    app.state.PIPELINES = get_all_pipelines()
     return {
         "data": [
             {
@@ -310,7 +682,7 @@ async def get_models(user: str = Depends(get_current_user)):
                     "valves": pipeline["valves"] != None,
                 },
             }
-            for pipeline in app.state.PIPELINES.values()
+            for pipeline in registry.pipelines.values()
         ],
         "object": "list",
         "pipelines": True,
@@ -323,84 +695,82 @@ async def get_status():
     return {"status": True}
 
 
+@app.get("/v1/ready")
+@app.get("/ready")
+async def get_readiness():
+    """
+    Reports per-pipeline warm state and startup timings, responding with 503
+    until every pipeline has finished its on_startup
+    """
+    ready = startup_report.ready
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": ready, "pipelines": startup_report.pipelines},
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Returns request, streaming, filter and admission metrics of this worker in
+    the Prometheus text exposition format
+    """
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/v1/pipelines")
 @app.get("/pipelines")
-async def list_pipelines(user: str = Depends(get_current_user)):
-    if user == API_KEY:
-        return {
-            "data": [
-                {
-                    "id": pipeline_id,
-                    "name": PIPELINE_NAMES[pipeline_id],
-                    "type": (
-                        PIPELINE_MODULES[pipeline_id].type
-                        if hasattr(PIPELINE_MODULES[pipeline_id], "type")
-                        else "pipe"
-                    ),
-                    "valves": (
-                        True
-                        if hasattr(PIPELINE_MODULES[pipeline_id], "valves")
-                        else False
-                    ),
-                }
-                for pipeline_id in list(PIPELINE_MODULES.keys())
-            ]
-        }
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-        )
+async def list_pipelines(user: str = Depends(get_admin_user)):
+    return {
+        "data": [
+            {
+                "id": pipeline_id,
+                "name": PIPELINE_NAMES[pipeline_id],
+                "type": (
+                    PIPELINE_MODULES[pipeline_id].type
+                    if hasattr(PIPELINE_MODULES[pipeline_id], "type")
+                    else "pipe"
+                ),
+                "valves": (
+                    PIPELINE_MODULES[pipeline_id].has_valves
+                    if getattr(PIPELINE_MODULES[pipeline_id], "lazy", False)
+                    else hasattr(PIPELINE_MODULES[pipeline_id], "valves")
+                ),
+            }
+            for pipeline_id in list(PIPELINE_MODULES.keys())
+        ]
+    }
 
 
 class AddPipelineForm(BaseModel):
     url: str
 
 
-async def download_file(url: str, dest_folder: str):
-    filename = os.path.basename(urlparse(url).path)
-    if not filename.endswith(".py"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="URL must point to a Python file",
-        )
-
-    file_path = os.path.join(dest_folder, filename)
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to download file",
-                )
-            with open(file_path, "wb") as f:
-                f.write(await response.read())
-
-    return file_path
+class AddPipelinesForm(BaseModel):
+    urls: List[str]
 
 
 @app.post("/v1/pipelines/add")
 @app.post("/pipelines/add")
 async def add_pipeline(
-    form_data: AddPipelineForm, user: str = Depends(get_current_user)
+    form_data: AddPipelineForm, user: str = Depends(get_admin_user)
 ):
-    if user != API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-        )
-
     try:
-        url = convert_to_raw_url(form_data.url)
-
-        print(url)
-        file_path = await download_file(url, dest_folder=PIPELINES_DIR)
-        await reload()
+        os.makedirs(PIPELINES_DIR, exist_ok=True)
+        file_path = await installer.install(form_data.url, dest_folder=PIPELINES_DIR)
+        await reload_changed()
+        await publish_change("files")
         return {
             "status": True,
             "detail": f"Pipeline added successfully from {file_path}",
         }
+    except InstallError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -410,17 +780,33 @@ async def add_pipeline(
         )
 
 
+@app.post("/v1/pipelines/add/bulk")
+@app.post("/pipelines/add/bulk")
+async def add_pipelines(
+    form_data: AddPipelinesForm, user: str = Depends(get_admin_user)
+):
+    """
+    Downloads many pipeline files concurrently and reloads once at the end.
+    URLs may end with `#sha256=<hex digest>` to verify the download.
+    """
+    os.makedirs(PIPELINES_DIR, exist_ok=True)
+    results = await installer.install_many(form_data.urls, dest_folder=PIPELINES_DIR)
+
+    if any(result["status"] for result in results):
+        await reload_changed()
+        await publish_change("files")
+
+    return {
+        "status": all(result["status"] for result in results),
+        "data": results,
+    }
+
+
 @app.post("/v1/pipelines/upload")
 @app.post("/pipelines/upload")
 async def upload_pipeline(
-    file: UploadFile = File(...), user: str = Depends(get_current_user)
+    file: UploadFile = File(...), user: str = Depends(get_admin_user)
 ):
-    if user != API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-        )
-
     file_ext = os.path.splitext(file.filename)[1]
     if file_ext != ".py":
         raise HTTPException(
@@ -439,8 +825,9 @@ async def upload_pipeline(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
-        # Perform any necessary reload or processing
-        await reload()
+        # Load the new or changed pipeline, leaving the others running
+        await reload_changed()
+        await publish_change("files")
 
         return {
             "status": True,
@@ -462,25 +849,17 @@ class DeletePipelineForm(BaseModel):
 @app.delete("/v1/pipelines/delete")
 @app.delete("/pipelines/delete")
 async def delete_pipeline(
-    form_data: DeletePipelineForm, user: str = Depends(get_current_user)
+    form_data: DeletePipelineForm, user: str = Depends(get_admin_user)
 ):
-    if user != API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-        )
-
     pipeline_id = form_data.id
     pipeline_name = PIPELINE_NAMES.get(pipeline_id.split(".")[0], None)
 
-    if PIPELINE_MODULES[pipeline_id]:
-        if hasattr(PIPELINE_MODULES[pipeline_id], "on_shutdown"):
-            await PIPELINE_MODULES[pipeline_id].on_shutdown()
-
     pipeline_path = os.path.join(PIPELINES_DIR, f"{pipeline_name}.py")
     if os.path.exists(pipeline_path):
         os.remove(pipeline_path)
-        await reload()
+        # Shuts down and unloads the deleted pipeline only
+        await reload_changed()
+        await publish_change("files")
         return {
             "status": True,
             "detail": f"Pipeline {pipeline_id} deleted successfully",
@@ -494,27 +873,158 @@ async def delete_pipeline(
 
 @app.post("/v1/pipelines/reload")
 @app.post("/pipelines/reload")
-async def reload_pipelines(user: str = Depends(get_current_user)):
-    if user == API_KEY:
-        await reload()
-        return {"message": "Pipelines reloaded successfully."}
-    else:
+async def reload_pipelines(user: str = Depends(get_admin_user)):
+    await reload()
+    await publish_change("reload")
+    return {"message": "Pipelines reloaded successfully."}
+
+
+class WarmupPipelinesForm(BaseModel):
+    ids: Optional[List[str]] = None
+
+
+@app.post("/v1/pipelines/warmup")
+@app.post("/pipelines/warmup")
+async def warmup_pipelines(
+    form_data: WarmupPipelinesForm, user: str = Depends(get_admin_user)
+):
+    """
+    Imports and starts lazily registered pipelines (all of them if no ids are given)
+    """
+    pipeline_ids = form_data.ids or [
+        pipeline_id
+        for pipeline_id, pipeline in PIPELINE_MODULES.items()
+        if getattr(pipeline, "lazy", False)
+    ]
+    pipelines = await asyncio.gather(
+        *[ensure_loaded(pipeline_id) for pipeline_id in pipeline_ids]
+    )
+    return {
+        "status": True,
+        "data": {
+            pipeline_id: startup_report.pipelines.get(pipeline_id, {}).get(
+                "status", "ready" if pipeline else "not found"
+            )
+            for pipeline_id, pipeline in zip(pipeline_ids, pipelines)
+        },
+    }
+
+
+@app.get("/v1/pipelines/queues")
+@app.get("/pipelines/queues")
+async def get_pipeline_queues(user: str = Depends(get_current_user)):
+    """
+    Returns concurrency, queue depth and queue wait statistics per limited pipeline
+    """
+    return {"data": admission.stats()}
+
+
+@app.get("/v1/pipelines/cache")
+@app.get("/pipelines/cache")
+async def get_response_cache(user: str = Depends(get_current_user)):
+    """
+    Returns hit, miss and eviction statistics of the response cache
+    """
+    return {
+        "enabled": response_cache is not None,
+        "data": response_cache.stats() if response_cache is not None else None,
+    }
+
+
+@app.delete("/v1/pipelines/cache")
+@app.delete("/pipelines/cache")
+async def clear_response_cache(user: str = Depends(get_admin_user)):
+    if response_cache is not None:
+        await asyncio.to_thread(response_cache.clear)
+    return {"status": True}
+
+
+@app.post("/v1/batches")
+@app.post("/batches")
+async def create_batch(
+    file: UploadFile = File(...),
+    concurrency: int = PIPELINES_BATCH_CONCURRENCY,
+    limits: Optional[str] = None,
+    user: str = Depends(get_admin_user),
+):
+    """
+    Runs a JSONL file of chat completion requests in the background. `limits`
+    optionally sets the concurrency per pipeline as JSON.
+    """
+    try:
+        limits = json.loads(limits) if limits else None
+        batch = await asyncio.to_thread(
+            batch_manager.create, file.file, concurrency, limits
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+    batch_manager.start(batch)
+    return batch.to_dict()
+
+
+@app.get("/v1/batches")
+@app.get("/batches")
+async def list_batches(user: str = Depends(get_current_user)):
+    return {"data": [batch.to_dict() for batch in batch_manager.list()]}
+
+
+def get_batch_or_404(batch_id: str):
+    batch = batch_manager.get(batch_id)
+    if batch is None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Batch {batch_id} not found",
         )
+    return batch
+
+
+@app.get("/v1/batches/{batch_id}")
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str, user: str = Depends(get_current_user)):
+    """
+    Returns the status and progress of a batch
+    """
+    return get_batch_or_404(batch_id).to_dict()
+
+
+@app.get("/v1/batches/{batch_id}/output")
+@app.get("/batches/{batch_id}/output")
+async def get_batch_output(batch_id: str, user: str = Depends(get_current_user)):
+    """
+    Returns the results written so far as JSONL
+    """
+    batch = get_batch_or_404(batch_id)
+    if not os.path.exists(batch.output_path):
+        return PlainTextResponse("", media_type="application/jsonl")
+    return FileResponse(batch.output_path, media_type="application/jsonl")
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+@app.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str, user: str = Depends(get_admin_user)):
+    get_batch_or_404(batch_id)
+    if not batch_manager.cancel(batch_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Batch {batch_id} is not running on this worker",
+        )
+    return {"status": True}
 
 
 @app.get("/v1/{pipeline_id}/valves")
 @app.get("/{pipeline_id}/valves")
-async def get_valves(pipeline_id: str):
+async def get_valves(pipeline_id: str, user: str = Depends(get_current_user)):
     if pipeline_id not in PIPELINE_MODULES:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Pipeline {pipeline_id} not found",
         )
 
-    pipeline = PIPELINE_MODULES[pipeline_id]
+    pipeline = await ensure_loaded(pipeline_id)
 
     if hasattr(pipeline, "valves") is False:
         raise HTTPException(
@@ -527,14 +1037,14 @@ async def get_valves(pipeline_id: str):
 
 @app.get("/v1/{pipeline_id}/valves/spec")
 @app.get("/{pipeline_id}/valves/spec")
-async def get_valves_spec(pipeline_id: str):
+async def get_valves_spec(pipeline_id: str, user: str = Depends(get_current_user)):
     if pipeline_id not in PIPELINE_MODULES:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Pipeline {pipeline_id} not found",
         )
 
-    pipeline = PIPELINE_MODULES[pipeline_id]
+    pipeline = await ensure_loaded(pipeline_id)
 
     if hasattr(pipeline, "valves") is False:
         raise HTTPException(
@@ -547,7 +1057,9 @@ async def get_valves_spec(pipeline_id: str):
 
 @app.post("/v1/{pipeline_id}/valves/update")
 @app.post("/{pipeline_id}/valves/update")
-async def update_valves(pipeline_id: str, form_data: dict):
+async def update_valves(
+    pipeline_id: str, form_data: dict, user: str = Depends(get_admin_user)
+):
 
     if pipeline_id not in PIPELINE_MODULES:
         raise HTTPException(
@@ -555,7 +1067,7 @@ async def update_valves(pipeline_id: str, form_data: dict):
             detail=f"Pipeline {pipeline_id} not found",
         )
 
-    pipeline = PIPELINE_MODULES[pipeline_id]
+    pipeline = await ensure_loaded(pipeline_id)
 
     if hasattr(pipeline, "valves") is False:
         raise HTTPException(
@@ -566,18 +1078,20 @@ async def update_valves(pipeline_id: str, form_data: dict):
     try:
         ValvesModel = pipeline.valves.__class__
         valves = ValvesModel(**form_data)
-        pipeline.valves = valves
-
-        # Determine the directory path for the valves.json file
-        subfolder_path = os.path.join(PIPELINES_DIR, PIPELINE_NAMES[pipeline_id])
-        valves_json_path = os.path.join(subfolder_path, "valves.json")
 
-        # Save the updated valves data back to the valves.json file
-        with open(valves_json_path, "w") as f:
-            json.dump(valves.model_dump(), f)
+        await asyncio.to_thread(
+            valve_store.save, PIPELINE_NAMES[pipeline_id], valves.model_dump()
+        )
+        pipeline.valves = valves
 
         if hasattr(pipeline, "on_valves_updated"):
             await pipeline.on_valves_updated()
+
+        # Valves can change filter targets and manifold model lists
+        registry.invalidate(pipeline_id)
+        registry.rebuild(PIPELINE_MODULES)
+
+        await publish_change("valves", pipeline_id=pipeline_id)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -588,27 +1102,96 @@ async def update_valves(pipeline_id: str, form_data: dict):
     return pipeline.valves
 
 
+@app.get("/v1/{pipeline_id}/valves/history")
+@app.get("/{pipeline_id}/valves/history")
+async def get_valves_history(pipeline_id: str, user: str = Depends(get_current_user)):
+    """
+    Returns the stored versions of a pipeline's valves, newest first
+    """
+    if pipeline_id not in PIPELINE_MODULES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Pipeline {pipeline_id} not found",
+        )
+
+    history = await asyncio.to_thread(valve_store.history, PIPELINE_NAMES[pipeline_id])
+    return {"data": history}
+
+
+class RollbackValvesForm(BaseModel):
+    version: int
+
+
+@app.post("/v1/{pipeline_id}/valves/rollback")
+@app.post("/{pipeline_id}/valves/rollback")
+async def rollback_valves(
+    pipeline_id: str,
+    form_data: RollbackValvesForm,
+    user: str = Depends(get_admin_user),
+):
+    if pipeline_id not in PIPELINE_MODULES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Pipeline {pipeline_id} not found",
+        )
+
+    pipeline = await ensure_loaded(pipeline_id)
+
+    if hasattr(pipeline, "valves") is False:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Valves for {pipeline_id} not found",
+        )
+
+    try:
+        await asyncio.to_thread(
+            valve_store.rollback, PIPELINE_NAMES[pipeline_id], form_data.version
+        )
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Version {form_data.version} of the valves of {pipeline_id} not found",
+        )
+
+    await reload_valves(pipeline_id)
+    await publish_change("valves", pipeline_id=pipeline_id)
+    return pipeline.valves
+
+
 @app.post("/v1/{pipeline_id}/filter/inlet")
 @app.post("/{pipeline_id}/filter/inlet")
-async def filter_inlet(pipeline_id: str, form_data: FilterForm):
-    if pipeline_id not in app.state.PIPELINES:
+async def filter_inlet(
+    pipeline_id: str,
+    form_data: FilterForm,
+    request: Request,
+    user: str = Depends(get_inference_user),
+):
+    timing = request.state.timing
+    timing.mark("parse")
+    snapshot = registry.snapshot
+
+    if pipeline_id not in snapshot.pipelines:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Filter {pipeline_id} not found",
         )
 
     try:
-        pipeline = app.state.PIPELINES[form_data.body["model"]]
+        pipeline = snapshot.pipelines[form_data.body["model"]]
         if pipeline["type"] == "manifold":
             pipeline_id = pipeline_id.split(".")[0]
     except:
         pass
 
-    pipeline = PIPELINE_MODULES[pipeline_id]
+    pipeline = snapshot.modules[pipeline_id]
+    timing.mark("registry")
 
     try:
         if hasattr(pipeline, "inlet"):
-            body = await pipeline.inlet(form_data.body, form_data.user)
+            body = await call_filter(
+                pipeline_id, pipeline, "inlet", form_data.body, form_data.user
+            )
+            timing.mark("filter")
             return body
         else:
             return form_data.body
@@ -622,25 +1205,38 @@ async def filter_inlet(pipeline_id: str, form_data: FilterForm):
 
 @app.post("/v1/{pipeline_id}/filter/outlet")
 @app.post("/{pipeline_id}/filter/outlet")
-async def filter_outlet(pipeline_id: str, form_data: FilterForm):
-    if pipeline_id not in app.state.PIPELINES:
+async def filter_outlet(
+    pipeline_id: str,
+    form_data: FilterForm,
+    request: Request,
+    user: str = Depends(get_inference_user),
+):
+    timing = request.state.timing
+    timing.mark("parse")
+    snapshot = registry.snapshot
+
+    if pipeline_id not in snapshot.pipelines:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Filter {pipeline_id} not found",
         )
 
     try:
-        pipeline = app.state.PIPELINES[form_data.body["model"]]
+        pipeline = snapshot.pipelines[form_data.body["model"]]
         if pipeline["type"] == "manifold":
             pipeline_id = pipeline_id.split(".")[0]
     except:
         pass
 
-    pipeline = PIPELINE_MODULES[pipeline_id]
+    pipeline = snapshot.modules[pipeline_id]
+    timing.mark("registry")
 
     try:
         if hasattr(pipeline, "outlet"):
-            body = await pipeline.outlet(form_data.body, form_data.user)
+            body = await call_filter(
+                pipeline_id, pipeline, "outlet", form_data.body, form_data.user
+            )
+            timing.mark("filter")
             return body
         else:
             return form_data.body
@@ -652,132 +1248,631 @@ async def filter_outlet(pipeline_id: str, form_data: FilterForm):
         )
 
 
-@app.post("/v1/chat/completions")
-@app.post("/chat/completions")
-async def generate_openai_chat_completion(form_data: OpenAIChatCompletionForm):
-    messages = [message.model_dump() for message in form_data.messages]
+async def call_filter(filter_id: str, pipeline, hook: str, body: dict, user):
+    token = current_pipeline.set(filter_id)
+    start = time.perf_counter()
+    try:
+        return await getattr(pipeline, hook)(body, user)
+    finally:
+        FILTER_DURATION.observe(time.perf_counter() - start, filter_id, hook)
+        current_pipeline.reset(token)
+
+
+def new_stream_encoder(model: str) -> StreamEncoder:
+    return StreamEncoder(
+        model, coalesce_ms=STREAM_COALESCE_MS, coalesce_bytes=STREAM_COALESCE_BYTES
+    )
+
+
+def stream_chunk(encoder: StreamEncoder, line) -> str:
+    logger = current_logger()
+    if logger.isEnabledFor(logging.DEBUG) and chunk_log_sampler():
+        logger.debug("stream_content:Generator:%s", line)
+    return encoder.encode(line)
+
+
+def completion_response(model: str, message: str) -> dict:
+    current_logger().debug("stream:false:%s", message)
+    return {
+        "id": f"{model}-{str(uuid.uuid4())}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": message,
+                },
+                "logprobs": None,
+                "finish_reason": "stop",
+            }
+        ],
+    }
+
+
+def is_async_pipe(pipe) -> bool:
+    return inspect.iscoroutinefunction(pipe) or inspect.isasyncgenfunction(pipe)
+
+
+async def run_filter_chain(form_data: FilterChainForm, hook: str, timing: ServerTiming):
+    timing.mark("parse")
+    snapshot = registry.snapshot
+
+    model_id = form_data.model or form_data.body.get("model")
+    body = form_data.body
+
+    chain = snapshot.get_filter_chain(model_id)
+    timing.mark("registry")
+
+    for filter_id in chain:
+        pipeline = snapshot.modules[filter_id]
+
+        if not hasattr(pipeline, hook):
+            continue
+
+        try:
+            body = await call_filter(filter_id, pipeline, hook, body, form_data.user)
+        except Exception as e:
+            print(e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"{filter_id}: {str(e)}",
+            )
+
+    timing.mark("filter")
+    return body
+
+
+@app.post("/v1/filters/inlet")
+@app.post("/filters/inlet")
+async def filter_chain_inlet(
+    form_data: FilterChainForm, request: Request, user: str = Depends(get_inference_user)
+):
+    """
+    Runs the inlet of every filter attached to the model in priority order
+    """
+    return await run_filter_chain(form_data, "inlet", request.state.timing)
+
+
+@app.post("/v1/filters/outlet")
+@app.post("/filters/outlet")
+async def filter_chain_outlet(
+    form_data: FilterChainForm, request: Request, user: str = Depends(get_inference_user)
+):
+    """
+    Runs the outlet of every filter attached to the model in priority order
+    """
+    return await run_filter_chain(form_data, "outlet", request.state.timing)
+
+
+@app.post("/v1/chat/completions", openapi_extra=CHAT_REQUEST_OPENAPI)
+@app.post("/chat/completions", openapi_extra=CHAT_REQUEST_OPENAPI)
+async def generate_openai_chat_completion(
+    request: Request, user: str = Depends(get_inference_user)
+):
+    timing = request.state.timing
+    # The body is parsed once and shared by `messages` and `body`, see utils.pipelines.request
+    form_data = parse_chat_request(await request.body())
+    timing.mark("parse")
+
+    # Taken out of the body so it is not forwarded upstream by the pipe
+    requested_timeout = request.headers.get(
+        TIMEOUT_HEADER, form_data.body.pop(TIMEOUT_FIELD, None)
+    )
+
+    messages = form_data.messages
     user_message = get_last_user_message(messages)
 
+    snapshot = registry.snapshot
+
     if (
-        form_data.model not in app.state.PIPELINES
-        or app.state.PIPELINES[form_data.model]["type"] == "filter"
+        form_data.model not in snapshot.pipelines
+        or snapshot.pipelines[form_data.model]["type"] == "filter"
     ):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Pipeline {form_data.model} not found",
         )
 
-    def job():
-        print(form_data.model)
+    pipeline = snapshot.pipelines[form_data.model]
+    pipeline_id = form_data.model
 
-        pipeline = app.state.PIPELINES[form_data.model]
-        pipeline_id = form_data.model
+    module = snapshot.modules[pipeline["module"]]
+    if getattr(module, "lazy", False):
+        module = await ensure_loaded(pipeline["module"])
+        if module is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Pipeline {form_data.model} failed to load",
+            )
+    manifold_model_id = None
 
-        print(pipeline_id)
+    if pipeline["type"] == "manifold":
+        manifold_id, pipeline_id = pipeline_id.split(".", 1)
+        manifold_model_id = pipeline_id
+    timing.mark("registry")
 
-        if pipeline["type"] == "manifold":
-            manifold_id, pipeline_id = pipeline_id.split(".", 1)
-            pipe = PIPELINE_MODULES[manifold_id].pipe
-        else:
-            pipe = PIPELINE_MODULES[pipeline_id].pipe
+    labels = (pipeline["module"], form_data.model)
 
-        if form_data.stream:
+    timeouts = StreamTimeouts(
+        Deadline(
+            request_timeout(
+                requested_timeout,
+                pipeline_timeout(module, "request_timeout", PIPELINES_REQUEST_TIMEOUT),
+            )
+        ),
+        ttft=pipeline_timeout(module, "ttft_timeout", PIPELINES_TTFT_TIMEOUT),
+        idle=pipeline_timeout(module, "idle_timeout", PIPELINES_IDLE_TIMEOUT),
+    )
+
+    body = form_data.body
+
+    key = None
+    if response_cache is not None and is_cacheable(module, body):
+        key = cache_key(body)
+        cached = await response_cache.get(key)
+        timing.mark("cache")
+        if cached is not None:
+            REQUESTS.inc(*labels, "cached")
+            return replay_cached_response(cached)
+
+    def run():
+        return run_pipeline(
+            module,
+            form_data,
+            pipeline_id,
+            manifold_model_id,
+            user_message,
+            messages,
+            timing,
+            labels,
+            key,
+            timeouts,
+        )
 
-            def stream_content():
-                res = pipe(
-                    user_message=user_message,
-                    model_id=pipeline_id,
-                    messages=messages,
-                    body=form_data.model_dump(),
+    if single_flight is not None and getattr(module, "single_flight", True):
+        # Identical requests from the same user share one in-flight pipe call
+        response, leader = await single_flight.run(cache_key(body), run)
+        if not leader:
+            timing.mark("coalesced")
+            REQUESTS.inc(*labels, "coalesced")
+        return response
+
+    return await run()
+
+
+async def run_pipeline(
+    module,
+    form_data: ChatCompletionRequest,
+    pipeline_id: str,
+    manifold_model_id: Optional[str],
+    user_message: str,
+    messages: List[dict],
+    timing: ServerTiming,
+    labels,
+    key: Optional[str],
+    timeouts: StreamTimeouts,
+):
+    """
+    Admits the request, runs the pipe and instruments the response. `key` is
+    the response cache key of cacheable requests.
+
+    Admission and the pipe call are bounded by the request deadline, and for
+    streams by the time-to-first-chunk timeout, and fail with a 504 when they
+    run out of time. A stream's first chunk is only awaited once its response
+    exists, so a late first chunk, like any later timeout, ends the stream
+    with a "stop" finish chunk naming the limit in `pipelines_timeout`; a
+    stream only gets a 504 while it waits for admission.
+    """
+    pipe = module.pipe
+    # Attributes logs and print output of the pipe, including in worker threads
+    current_pipeline.set(labels[0])
+    current_deadline.set(timeouts.deadline)
+
+    def timed_out(kind: str):
+        REQUESTS.inc(*labels, "timeout")
+        TIMEOUTS.inc(*labels, kind)
+        return HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Pipeline {form_data.model} timed out ({kind})",
+        )
+
+    # The pipe call counts towards the first chunk of a stream
+    timeout, kind = timeouts.next_timeout(first=True)
+    if not form_data.stream:
+        timeout, kind = timeouts.deadline.remaining(), "deadline"
+
+    try:
+        async with asyncio.timeout(timeout):
+            ticket = await admission.admit(labels[0], module, manifold_model_id)
+    except AdmissionRejected as e:
+        REQUESTS.inc(*labels, "rejected")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except TimeoutError:
+        raise timed_out(kind)
+
+    timing.mark("admission")
+    current_admission.set(ticket)
+
+    REQUESTS_IN_FLIGHT.inc(*labels)
+    call_timeout = asyncio.timeout(timeout)
+    try:
+        async with call_timeout:
+            if is_async_pipe(pipe):
+                response = await run_async_pipe(
+                    pipe, form_data, pipeline_id, user_message, messages, timeouts
+                )
+            else:
+                # A sync pipe that overruns is left to finish in its thread
+                worker = WorkerCall(ticket)
+                response = await worker.run(
+                    partial(
+                        run_sync_pipe,
+                        pipe,
+                        form_data,
+                        pipeline_id,
+                        user_message,
+                        messages,
+                        timeouts,
+                    )
                 )
+        timing.mark("pipe")
+
+        if isinstance(response, StreamingResponse):
+            return await release_when_done(
+                response,
+                ticket,
+                timing,
+                labels,
+                on_complete=cache_stream(key) if key else None,
+                on_abort=lambda: cancel_pipe(module, form_data),
+                timeouts=timeouts,
+            )
+    except BaseException:
+        ticket.release()
+        REQUESTS_IN_FLIGHT.dec(*labels)
+        if call_timeout.expired():
+            cancel_pipe(module, form_data)
+            raise timed_out(kind)
+        REQUESTS.inc(*labels, "error")
+        raise
+
+    ticket.release()
+    REQUESTS_IN_FLIGHT.dec(*labels)
+    REQUESTS.inc(*labels, "ok")
+    REQUEST_DURATION.observe(timing.elapsed, *labels, "false")
+
+    if key and isinstance(response, dict):
+        await response_cache.set(key, {"stream": False, "response": response})
+    return response
 
-                logging.info(f"stream:true:{res}")
 
-                if isinstance(res, str):
-                    message = stream_message_template(form_data.model, res)
-                    logging.info(f"stream_content:str:{message}")
-                    yield f"data: {json.dumps(message)}\n\n"
+def replay_cached_response(cached: dict):
+    if cached["stream"]:
+        # The whole cached SSE body goes out as a single write
+        return StreamingResponse(iter([cached["body"]]), media_type="text/event-stream")
+    return cached["response"]
 
-                if isinstance(res, Iterator):
-                    for line in res:
-                        if isinstance(line, BaseModel):
-                            line = line.model_dump_json()
-                            line = f"data: {line}"
-
-                        try:
-                            line = line.decode("utf-8")
-                        except:
-                            pass
-
-                        logging.info(f"stream_content:Generator:{line}")
-
-                        if line.startswith("data:"):
-                            yield f"{line}\n\n"
-                        else:
-                            line = stream_message_template(form_data.model, line)
-                            yield f"data: {json.dumps(line)}\n\n"
-
-                if isinstance(res, str) or isinstance(res, Generator):
-                    finish_message = {
-                        "id": f"{form_data.model}-{str(uuid.uuid4())}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": form_data.model,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {},
-                                "logprobs": None,
-                                "finish_reason": "stop",
-                            }
-                        ],
-                    }
-
-                    yield f"data: {json.dumps(finish_message)}\n\n"
-                    yield f"data: [DONE]"
-
-            return StreamingResponse(stream_content(), media_type="text/event-stream")
-        else:
+
+def cache_stream(key: str):
+    async def on_complete(chunks: list):
+        body = "".join(
+            chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+            for chunk in chunks
+        )
+        await response_cache.set(key, {"stream": True, "body": body})
+
+    return on_complete
+
+
+# Strong references to fire-and-forget tasks, which asyncio only holds weakly
+cancellation_tasks = set()
+
+
+def cancel_pipe(module, form_data: ChatCompletionRequest):
+    """
+    Calls the optional `on_cancel(body)` hook of a pipeline whose streamed
+    response was abandoned by its client, so it can abort its upstream call.
+    The hook runs in a task of its own, as the request's task is being
+    cancelled.
+    """
+    on_cancel = getattr(module, "on_cancel", None)
+    if on_cancel is None:
+        return
+
+    async def run():
+        try:
+            if inspect.iscoroutinefunction(on_cancel):
+                await on_cancel(form_data.body)
+            else:
+                await run_in_threadpool(on_cancel, form_data.body)
+        except Exception as e:
+            current_logger().error("on_cancel failed: %s", e)
+
+    task = asyncio.create_task(run())
+    cancellation_tasks.add(task)
+    task.add_done_callback(cancellation_tasks.discard)
+
+
+class WorkerCall:
+    """
+    A sync pipe call in a worker thread. When the request stops waiting for it
+    (a timeout or a disconnect), the call keeps running in its thread, so it
+    holds the request's admission slot until the thread returns.
+    """
+
+    def __init__(self, ticket: Admission):
+        self.ticket = ticket
+        self.loop = asyncio.get_running_loop()
+        self.finished = False
+        self.unhold = None
+
+    async def run(self, func):
+        try:
+            return await to_thread.run_sync(partial(self.call, func), **ABANDON_ON_CANCEL)
+        except BaseException:
+            if not self.finished:
+                self.unhold = self.ticket.hold()
+                current_logger().warning(
+                    "Pipe call abandoned, its slot is held until its thread returns"
+                )
+            raise
+
+    def call(self, func):
+        try:
+            return func()
+        finally:
+            # Set here so a call that returned is never taken for an abandoned one
+            self.finished = True
+            try:
+                self.loop.call_soon_threadsafe(self.on_finished)
+            except RuntimeError:
+                # The event loop is already closed
+                pass
+
+    def on_finished(self):
+        if self.unhold is not None:
+            self.unhold()
+
+
+async def release_when_done(
+    response: StreamingResponse,
+    ticket: Admission,
+    timing: ServerTiming,
+    labels,
+    on_complete=None,
+    on_abort=None,
+    timeouts: Optional[StreamTimeouts] = None,
+):
+    """
+    Holds the admission slot until a streaming response has been fully sent and
+    records its streaming metrics. `on_complete` is awaited with every chunk
+    once a stream has been sent in full, `on_abort` is called when the client
+    goes away or the stream times out before that.
+
+    The first chunk is produced before the response is returned, so the
+    time-to-first-chunk is part of the `Server-Timing` header and a pipe that
+    fails before producing anything gets a proper error response.
+    """
+    body_iterator = response.body_iterator
+
+    try:
+        first_chunk = await body_iterator.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    first_chunk_at = timing.mark("first_byte")
+    TIME_TO_FIRST_CHUNK.observe(first_chunk_at, *labels)
+
+    async def release_after_stream():
+        chunks = 0
+        sent = [] if on_complete is not None else None
+        outcome = "error"
+        try:
+            if first_chunk is not None:
+                chunks += 1
+                yield first_chunk
+                if sent is not None:
+                    sent.append(first_chunk)
+                async for chunk in body_iterator:
+                    chunks += 1
+                    yield chunk
+                    if sent is not None:
+                        sent.append(chunk)
+            if timeouts is not None and timeouts.expired:
+                outcome = "timeout"
+                TIMEOUTS.inc(*labels, timeouts.expired)
+                if on_abort is not None:
+                    on_abort()
+            else:
+                outcome = "ok"
+                if on_complete is not None:
+                    await on_complete(sent)
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            STREAMS_ABORTED.inc(*labels)
+            if on_abort is not None:
+                on_abort()
+            # Closes the pipe's iterator if it is suspended rather than cancelled
+            await aclose_iterator(body_iterator)
+            raise
+        finally:
+            ticket.release()
+            elapsed = timing.elapsed
+            streaming = elapsed - first_chunk_at
+            if chunks > 1 and streaming > 0:
+                STREAM_CHUNK_RATE.observe((chunks - 1) / streaming, *labels)
+            STREAM_CHUNKS.inc(*labels, amount=chunks)
+            REQUEST_DURATION.observe(elapsed, *labels, "true")
+            REQUESTS.inc(*labels, outcome)
+            REQUESTS_IN_FLIGHT.dec(*labels)
+
+    response.body_iterator = release_after_stream()
+    return response
+
+
+def stream_timeout(encoder: StreamEncoder):
+    def on_timeout(kind: str) -> str:
+        current_logger().warning("Stream timed out (%s)", kind)
+        # "timeout" is not an OpenAI finish reason, so the limit that was hit goes in a field.
+        # The buffer is not flushed: the timed-out producer may still be appending to it.
+        return encoder.finish("stop", {"pipelines_timeout": kind}, flush=False)
+
+    return on_timeout
+
+
+def run_sync_pipe(pipe, form_data, pipeline_id, user_message, messages, timeouts=None):
+    current_logger().debug("pipe:%s:%s", form_data.model, pipeline_id)
+
+    if form_data.stream:
+        encoder = new_stream_encoder(form_data.model)
+
+        def stream_content():
             res = pipe(
                 user_message=user_message,
                 model_id=pipeline_id,
                 messages=messages,
-                body=form_data.model_dump(),
+                body=form_data.body,
             )
-            logging.info(f"stream:false:{res}")
 
-            if isinstance(res, dict):
-                return res
-            elif isinstance(res, BaseModel):
-                return res.model_dump()
-            else:
+            current_logger().debug("stream:true:%s", res)
+
+            if isinstance(res, str):
+                current_logger().debug("stream_content:str:%s", res)
+                yield encoder.content(res)
+
+            if isinstance(res, Iterator):
+                try:
+                    for line in res:
+                        chunk = stream_chunk(encoder, line)
+                        if chunk:
+                            yield chunk
+                finally:
+                    # Also runs when the client disconnects mid-stream
+                    close_iterator(res)
+
+            if isinstance(res, str) or isinstance(res, Generator):
+                yield encoder.finish()
+            elif encoder.coalescing:
+                yield encoder.flush()
+
+        labels = (current_pipeline.get(), form_data.model)
+        content = iterate_in_thread(
+            stream_content(),
+            on_abandoned=lambda: ABANDONED_CHUNKS.inc(*labels),
+            hold=admission_hold(),
+        )
+        if timeouts is not None:
+            content = with_timeouts(content, timeouts, stream_timeout(encoder))
+        return StreamingResponse(content, media_type="text/event-stream")
+    else:
+        res = pipe(
+            user_message=user_message,
+            model_id=pipeline_id,
+            messages=messages,
+            body=form_data.body,
+        )
+        current_logger().debug("stream:false:%s", res)
 
-                message = ""
+        if isinstance(res, dict):
+            return res
+        elif isinstance(res, BaseModel):
+            return res.model_dump()
+        else:
 
-                if isinstance(res, str):
-                    message = res
+            message = ""
 
-                if isinstance(res, Generator):
-                    for stream in res:
-                        message = f"{message}{stream}"
+            if isinstance(res, str):
+                message = res
+
+            if isinstance(res, Generator):
+                for stream in res:
+                    message = f"{message}{stream}"
+
+            return completion_response(form_data.model, message)
 
-                logging.info(f"stream:false:{message}")
-                return {
-                    "id": f"{form_data.model}-{str(uuid.uuid4())}",
-                    "object": "chat.completion",
-                    "created": int(time.time()),
-                    "model": form_data.model,
-                    "choices": [
-                        {
-                            "index": 0,
-                            "message": {
-                                "role": "assistant",
-                                "content": message,
-                            },
-                            "logprobs": None,
-                            "finish_reason": "stop",
-                        }
-                    ],
-                }
 
-    return await run_in_threadpool(job)
+async def run_async_pipe(
+    pipe, form_data, pipeline_id, user_message, messages, timeouts=None
+):
+    """
+    Runs an `async def pipe` (or async generator pipe) directly on the event loop
+    instead of occupying a threadpool worker for the lifetime of the response.
+    """
+    res = pipe(
+        user_message=user_message,
+        model_id=pipeline_id,
+        messages=messages,
+        body=form_data.body,
+    )
+    if inspect.isawaitable(res):
+        res = await res
+
+    if form_data.stream:
+        current_logger().debug("stream:true:%s", res)
+        labels = (current_pipeline.get(), form_data.model)
+        encoder = new_stream_encoder(form_data.model)
+
+        async def stream_content():
+
+            if isinstance(res, str):
+                current_logger().debug("stream_content:str:%s", res)
+                yield encoder.content(res)
+
+            if isinstance(res, AsyncIterator):
+                lines = res
+            elif isinstance(res, Iterator):
+                # Sync iterators returned from async pipes may still block
+                lines = iterate_in_thread(
+                    res,
+                    on_abandoned=lambda: ABANDONED_CHUNKS.inc(*labels),
+                    hold=admission_hold(),
+                )
+            else:
+                lines = None
+
+            if lines is not None:
+                try:
+                    async for line in lines:
+                        chunk = stream_chunk(encoder, line)
+                        if chunk:
+                            yield chunk
+                finally:
+                    # Also runs when the client disconnects mid-stream
+                    await aclose_iterator(lines)
+
+            if isinstance(res, (str, Generator, AsyncGenerator)):
+                yield encoder.finish()
+            elif encoder.coalescing:
+                yield encoder.flush()
+
+        content = stream_content()
+        if timeouts is not None:
+            content = with_timeouts(content, timeouts, stream_timeout(encoder))
+        return StreamingResponse(content, media_type="text/event-stream")
+
+    current_logger().debug("stream:false:%s", res)
+
+    if isinstance(res, dict):
+        return res
+    elif isinstance(res, BaseModel):
+        return res.model_dump()
+
+    message = ""
+
+    if isinstance(res, str):
+        message = res
+
+    if isinstance(res, AsyncGenerator):
+        async for stream in res:
+            message = f"{message}{stream}"
+    elif isinstance(res, Generator):
+        async for stream in iterate_in_thread(res, hold=admission_hold()):
+            message = f"{message}{stream}"
+
+    return completion_response(form_data.model, message)
@@ -19,4 +19,11 @@ class OpenAIChatCompletionForm(BaseModel):
 class FilterForm(BaseModel):
     body: dict
     user: Optional[dict] = None
-    model_config = ConfigDict(extra="allow")
\ No newline at end of file
+    model_config = ConfigDict(extra="allow")
+
+class FilterChainForm(BaseModel):
+    # Target model id, defaults to body["model"]
+    model: Optional[str] = None
+    body: dict
+    user: Optional[dict] = None
+    model_config = ConfigDict(extra="allow")
@@ -81,31 +81,6 @@ download_pipelines() {
   fi
 }
 
-# Function to parse and install requirements from frontmatter
-install_frontmatter_requirements() {
-  local file=$1
-  local file_content=$(cat "$1")
-  # Extract the first triple-quoted block
-  local first_block=$(echo "$file_content" | awk '/"""/{flag=!flag; if(flag) count++; if(count == 2) {exit}} flag' )
-
-  # Check if the block contains requirements
-  local requirements=$(echo "$first_block" | grep -i 'requirements:')
-
-  if [ -n "$requirements" ]; then
-    # Extract the requirements list
-    requirements=$(echo "$requirements" | awk -F': ' '{print $2}' | tr ',' ' ' | tr -d '\r')
-
-    # Construct and echo the pip install command
-    local pip_command="pip install $requirements"
-    echo "$pip_command"
-    pip install $requirements
-  else
-    echo "No requirements found in frontmatter of $file."
-  fi
-}
-
-
-
 # Check if PIPELINES_URLS environment variable is set and non-empty
 if [[ -n "$PIPELINES_URLS" ]]; then
   if [ ! -d "$PIPELINES_DIR" ]; then
@@ -114,15 +89,33 @@ if [[ -n "$PIPELINES_URLS" ]]; then
 
   # Split PIPELINES_URLS by ';' and iterate over each path
   IFS=';' read -ra ADDR <<< "$PIPELINES_URLS"
-  for path in "${ADDR[@]}"; do
-    download_pipelines "$path" "$PIPELINES_DIR"
-  done
 
-  for file in "$pipelines_dir"/*; do
-    if [[ -f "$file" ]]; then
-      install_frontmatter_requirements "$file"
+  if [ "$PIPELINES_DOWNLOAD_MODE" = "serial" ]; then
+    for path in "${ADDR[@]}"; do
+      download_pipelines "$path" "$PIPELINES_DIR"
+    done
+  else
+    # Files are fetched concurrently over one connection pool, streamed to temporary files and
+    # renamed into place once complete; URLs may end with #sha256=<hex digest> to verify them.
+    # Folders are still cloned with git.
+    file_urls=()
+    for path in "${ADDR[@]}"; do
+      path=$(echo "$path" | sed 's/^"//;s/"$//')
+      if [[ "$path" =~ ^https://github.com/.*/.*/tree/.* ]]; then
+        download_pipelines "$path" "$PIPELINES_DIR"
+      else
+        file_urls+=("$path")
+      fi
+    done
+
+    if [ ${#file_urls[@]} -gt 0 ]; then
+      python -m utils.pipelines.install "$PIPELINES_DIR" "${file_urls[@]}"
     fi
-  done
+  fi
+
+  # Install the frontmatter requirements of all pipelines in one batch; requirement
+  # sets that are already satisfied are skipped using a marker cache
+  python -m utils.pipelines.requirements "$PIPELINES_DIR"
 else
   echo "PIPELINES_URLS not specified. Skipping pipelines download and installation."
 fi
@@ -130,4 +123,6 @@ fi
 
 
 # Start the server
-uvicorn main:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*'
+# Set PIPELINES_WORKERS to run several worker processes; they keep their valves and
+# pipelines in sync through PIPELINES_STATE_DIR
+uvicorn main:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*' --workers "${PIPELINES_WORKERS:-1}"
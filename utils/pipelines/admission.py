@@ -0,0 +1,268 @@
+import asyncio
+import contextvars
+import math
+import time
+
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class PipelineLimiter:
+    """
+    Concurrency limit for a single pipeline (or manifold model) with a bounded
+    FIFO queue in front of it. Slots are handed over directly to the oldest
+    waiter on release, so a burst of new arrivals cannot overtake the queue.
+    """
+
+    def __init__(self, limit: int, max_queue_size: int, max_queue_wait: float):
+        self.limit = limit
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+
+        self.active = 0
+        self._waiters = deque()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # Exponentially weighted average of how long a slot is held, used for Retry-After
+        self.hold_seconds_avg = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def configure(self, limit: int, max_queue_size: int, max_queue_wait: float):
+        self.limit = limit
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self._wake()
+
+    def retry_after(self) -> int:
+        if self.limit <= 0:
+            return 1
+        estimate = self.hold_seconds_avg * (self.queue_depth + 1) / self.limit
+        return max(1, math.ceil(estimate))
+
+    def _wake(self):
+        while self._waiters and (self.limit <= 0 or self.active < self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    async def acquire(self, name: str):
+        start = time.monotonic()
+
+        if not self._waiters and (self.limit <= 0 or self.active < self.limit):
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue_size:
+            self.rejected += 1
+            raise AdmissionRejected(
+                f"Too many requests queued for {name}", self.retry_after()
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_queue_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on.
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+            self.timed_out += 1
+            raise AdmissionRejected(
+                f"Timed out waiting for a free slot on {name}", self.retry_after()
+            )
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def release(self, held: Optional[float] = None):
+        if held is not None:
+            self.hold_seconds_avg = 0.8 * self.hold_seconds_avg + 0.2 * held
+
+        self.active -= 1
+        self._wake()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "max_queue_wait": self.max_queue_wait,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+class Admission:
+    """
+    Slots held by one request; `release` is idempotent. Work the request
+    abandoned in a worker thread can `hold` the slots past `release` until the
+    thread returns, so the limits bound threads doing upstream work.
+    """
+
+    def __init__(self, limiters: List[PipelineLimiter]):
+        self.limiters = limiters
+        self.start = time.monotonic()
+        self.released = False
+        self.holds = 0
+        self._freed = False
+
+    def hold(self) -> Callable[[], None]:
+        """Keeps the slots taken until the returned callback is called (on the event loop)."""
+        self.holds += 1
+        done = False
+
+        def unhold():
+            nonlocal done
+            if done:
+                return
+            done = True
+            self.holds -= 1
+            self._free()
+
+        return unhold
+
+    def release(self):
+        self.released = True
+        self._free()
+
+    def _free(self):
+        if self._freed or not self.released or self.holds:
+            return
+        self._freed = True
+
+        held = time.monotonic() - self.start
+        for limiter in reversed(self.limiters):
+            limiter.release(held)
+
+
+# Admission of the request being handled, for work that may outlive it
+current_admission: contextvars.ContextVar[Optional[Admission]] = contextvars.ContextVar(
+    "current_admission", default=None
+)
+
+
+def admission_hold() -> Optional[Callable[[], Callable[[], None]]]:
+    """`hold` of the current request's admission, if it has one."""
+    admission = current_admission.get()
+    return admission.hold if admission is not None else None
+
+
+class AdmissionController:
+    """
+    Per-pipeline and per-manifold-model concurrency limits. The limits and
+    queues are kept per worker process, so with several workers a pipeline
+    may run up to its limit times the number of workers.
+
+    Limits are resolved on every admission so valve updates apply immediately:
+      1. the pipeline's valves (`concurrency_limit`, and for manifold models
+         `concurrency_limits` keyed by the model id),
+      2. the `PIPELINES_CONCURRENCY_LIMITS` JSON mapping from the environment,
+      3. the `PIPELINES_CONCURRENCY_LIMIT` default (0 means unlimited).
+    """
+
+    def __init__(
+        self,
+        default_limit: int = 0,
+        max_queue_size: int = 100,
+        max_queue_wait: float = 30,
+        limits: Optional[Dict[str, int]] = None,
+    ):
+        self.default_limit = default_limit
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self.limits = limits or {}
+
+        self.limiters: Dict[str, PipelineLimiter] = {}
+
+    def resolve_limit(self, key: str, pipeline, model_id: Optional[str] = None) -> int:
+        valves = getattr(pipeline, "valves", None)
+
+        if model_id is not None:
+            model_limits = getattr(valves, "concurrency_limits", None) or {}
+            if model_id in model_limits:
+                return int(model_limits[model_id])
+        elif getattr(valves, "concurrency_limit", None) is not None:
+            return int(valves.concurrency_limit)
+
+        if key in self.limits:
+            return int(self.limits[key])
+
+        return self.default_limit if model_id is None else 0
+
+    def _limiter(self, key: str, limit: int) -> PipelineLimiter:
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            limiter = PipelineLimiter(limit, self.max_queue_size, self.max_queue_wait)
+            self.limiters[key] = limiter
+        elif limiter.limit != limit:
+            limiter.configure(limit, self.max_queue_size, self.max_queue_wait)
+        return limiter
+
+    async def admit(
+        self, pipeline_id: str, pipeline, manifold_model_id: Optional[str] = None
+    ) -> Admission:
+        """
+        Waits for a slot on the pipeline and, for manifolds, on the model.
+        Raises AdmissionRejected when a queue is full or the wait times out.
+
+        The model slot is taken first, so requests queued on one saturated
+        model do not hold the manifold's slots and starve its other models.
+        """
+        keys = []
+        if manifold_model_id is not None:
+            model_key = f"{pipeline_id}.{manifold_model_id}"
+            keys.append(
+                (model_key, self.resolve_limit(model_key, pipeline, manifold_model_id))
+            )
+        keys.append((pipeline_id, self.resolve_limit(pipeline_id, pipeline)))
+
+        admission = Admission([])
+        try:
+            for key, limit in keys:
+                if limit <= 0 and key not in self.limiters:
+                    continue
+                limiter = self._limiter(key, limit)
+                await limiter.acquire(key)
+                admission.limiters.append(limiter)
+        except BaseException:
+            admission.release()
+            raise
+
+        admission.start = time.monotonic()
+        return admission
+
+    def stats(self) -> Dict[str, dict]:
+        return {key: limiter.stats() for key, limiter in self.limiters.items()}
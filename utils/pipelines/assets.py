@@ -0,0 +1,371 @@
+"""
+Content-addressed cache of the images in chat messages.
+
+Chat clients send the whole history on every turn, so the same images arrive
+again and again, inline as base64 `data:` URLs or as remote URLs. Providers
+load them through `load_image` / `load_images` and get an `ImageAsset` with
+the decoded bytes, so an image seen before costs a hash instead of a decode
+or a download:
+
+    from utils.pipelines.assets import load_images
+
+    for asset in load_images([item["image_url"]["url"] for item in images]):
+        parts.append(Part.from_data(data=asset.data, mime_type=asset.mime_type))
+
+Inline images are keyed by the SHA-256 of their payload and remote images by
+the SHA-256 of their URL. Assets are kept in a memory LRU bounded in bytes
+and, with PIPELINES_ASSET_CACHE_DIR set, in a bounded directory shared by the
+workers. Remote images are fetched concurrently over one pooled HTTP client,
+and concurrent loads of the same image share a single fetch.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+import httpx
+
+from config import (
+    PIPELINES_ASSET_CACHE_DIR,
+    PIPELINES_ASSET_CACHE_DISK_SIZE,
+    PIPELINES_ASSET_CACHE_SIZE,
+    PIPELINES_ASSET_FETCH_CONCURRENCY,
+    PIPELINES_ASSET_MAX_SIZE,
+)
+
+
+class AssetError(ValueError):
+    pass
+
+
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def sniff_mime_type(data: bytes, fallback: Optional[str] = None) -> str:
+    """The image type given by the first bytes of `data`, else `fallback` or image/jpeg."""
+    for magic, mime_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return fallback or "image/jpeg"
+
+
+class ImageAsset:
+    """The decoded bytes of an image with its type and cache key."""
+
+    __slots__ = ("key", "data", "mime_type", "_base64")
+
+    def __init__(self, key: str, data: bytes, mime_type: str, encoded: Optional[str] = None):
+        self.key = key
+        self.data = data
+        self.mime_type = mime_type
+        self._base64 = encoded
+
+    @property
+    def format(self) -> str:
+        """The subtype of the image, e.g. "png" or "jpeg"."""
+        return self.mime_type.split("/", 1)[-1]
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + (len(self._base64) if self._base64 else 0)
+
+
+def asset_key(source: str) -> str:
+    """
+    Cache key of an image source: the hash of the base64 payload of inline
+    images and of the URL of remote ones.
+    """
+    if source.startswith("data:"):
+        source = source.partition(",")[2]
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class AssetCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 0,
+        max_asset_bytes: int = 20 * 1024 * 1024,
+        concurrency: int = 8,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory or None
+        self.max_disk_bytes = max_disk_bytes
+        self.max_asset_bytes = max_asset_bytes
+        self.concurrency = concurrency
+
+        self.entries: "OrderedDict[str, ImageAsset]" = OrderedDict()
+        self.size = 0
+        # Key and size of the files in `directory`, oldest first, read on first use
+        self.files: Optional["OrderedDict[str, int]"] = None
+        self.files_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._pending: dict = {}
+        self._client: Optional[httpx.Client] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    follow_redirects=True,
+                    timeout=httpx.Timeout(60, connect=10),
+                    limits=httpx.Limits(max_connections=self.concurrency),
+                )
+            return self._client
+
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.concurrency, thread_name_prefix="pipelines-assets"
+                )
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def load_image(self, source: str) -> ImageAsset:
+        """
+        Returns the image of a `data:` URL, an http(s) URL or a bare base64
+        payload (as in Ollama's `images`). Raises AssetError when it cannot be
+        decoded or downloaded.
+        """
+        key = asset_key(source)
+
+        with self._lock:
+            asset = self.entries.get(key)
+            if asset is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return asset
+
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = future = Future()
+                self.misses += 1
+
+        if pending is not None:
+            return pending.result()
+
+        try:
+            asset = self.read(key)
+            if asset is None:
+                asset = self.decode(key, source)
+                self.write(asset)
+            self.remember(asset)
+            future.set_result(asset)
+            return asset
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def load_images(self, sources: Iterable[str]) -> List[ImageAsset]:
+        """Loads many images, fetching the remote ones concurrently, in order."""
+        sources = list(sources)
+        if sum(1 for source in sources if is_remote(source)) < 2:
+            return [self.load_image(source) for source in sources]
+        return list(self.executor().map(self.load_image, sources))
+
+    async def aload_images(self, sources: Iterable[str]) -> List[ImageAsset]:
+        """Like `load_images`, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        executor = self.executor()
+        return await asyncio.gather(
+            *[loop.run_in_executor(executor, self.load_image, source) for source in sources]
+        )
+
+    def decode(self, key: str, source: str) -> ImageAsset:
+        if is_remote(source):
+            return self.fetch(key, source)
+
+        mime_type = None
+        if source.startswith("data:"):
+            header, _, source = source.partition(",")
+            mime_type = header[len("data:") :].split(";", 1)[0] or None
+
+        try:
+            data = base64.b64decode(source, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise AssetError(f"Invalid base64 image: {e}")
+        return ImageAsset(key, data, sniff_mime_type(data, mime_type), encoded=source)
+
+    def fetch(self, key: str, url: str) -> ImageAsset:
+        self.fetches += 1
+        try:
+            with self.client().stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise AssetError(f"Failed to fetch {url} ({response.status_code})")
+
+                chunks = []
+                size = 0
+                for chunk in response.iter_bytes():
+                    size += len(chunk)
+                    if size > self.max_asset_bytes:
+                        raise AssetError(f"{url} is larger than {self.max_asset_bytes} bytes")
+                    chunks.append(chunk)
+                content_type = response.headers.get("content-type", "").split(";")[0]
+        except httpx.HTTPError as e:
+            raise AssetError(f"Failed to fetch {url}: {e}")
+
+        data = b"".join(chunks)
+        fallback = content_type if content_type.startswith("image/") else None
+        return ImageAsset(key, data, sniff_mime_type(data, fallback))
+
+    def remember(self, asset: ImageAsset):
+        with self._lock:
+            previous = self.entries.pop(asset.key, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.entries[asset.key] = asset
+            self.size += asset.size
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def scan(self):
+        # Must be called with the lock held
+        if self.files is not None:
+            return
+        found = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, filename, stat.st_size))
+        self.files = OrderedDict((key, size) for _, key, size in sorted(found))
+        self.files_size = sum(self.files.values())
+
+    def read(self, key: str) -> Optional[ImageAsset]:
+        if not self.directory:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                mime_type, _, data = f.read().partition(b"\n")
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self.scan()
+            if key in self.files:
+                self.files.move_to_end(key)
+        return ImageAsset(key, data, mime_type.decode("ascii"))
+
+    def write(self, asset: ImageAsset):
+        if not self.directory or len(asset.data) > self.max_disk_bytes:
+            return
+
+        path = self.path(asset.key)
+        tmp_path = os.path.join(os.path.dirname(path), f".{asset.key}.{uuid.uuid4().hex}")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(asset.mime_type.encode("ascii") + b"\n")
+                f.write(asset.data)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logging.warning(f"Failed to persist image {asset.key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self.scan()
+            self.files_size += size - self.files.pop(asset.key, 0)
+            self.files[asset.key] = size
+            while self.files_size > self.max_disk_bytes and len(self.files) > 1:
+                key, size = self.files.popitem(last=False)
+                self.files_size -= size
+                try:
+                    os.remove(self.path(key))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "evictions": self.evictions,
+        }
+
+
+def is_remote(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+image_cache = AssetCache(
+    PIPELINES_ASSET_CACHE_SIZE,
+    directory=PIPELINES_ASSET_CACHE_DIR,
+    max_disk_bytes=PIPELINES_ASSET_CACHE_DISK_SIZE,
+    max_asset_bytes=PIPELINES_ASSET_MAX_SIZE,
+    concurrency=PIPELINES_ASSET_FETCH_CONCURRENCY,
+)
+
+
+def load_image(source: str) -> ImageAsset:
+    return image_cache.load_image(source)
+
+
+def load_images(sources: Iterable[str]) -> List[ImageAsset]:
+    return image_cache.load_images(sources)
+
+
+async def aload_images(sources: Iterable[str]) -> List[ImageAsset]:
+    return await image_cache.aload_images(sources)
@@ -2,45 +2,61 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import HTTPException, status, Depends
 
 
-from pydantic import BaseModel
-from typing import Union, Optional
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Union
 
 
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-import jwt
-import logging
+import hashlib
+import hmac
 import os
+import time
 
-import requests
-import uuid
 
-
-from config import API_KEY, PIPELINES_DIR
+from config import API_KEY, API_KEYS
 
 
 SESSION_SECRET = os.getenv("SESSION_SECRET", " ")
 ALGORITHM = "HS256"
 
+ADMIN = "admin"
+INFERENCE = "inference"
+
 ##############
 # Auth Utils
 ##############
 
 bearer_security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# passlib and jwt are only imported once they are needed, as neither is used to
+# authenticate API keys
+_pwd_context = None
+
+
+def pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 
 def verify_password(plain_password, hashed_password):
     return (
-        pwd_context.verify(plain_password, hashed_password) if hashed_password else None
+        pwd_context().verify(plain_password, hashed_password)
+        if hashed_password
+        else None
     )
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
 def create_token(data: dict, expires_delta: Union[timedelta, None] = None) -> str:
+    import jwt
+
     payload = data.copy()
 
     if expires_delta:
@@ -52,6 +68,8 @@ def create_token(data: dict, expires_delta: Union[timedelta, None] = None) -> st
 
 
 def decode_token(token: str) -> Optional[dict]:
+    import jwt
+
     try:
         decoded = jwt.decode(token, SESSION_SECRET, algorithms=[ALGORITHM])
         return decoded
@@ -63,15 +81,143 @@ def extract_token_from_auth_header(auth_header: str):
     return auth_header[len("Bearer ") :]
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_security),
-) -> Optional[dict]:
-    token = credentials.credentials
+def key_digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+def with_implied_scopes(scopes) -> FrozenSet[str]:
+    """A scope or list of scopes as a set, where admin also grants inference."""
+    scopes = frozenset([scopes] if isinstance(scopes, str) else scopes)
+    if ADMIN in scopes:
+        scopes |= {INFERENCE}
+    return scopes
+
+
+def build_key_index(api_key: str, api_keys: Dict[str, object]) -> Dict[bytes, FrozenSet[str]]:
+    """
+    Maps the SHA-256 digest of every accepted API key to its scopes. Keys in
+    `api_keys` can be given in plain text or as "sha256:<hex digest>", with a
+    scope or a list of scopes each; `api_key` always has every scope.
+    """
+    index = {key_digest(api_key): frozenset({ADMIN, INFERENCE})}
+
+    for key, scopes in api_keys.items():
+        scopes = with_implied_scopes(scopes)
+
+        if key.startswith("sha256:"):
+            digest = bytes.fromhex(key[len("sha256:") :])
+        else:
+            digest = key_digest(key)
+        index[digest] = scopes
+    return index
+
+
+key_index = build_key_index(API_KEY, API_KEYS)
+
+
+class TokenCache:
+    """LRU cache of decoded JWTs by token, honouring their expiry."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+
+        payload, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.entries[token]
+            return None
+
+        self.entries.move_to_end(token)
+        return payload
+
+    def set(self, token: str, payload: dict):
+        expires_at = payload.get("exp")
+        self.entries[token] = (payload, float(expires_at) if expires_at else None)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
 
-    if token != API_KEY:
+token_cache = TokenCache()
+
+
+def token_scopes(token: str) -> Optional[FrozenSet[str]]:
+    """
+    Scopes of a JWT signed with SESSION_SECRET, taken from its `scopes` claim
+    (inference only by default). JWTs are only accepted once SESSION_SECRET is
+    set.
+    """
+    if not SESSION_SECRET.strip() or token.count(".") != 2:
+        return None
+
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = decode_token(token)
+        if payload is None:
+            return None
+        token_cache.set(token, payload)
+
+    scopes = payload.get("scopes", [INFERENCE])
+    return with_implied_scopes(scopes)
+
+
+def authenticate(token: str) -> Optional[FrozenSet[str]]:
+    """Scopes granted to a bearer token, or None if it is not accepted."""
+    digest = key_digest(token)
+    # Compares against every key without stopping early, so neither the
+    # comparison nor the number of comparisons depends on the token
+    granted = None
+    for known, scopes in key_index.items():
+        if hmac.compare_digest(digest, known):
+            granted = scopes
+    if granted is not None:
+        return granted
+    return token_scopes(token)
+
+
+def require_scope(token: str, scope: Optional[str], detail: str = "") -> str:
+    scopes = authenticate(token)
+
+    if scopes is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
         )
+    if scope is not None and scope not in scopes:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=detail,
+        )
 
     return token
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_security),
+) -> Optional[dict]:
+    return require_scope(credentials.credentials, None)
+
+
+async def get_inference_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_security),
+) -> Optional[dict]:
+    return require_scope(
+        credentials.credentials,
+        INFERENCE,
+        "This API key is not allowed to run pipelines",
+    )
+
+
+async def get_admin_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_security),
+) -> Optional[dict]:
+    return require_scope(
+        credentials.credentials,
+        ADMIN,
+        "This API key is not allowed to manage pipelines",
+    )
@@ -0,0 +1,502 @@
+"""
+Offline batch chat completions.
+
+The input is a JSONL file in the OpenAI Batch API format, one request per
+line; lines without a `custom_id` are identified by their line number, and an
+optional `user` object is passed on to filters:
+
+    {"custom_id": "req-1", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+
+Every request goes through the server's own filter inlet chain, chat
+completion (non-streamed) and filter outlet chain endpoints, with a
+configurable number of concurrent requests per pipeline. Results are appended
+to the output JSONL as they complete, in the Batch API output format:
+
+    {"id": "batch_req_...", "custom_id": "req-1", "response": {"status_code": 200, "body": {...}}, "error": null}
+
+Running a batch again with the same output skips the requests that already
+have a successful result, so an interrupted batch resumes where it stopped;
+the last result of an id wins.
+
+The server runs uploaded batches through `POST /batches`; against a running
+server, the same runner is available from the command line:
+
+    python -m utils.pipelines.batch requests.jsonl results.jsonl --url http://localhost:9099 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import uuid
+
+from collections import deque
+from typing import Dict, List, Optional
+
+from utils.pipelines.coordination import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class BatchRequestError(Exception):
+    def __init__(self, status_code: int, body):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+    @property
+    def message(self) -> str:
+        if isinstance(self.body, dict) and "detail" in self.body:
+            return str(self.body["detail"])
+        return str(self.body)
+
+
+def read_requests(path: str) -> List[dict]:
+    requests = []
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {number} is not valid JSON: {e}")
+            if not isinstance(item, dict):
+                raise ValueError(f"Line {number} is not a JSON object")
+
+            body = item["body"] if "body" in item else item
+            if not isinstance(body, dict):
+                raise ValueError(f"Line {number}: body is not a JSON object")
+            requests.append(
+                {
+                    "custom_id": str(item.get("custom_id") or number),
+                    "body": body,
+                    "user": item.get("user"),
+                }
+            )
+    return requests
+
+
+def completed_ids(path: str) -> set:
+    """Ids whose last result in the output file is a success."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partly written line of an interrupted run
+                continue
+            if record.get("error") is None:
+                done.add(record["custom_id"])
+            else:
+                done.discard(record["custom_id"])
+    return done
+
+
+def pipeline_of(model: str) -> str:
+    # Manifold models are "<manifold id>.<model id>"
+    return model.split(".", 1)[0]
+
+
+class Batch:
+    """
+    A batch of chat completion requests read from `input_path` with results
+    appended to `output_path`. At most `concurrency` requests run at a time per
+    pipeline, unless overridden for a pipeline id in `limits`.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        concurrency: int = 4,
+        limits: Optional[Dict[str, int]] = None,
+        id: Optional[str] = None,
+        meta_path: Optional[str] = None,
+    ):
+        self.id = id or f"batch_{uuid.uuid4().hex}"
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.limits = limits or {}
+        self.meta_path = meta_path
+
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.created_at = int(time.time())
+        self.finished_at: Optional[int] = None
+
+        self.total = 0
+        self.skipped = 0
+        self.completed = 0
+        self.failed = 0
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, meta_path: str) -> "Batch":
+        with open(meta_path, "r") as f:
+            data = json.load(f)
+        batch = cls(
+            data["input_file"],
+            data["output_file"],
+            concurrency=data["concurrency"],
+            limits=data["limits"],
+            id=data["id"],
+            meta_path=meta_path,
+        )
+        batch.status = data["status"]
+        batch.error = data.get("error")
+        batch.created_at = data["created_at"]
+        batch.finished_at = data.get("finished_at")
+        counts = data["request_counts"]
+        batch.total = counts["total"]
+        batch.skipped = counts["skipped"]
+        batch.completed = counts["completed"]
+        batch.failed = counts["failed"]
+        return batch
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "object": "batch",
+            "status": self.status,
+            "error": self.error,
+            "input_file": self.input_path,
+            "output_file": self.output_path,
+            "concurrency": self.concurrency,
+            "limits": self.limits,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "request_counts": {
+                "total": self.total,
+                "skipped": self.skipped,
+                "completed": self.completed,
+                "failed": self.failed,
+            },
+        }
+
+    def save(self, force: bool = True):
+        # Progress is saved at most once a second, status changes always
+        if self.meta_path is None or (not force and time.monotonic() - self._saved_at < 1):
+            return
+        write_json_atomic(self.meta_path, self.to_dict())
+        self._saved_at = time.monotonic()
+
+    def progress(self) -> str:
+        done = self.skipped + self.completed + self.failed
+        return f"{self.id}: {done}/{self.total} done ({self.completed} completed, {self.failed} failed, {self.skipped} skipped)"
+
+    async def run(self, client):
+        """Runs the remaining requests with `client`, an `httpx.AsyncClient` for the server."""
+        self.status = IN_PROGRESS
+        self.error = None
+        self.finished_at = None
+        self.save()
+
+        try:
+            requests = await asyncio.to_thread(read_requests, self.input_path)
+            done = await asyncio.to_thread(completed_ids, self.output_path)
+
+            queues: Dict[str, deque] = {}
+            for request in requests:
+                if request["custom_id"] in done:
+                    continue
+                model = str(request["body"].get("model", ""))
+                queues.setdefault(pipeline_of(model), deque()).append(request)
+
+            self.total = len(requests)
+            self.skipped = len(requests) - sum(len(queue) for queue in queues.values())
+            self.completed = self.failed = 0
+            self.save()
+
+            with open(self.output_path, "a+") as output:
+                # Terminates a line left partly written by an interrupted run
+                if output.tell() > 0:
+                    output.seek(output.tell() - 1)
+                    if output.read(1) != "\n":
+                        output.write("\n")
+
+                async def worker(queue: deque):
+                    while queue:
+                        record = await self.execute(client, queue.popleft())
+                        output.write(json.dumps(record) + "\n")
+                        output.flush()
+                        if record["error"] is None:
+                            self.completed += 1
+                        else:
+                            self.failed += 1
+                        self.save(force=False)
+
+                await asyncio.gather(
+                    *[
+                        worker(queue)
+                        for pipeline_id, queue in queues.items()
+                        for _ in range(min(len(queue), self.limit(pipeline_id)))
+                    ]
+                )
+        except asyncio.CancelledError:
+            self.status = CANCELLED
+            raise
+        except Exception as e:
+            logging.error(f"Batch {self.id} failed: {e}")
+            self.status = FAILED
+            self.error = str(e)
+        else:
+            self.status = COMPLETED
+        finally:
+            self.finished_at = int(time.time())
+            self.save()
+
+    def limit(self, pipeline_id: str) -> int:
+        return max(1, int(self.limits.get(pipeline_id, self.concurrency)))
+
+    async def post(self, client, path: str, payload: dict):
+        response = await client.post(path, json=payload)
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        if response.status_code >= 400:
+            raise BatchRequestError(response.status_code, body)
+        return body
+
+    async def execute(self, client, request: dict) -> dict:
+        """Runs one request through the inlet filters, the pipe and the outlet filters."""
+        body = {**request["body"], "stream": False}
+        user = request["user"]
+        record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"]}
+
+        try:
+            body = await self.post(client, "/filters/inlet", {"body": body, "user": user})
+            completion = await self.post(client, "/chat/completions", body)
+
+            message = completion["choices"][0]["message"]
+            outlet = await self.post(
+                client,
+                "/filters/outlet",
+                {
+                    "body": {**body, "messages": [*body["messages"], message]},
+                    "user": user,
+                },
+            )
+            completion["choices"][0]["message"] = outlet["messages"][-1]
+        except BatchRequestError as e:
+            return {
+                **record,
+                "response": {"status_code": e.status_code, "body": e.body},
+                "error": {"code": str(e.status_code), "message": e.message},
+            }
+        except Exception as e:
+            return {**record, "response": None, "error": {"code": "error", "message": str(e)}}
+
+        return {**record, "response": {"status_code": 200, "body": completion}, "error": None}
+
+
+class BatchManager:
+    """
+    Batches uploaded to the server, one directory each in `directory` holding
+    the input, the output and the batch's state. Batches that were in progress
+    when the server stopped are resumed on startup. With several workers, a
+    batch is run by whichever worker locks its directory first.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.batches: Dict[str, Batch] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.locks: Dict[str, object] = {}
+        self.client = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.directory, batch_id, name)
+
+    def create(self, input_file, concurrency: int, limits: Optional[dict] = None) -> Batch:
+        """
+        Copies a JSONL file object into a new batch, which still has to be
+        started. Raises ValueError for malformed input.
+        """
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+
+        input_path = self.path(batch_id, "input.jsonl")
+        try:
+            with open(input_path, "wb") as f:
+                shutil.copyfileobj(input_file, f)
+            # Fail early on malformed input rather than in the background
+            read_requests(input_path)
+
+            batch = Batch(
+                input_path,
+                self.path(batch_id, "output.jsonl"),
+                concurrency=concurrency,
+                limits=limits,
+                id=batch_id,
+                meta_path=self.path(batch_id, "batch.json"),
+            )
+            batch.save()
+        except BaseException:
+            # Leave no half-created batch behind, whatever went wrong
+            shutil.rmtree(os.path.join(self.directory, batch_id), ignore_errors=True)
+            raise
+        return batch
+
+    def start(self, batch: Batch) -> bool:
+        if batch.id in self.tasks and not self.tasks[batch.id].done():
+            return False
+
+        lock = self.lock(batch.id)
+        if lock is False:
+            # Run by another worker
+            return False
+
+        self.batches[batch.id] = batch
+        task = self.tasks[batch.id] = asyncio.create_task(batch.run(self.client))
+        task.add_done_callback(lambda _: self.unlock(batch.id))
+        return True
+
+    def lock(self, batch_id: str):
+        if fcntl is None:
+            return None
+        f = open(self.path(batch_id, "lock"), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self.locks[batch_id] = f
+        return f
+
+    def unlock(self, batch_id: str):
+        f = self.locks.pop(batch_id, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def get(self, batch_id: str) -> Optional[Batch]:
+        if batch_id in self.batches:
+            return self.batches[batch_id]
+
+        meta_path = self.path(batch_id, "batch.json")
+        if os.path.sep in batch_id or not os.path.exists(meta_path):
+            return None
+        return Batch.load(meta_path)
+
+    def list(self) -> List[Batch]:
+        batches = []
+        for batch_id in sorted(os.listdir(self.directory)):
+            batch = self.get(batch_id)
+            if batch is not None:
+                batches.append(batch)
+        return sorted(batches, key=lambda batch: batch.created_at, reverse=True)
+
+    def resume(self):
+        for batch in self.list():
+            if batch.status in (PENDING, IN_PROGRESS) and self.start(batch):
+                logging.info(f"Resuming batch {batch.id}")
+
+    def cancel(self, batch_id: str) -> bool:
+        task = self.tasks.get(batch_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def start_all(self, client):
+        self.client = client
+        self.resume()
+
+    async def stop_all(self):
+        """Stops running batches without marking them cancelled, so they resume on restart."""
+        running = [
+            batch_id for batch_id, task in self.tasks.items() if not task.done()
+        ]
+        for batch_id in running:
+            self.tasks[batch_id].cancel()
+        await asyncio.gather(
+            *[self.tasks[batch_id] for batch_id in running], return_exceptions=True
+        )
+        for batch_id in running:
+            batch = self.batches[batch_id]
+            batch.status = IN_PROGRESS
+            batch.save()
+
+
+async def run_cli(args):
+    import httpx
+
+    batch = Batch(
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        limits=json.loads(args.limits) if args.limits else None,
+    )
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.progress_interval)
+            print(batch.progress(), file=sys.stderr, flush=True)
+
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        headers={"Authorization": f"Bearer {args.api_key}"},
+        timeout=None,
+    ) as client:
+        reporter = asyncio.create_task(report())
+        try:
+            await batch.run(client)
+        finally:
+            reporter.cancel()
+
+    print(batch.progress(), file=sys.stderr)
+    if batch.status != COMPLETED:
+        print(f"Batch {batch.status}: {batch.error}", file=sys.stderr)
+        return 1
+    return 1 if batch.failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help="JSONL file of chat completion requests")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--url", default="http://localhost:9099")
+    parser.add_argument(
+        "--api-key", default=os.getenv("PIPELINES_API_KEY", "0p3n-w3bu!")
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="concurrent requests per pipeline"
+    )
+    parser.add_argument(
+        "--limits", help='per-pipeline concurrency as JSON, e.g. \'{"my_manifold": 2}\''
+    )
+    parser.add_argument("--progress-interval", type=float, default=5)
+    args = parser.parse_args()
+
+    try:
+        sys.exit(asyncio.run(run_cli(args)))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
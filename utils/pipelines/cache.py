@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from collections import OrderedDict
+from typing import Optional
+
+from utils.pipelines.coordination import write_json_atomic
+
+
+# Request fields that identify the chat or the transport rather than the completion
+# itself, so they do not take part in the cache key. `user` does, so one user's
+# cached completions are never served to another.
+VOLATILE_FIELDS = {"chat_id", "session_id", "id", "metadata", "stream_options"}
+
+
+def drop_none(value):
+    if isinstance(value, dict):
+        return {k: drop_none(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_none(v) for v in value]
+    return value
+
+
+def cache_key(body: dict, exclude=VOLATILE_FIELDS) -> str:
+    """
+    Hash of the model, messages, generation parameters and stream flag of a
+    chat completion request. Keys are order-independent and unset (None)
+    parameters are ignored.
+    """
+    normalized = drop_none({k: v for k, v in body.items() if k not in exclude})
+    canonical = json.dumps(
+        normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(pipeline, body: dict) -> bool:
+    """
+    Pipelines opt in with a `cacheable` attribute, either a bool or a callable
+    taking the request body, e.g. to only cache requests at temperature 0.
+    """
+    cacheable = getattr(pipeline, "cacheable", False)
+    if callable(cacheable):
+        return bool(cacheable(body))
+    return bool(cacheable)
+
+
+class ResponseCache:
+    """
+    LRU cache of chat completion responses with a TTL, optionally persisted to
+    one JSON file per entry in `directory` so entries survive restarts and are
+    shared by the workers of one deployment. Files are deleted when their
+    entry is evicted, and expired files are swept every `sweep_interval`
+    seconds, so the directory stays bounded.
+
+    Values are `{"stream": True, "body": <SSE text>}` for streamed responses
+    and `{"stream": False, "response": <completion dict>}` otherwise.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        directory: Optional[str] = None,
+        sweep_interval: float = 300,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory or None
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.sweep_interval = sweep_interval
+        self.swept_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self.read, key)
+            if entry is not None:
+                await self.evict(self.remember(key, entry))
+
+        if entry is not None and entry[0] <= time.time():
+            self.forget(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: dict):
+        entry = (time.time() + self.ttl, value)
+        evicted = self.remember(key, entry)
+        self.stores += 1
+
+        if self.directory:
+            try:
+                await asyncio.to_thread(self.write, key, entry)
+            except (OSError, TypeError, ValueError) as e:
+                logging.warning(f"Failed to persist cached response {key}: {e}")
+            await self.evict(evicted)
+
+            if time.monotonic() - self.swept_at >= self.sweep_interval:
+                self.swept_at = time.monotonic()
+                await asyncio.to_thread(self.sweep)
+
+    def remember(self, key: str, entry: tuple) -> list:
+        """Stores an entry in memory and returns the keys evicted to make room."""
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        evicted = []
+        while len(self.entries) > self.max_entries:
+            evicted.append(self.entries.popitem(last=False)[0])
+            self.evictions += 1
+        return evicted
+
+    async def evict(self, keys: list):
+        if self.directory and keys:
+            await asyncio.to_thread(self.remove_files, keys)
+
+    def remove_files(self, keys: list):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        """Deletes the files of expired entries, including those no worker has in memory."""
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if not filename.endswith(".json"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    with open(path, "r") as f:
+                        expired = json.load(f)["expires_at"] <= now
+                except (FileNotFoundError, ValueError, KeyError, TypeError):
+                    # Unreadable files are left to the write that replaces them
+                    continue
+                if expired:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def forget(self, key: str):
+        self.entries.pop(key, None)
+        if self.directory:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def read(self, key: str) -> Optional[tuple]:
+        try:
+            with open(self.path(key), "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return data["expires_at"], data["value"]
+
+    def write(self, key: str, entry: tuple):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json_atomic(path, {"expires_at": entry[0], "value": entry[1]})
+
+    def clear(self):
+        self.entries.clear()
+        if self.directory:
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    if filename.endswith(".json"):
+                        os.remove(os.path.join(root, filename))
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
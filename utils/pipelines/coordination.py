@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from contextlib import contextmanager
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only a single worker is supported
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock shared by every process on this host."""
+    if fcntl is None:
+        yield
+        return
+
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path: str, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class SharedState:
+    """
+    Versioned change log shared by the workers of one deployment through a
+    directory on local disk.
+
+    A worker that changes valves or pipeline files publishes an event; every
+    other worker polls the log (a single `stat` when nothing changed) and
+    applies the events it has not seen yet. When a worker fell so far behind
+    that events were already trimmed from the log, `poll` returns a single
+    `reload` event so it can resynchronize from scratch.
+    """
+
+    def __init__(self, directory: str, max_events: int = 256):
+        self.directory = directory
+        self.max_events = max_events
+        self.worker_id = uuid.uuid4().hex
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "state.json")
+        self.lock_path = os.path.join(directory, "state.lock")
+
+        self._mtime_ns = None
+        self.version = self.read()["version"]
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"version": 0, "events": []}
+
+    def publish(self, type: str, **data) -> int:
+        with file_lock(self.lock_path):
+            state = self.read()
+            version = state["version"] + 1
+            state["version"] = version
+            state["events"] = [
+                *state["events"][-(self.max_events - 1) :],
+                {"version": version, "type": type, "worker": self.worker_id, **data},
+            ]
+            write_json_atomic(self.path, state)
+
+        # Our own events never need to be applied locally
+        if self.version == version - 1:
+            self.version = version
+        return version
+
+    def poll(self) -> List[dict]:
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime_ns == self._mtime_ns:
+            return []
+        self._mtime_ns = mtime_ns
+
+        state = self.read()
+        if state["version"] <= self.version:
+            return []
+
+        events = [e for e in state["events"] if e["version"] > self.version]
+        missed = not events or events[0]["version"] != self.version + 1
+        self.version = state["version"]
+
+        if missed:
+            return [{"version": self.version, "type": "reload", "worker": None}]
+        return [e for e in events if e["worker"] != self.worker_id]
+
+    async def watch(self, interval: float = 0.5):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                events = self.poll()
+            except Exception as e:
+                logging.error(f"Failed to read shared pipeline state: {e}")
+                continue
+            for event in events:
+                yield event
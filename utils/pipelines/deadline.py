@@ -0,0 +1,142 @@
+"""
+Request deadlines and streaming timeouts.
+
+Every chat completion gets a deadline, taken from the `X-Request-Timeout`
+header or the `request_timeout` body field (seconds) and capped by the server
+default. Streams are additionally bounded by a time-to-first-token timeout and
+an idle timeout between chunks, configurable per pipeline.
+
+Pipes can read the time left with `remaining_time()` to set their own upstream
+timeouts, e.g. `requests.post(..., timeout=remaining_time())`.
+"""
+
+import asyncio
+import contextvars
+import time
+
+from typing import AsyncIterator, Callable, Optional
+
+from utils.pipelines.stream import aclose_iterator
+
+
+TIMEOUT_HEADER = "X-Request-Timeout"
+TIMEOUT_FIELD = "request_timeout"
+
+
+class Deadline:
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+# Deadline of the request being handled, copied into worker threads
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left until the current request's deadline, or None without one."""
+    deadline = current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def parse_timeout(value) -> Optional[float]:
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        return None
+    return timeout if timeout > 0 else None
+
+
+def request_timeout(requested, default: float) -> Optional[float]:
+    """The client's timeout, which may shorten but not extend the server default (0 disables it)."""
+    requested = parse_timeout(requested)
+    if not default:
+        return requested
+    return min(requested, default) if requested else default
+
+
+def pipeline_timeout(pipeline, name: str, default: float) -> Optional[float]:
+    """A timeout set on the pipeline's valves or the pipeline itself, else the server default."""
+    valves = getattr(pipeline, "valves", None)
+    for source in (valves, pipeline):
+        value = getattr(source, name, None)
+        if value is not None:
+            return parse_timeout(value)
+    return parse_timeout(default)
+
+
+class StreamTimeouts:
+    """
+    The deadline of a request with the time-to-first-chunk and inter-chunk
+    idle timeouts of its stream. The first chunk is due `ttft` seconds after
+    the request was received.
+    """
+
+    def __init__(
+        self,
+        deadline: Deadline,
+        ttft: Optional[float] = None,
+        idle: Optional[float] = None,
+    ):
+        self.deadline = deadline
+        self.ttft = ttft
+        self.idle = idle
+        self.first_chunk_due = time.monotonic() + ttft if ttft else None
+        # The limit that ended the stream, if any
+        self.expired: Optional[str] = None
+
+    def next_timeout(self, first: bool) -> tuple:
+        """Seconds until the next chunk is due and which limit applies, or (None, None)."""
+        if first:
+            limit = (
+                max(0.0, self.first_chunk_due - time.monotonic())
+                if self.first_chunk_due is not None
+                else None
+            )
+            kind = "ttft"
+        else:
+            limit, kind = self.idle, "idle"
+
+        remaining = self.deadline.remaining()
+        if remaining is not None and (limit is None or remaining < limit):
+            return remaining, "deadline"
+        return limit, kind
+
+
+async def with_timeouts(
+    chunks: AsyncIterator,
+    timeouts: StreamTimeouts,
+    on_timeout: Callable[[str], Optional[str]],
+):
+    """
+    Yields from `chunks` until it is exhausted or a chunk is not produced in
+    time. The iterator is then cancelled, which closes it, and the stream ends
+    with whatever `on_timeout` returns for the limit that was hit ("ttft",
+    "idle" or "deadline").
+    """
+    first = True
+    try:
+        while True:
+            timeout, kind = timeouts.next_timeout(first)
+            try:
+                async with asyncio.timeout(timeout):
+                    chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                timeouts.expired = kind
+                final = on_timeout(kind)
+                if final:
+                    yield final
+                return
+            first = False
+            yield chunk
+    finally:
+        await aclose_iterator(chunks)
@@ -0,0 +1,164 @@
+"""
+Installs pipeline files from URLs.
+
+Downloads are streamed to a temporary file next to the destination, checked
+against a size limit and, when the URL ends with `#sha256=<hex digest>`,
+against the expected SHA-256, and only then renamed into place, so a failed
+or partial download never leaves a broken pipeline behind. Many URLs are
+fetched concurrently over one connection pool.
+
+Usage (e.g. from start.sh):
+    python -m utils.pipelines.install ./pipelines https://example.com/a.py "https://example.com/b.py#sha256=..."
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import uuid
+
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from utils.pipelines.misc import convert_to_raw_url
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InstallError(ValueError):
+    pass
+
+
+def split_checksum(url: str) -> Tuple[str, Optional[str]]:
+    """Splits an optional `#sha256=<hex digest>` fragment off a URL."""
+    base, _, fragment = url.partition("#")
+    if fragment.startswith("sha256="):
+        return base, fragment[len("sha256=") :].lower()
+    return url, None
+
+
+class PipelineInstaller:
+    def __init__(self, max_bytes: int, concurrency: int = 8):
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=300, sock_connect=30),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def install(self, url: str, dest_folder: str) -> str:
+        """
+        Downloads one pipeline file into `dest_folder` and returns its path.
+        Raises InstallError when the URL, the response, its size or its
+        checksum is not acceptable.
+        """
+        url, sha256 = split_checksum(url)
+        url = convert_to_raw_url(url)
+
+        filename = os.path.basename(urlparse(url).path)
+        if not filename.endswith(".py"):
+            raise InstallError("URL must point to a Python file")
+
+        file_path = os.path.join(dest_folder, filename)
+        # Not a .py file, so a reload in the meantime does not pick it up
+        tmp_path = os.path.join(dest_folder, f".{filename}.{uuid.uuid4().hex}.tmp")
+
+        async with self.session().get(url) as response:
+            if response.status != 200:
+                raise InstallError(f"Failed to download file ({response.status})")
+            if response.content_length and response.content_length > self.max_bytes:
+                raise InstallError(f"File is larger than {self.max_bytes} bytes")
+
+            digest = hashlib.sha256()
+            size = 0
+            f = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise InstallError(f"File is larger than {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+                await asyncio.to_thread(f.close)
+
+                if sha256 is not None and digest.hexdigest() != sha256:
+                    raise InstallError(
+                        f"SHA-256 mismatch: expected {sha256}, got {digest.hexdigest()}"
+                    )
+                await asyncio.to_thread(os.replace, tmp_path, file_path)
+            except BaseException:
+                f.close()
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+
+        return file_path
+
+    async def install_many(self, urls: List[str], dest_folder: str) -> List[dict]:
+        """Downloads every URL concurrently and reports the outcome of each one."""
+
+        async def install(url: str) -> dict:
+            try:
+                return {"url": url, "status": True, "path": await self.install(url, dest_folder)}
+            except (InstallError, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                return {"url": url, "status": False, "detail": str(e) or type(e).__name__}
+
+        return await asyncio.gather(*[install(url) for url in urls])
+
+
+async def run_cli(args) -> int:
+    os.makedirs(args.dest, exist_ok=True)
+
+    installer = PipelineInstaller(args.max_bytes, args.concurrency)
+    try:
+        results = await installer.install_many(args.urls, args.dest)
+    finally:
+        await installer.close()
+
+    failed = 0
+    for result in results:
+        if result["status"]:
+            print(f"Installed {result['url']} to {result['path']}")
+        else:
+            failed += 1
+            print(f"Failed to install {result['url']}: {result['detail']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("dest", help="pipelines directory")
+    parser.add_argument("urls", nargs="+", help="pipeline file URLs")
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=int(os.getenv("PIPELINES_MAX_DOWNLOAD_SIZE", str(10 * 1024 * 1024))),
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("PIPELINES_DOWNLOAD_CONCURRENCY", "8")),
+    )
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run_cli(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+from typing import Dict, Optional
+
+
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+# Registered from static metadata, imported on first use
+LAZY = "lazy"
+
+
+class StartupReport:
+    """
+    Per-pipeline warm state and timings (seconds) of the import, construct and
+    startup phases, as served by the `/ready` endpoint.
+    """
+
+    def __init__(self):
+        self.pipelines: Dict[str, dict] = {}
+
+    def reset(self):
+        self.pipelines = {}
+
+    def record(self, pipeline_id: str, phase: str, seconds: float):
+        entry = self.pipelines.setdefault(pipeline_id, {"status": STARTING})
+        entry[phase] = round(seconds, 4)
+
+    def set_status(self, pipeline_id: str, status: str, error: Optional[str] = None):
+        entry = self.pipelines.setdefault(pipeline_id, {})
+        entry["status"] = status
+        if error:
+            entry["error"] = error
+        else:
+            entry.pop("error", None)
+
+    def rename(self, old_id: str, new_id: str):
+        if old_id != new_id and old_id in self.pipelines:
+            self.pipelines[new_id] = self.pipelines.pop(old_id)
+
+    def remove(self, pipeline_id: str):
+        self.pipelines.pop(pipeline_id, None)
+
+    @property
+    def ready(self) -> bool:
+        return all(p["status"] != STARTING for p in self.pipelines.values())
+
+    def log_summary(self):
+        for pipeline_id, entry in sorted(
+            self.pipelines.items(),
+            key=lambda item: -sum(
+                v for k, v in item[1].items() if isinstance(v, (int, float))
+            ),
+        ):
+            timings = " ".join(
+                f"{phase}={entry[phase]:.3f}s"
+                for phase in ("import", "construct", "startup")
+                if phase in entry
+            )
+            logging.info(f"Startup {pipeline_id}: {entry['status']} {timings}")
+
+
+async def start_pipeline(
+    pipeline_id: str, pipeline, report: StartupReport, timeout: float, on_ready=None
+) -> bool:
+    """
+    Runs `pipeline.on_startup()` for at most `timeout` seconds (0 disables the
+    limit). A hook that is still running when the timeout expires keeps running
+    in the background; the pipeline stays in the `starting` state until it
+    finishes and `on_ready` is called then.
+
+    Returns whether the pipeline finished starting within the timeout.
+    """
+    if not hasattr(pipeline, "on_startup"):
+        report.set_status(pipeline_id, READY)
+        return True
+
+    report.set_status(pipeline_id, STARTING)
+    start = time.monotonic()
+
+    async def run():
+        try:
+            await pipeline.on_startup()
+        except Exception as e:
+            logging.error(f"Error starting up {pipeline_id}: {e}")
+            report.set_status(pipeline_id, FAILED, str(e))
+        else:
+            report.set_status(pipeline_id, READY)
+        finally:
+            report.record(pipeline_id, "startup", time.monotonic() - start)
+
+    task = asyncio.create_task(run())
+
+    try:
+        await asyncio.wait_for(asyncio.shield(task), timeout or None)
+    except asyncio.TimeoutError:
+        logging.warning(
+            f"on_startup of {pipeline_id} did not finish within {timeout}s, continuing in the background"
+        )
+        if on_ready is not None:
+            task.add_done_callback(lambda _: on_ready())
+        return False
+
+    return True
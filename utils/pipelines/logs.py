@@ -0,0 +1,148 @@
+"""
+Logging for the server and the pipelines it runs.
+
+Records are handed to a bounded queue without being formatted and are
+formatted and written by a background listener thread, so a log call on the
+request path costs a level check and a queue put. Records are dropped rather
+than blocking when the queue is full.
+
+Each pipeline logs to the logger named after its id, which is also the
+`__name__` of pipelines that do not set an explicit id, so
+`logging.getLogger(__name__)` in pipeline code honours the per-pipeline levels.
+Optionally, `print` output is turned into records of the pipeline running in
+the current context.
+"""
+
+import atexit
+import contextvars
+import itertools
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+from typing import Dict, Optional
+
+
+SERVER_LOGGER = "pipelines"
+
+# Id of the pipeline handling the current request, copied into worker threads
+current_pipeline: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_pipeline", default=None
+)
+
+_loggers: Dict[Optional[str], logging.Logger] = {}
+
+
+def pipeline_logger(pipeline_id: Optional[str]) -> logging.Logger:
+    logger = _loggers.get(pipeline_id)
+    if logger is None:
+        logger = _loggers[pipeline_id] = logging.getLogger(pipeline_id or SERVER_LOGGER)
+    return logger
+
+
+def current_logger() -> logging.Logger:
+    """Logger of the pipeline running in the current context."""
+    return pipeline_logger(current_pipeline.get())
+
+
+class Sampler:
+    """Lets one in every `1 / rate` calls through; a rate of 0 lets none through."""
+
+    def __init__(self, rate: float):
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._calls = itertools.count()
+
+    def __call__(self) -> bool:
+        return bool(self.every) and next(self._calls) % self.every == 0
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records as they are; the message is only formatted by the
+    listener thread. Arguments are therefore formatted in the state they are
+    in at that time.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DeferredQueueHandler.dropped += 1
+
+
+class PrintRedirect:
+    """
+    `sys.stdout` replacement that logs every printed line at `level` to the
+    logger of the pipeline running in the current context. Lines are only
+    built when that logger is enabled for `level`.
+    """
+
+    def __init__(self, stream, level: int):
+        self.stream = stream
+        self.level = level
+        self._local = threading.local()
+
+    def write(self, text: str) -> int:
+        logger = current_logger()
+        if not logger.isEnabledFor(self.level):
+            return len(text)
+
+        buffered = getattr(self._local, "buffer", "") + text
+        *lines, self._local.buffer = buffered.split("\n")
+        for line in lines:
+            if line:
+                logger.log(self.level, "%s", line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def setup_logging(
+    level: str = "WARNING",
+    levels: Optional[Dict[str, str]] = None,
+    print_level: str = "",
+    queue_size: int = 10000,
+) -> logging.handlers.QueueListener:
+    """
+    Routes every record through a queue to a stderr handler running on a
+    listener thread. `levels` maps pipeline ids to their own levels, and a
+    non-empty `print_level` redirects `print` output to the logging system.
+    """
+    handler = logging.StreamHandler(sys.__stderr__)
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level.upper())
+
+    for pipeline_id, pipeline_level in (levels or {}).items():
+        pipeline_logger(pipeline_id).setLevel(pipeline_level.upper())
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    if print_level:
+        sys.stdout = PrintRedirect(sys.stdout, logging.getLevelName(print_level.upper()))
+
+    return listener
@@ -0,0 +1,224 @@
+import ast
+import json
+import logging
+
+from typing import Dict, Optional
+
+from utils.pipelines.coordination import write_json_atomic
+from utils.pipelines.requirements import parse_frontmatter
+from utils.pipelines.watch import file_digest
+
+
+# Bumped whenever read_pipeline_metadata changes, so cached entries are read again
+METADATA_VERSION = 2
+
+
+def literal(node):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        raise LookupError
+
+
+def read_valves_schema(class_node: ast.ClassDef) -> Dict[str, dict]:
+    schema = {}
+    for node in class_node.body:
+        if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            field = {"type": ast.unparse(node.annotation)}
+            if node.value is not None:
+                try:
+                    field["default"] = literal(node.value)
+                except LookupError:
+                    field["default"] = ast.unparse(node.value)
+            schema[node.target.id] = field
+    return schema
+
+
+def read_pipeline_metadata(source: str) -> dict:
+    """
+    Extracts pipeline metadata from the source without executing it: the
+    frontmatter, the literal `id`, `name`, `type` and manifold `pipelines`
+    assigned in `Pipeline.__init__`, and the fields of `Pipeline.Valves`.
+
+    `lazy` is only True when everything the server needs to register the
+    pipeline could be read statically. Filters are never lazy because they run
+    on every matching request anyway, and neither are manifolds whose model
+    list starts empty or is set again outside `__init__`.
+    """
+    tree = ast.parse(source)
+
+    docstring = ast.get_docstring(tree, clean=False)
+    metadata = {
+        "frontmatter": parse_frontmatter(docstring) if docstring else {},
+        "attributes": {},
+        "valves": None,
+        "lazy": False,
+    }
+
+    pipeline_class = next(
+        (
+            node
+            for node in tree.body
+            if isinstance(node, ast.ClassDef) and node.name == "Pipeline"
+        ),
+        None,
+    )
+    if pipeline_class is None:
+        return metadata
+
+    init = None
+    dynamic = set()
+    for node in pipeline_class.body:
+        if isinstance(node, ast.ClassDef) and node.name == "Valves":
+            metadata["valves"] = read_valves_schema(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name == "__init__":
+                init = node
+            elif node.name in ("id", "name", "type", "pipelines"):
+                dynamic.add(node.name)
+            else:
+                # Set again later, e.g. manifolds listing their models in on_startup
+                dynamic.update(assigned_attributes(node))
+
+    attributes = metadata["attributes"]
+    for node in ast.walk(init) if init else []:
+        if not isinstance(node, (ast.Assign, ast.AnnAssign)):
+            continue
+
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        for target in targets:
+            if (
+                isinstance(target, ast.Attribute)
+                and isinstance(target.value, ast.Name)
+                and target.value.id == "self"
+                and target.attr in ("id", "name", "type", "pipelines", "valves")
+            ):
+                if target.attr == "valves":
+                    attributes["valves"] = True
+                    continue
+                try:
+                    value = literal(node.value)
+                except LookupError:
+                    dynamic.add(target.attr)
+                    continue
+                if target.attr in attributes and attributes[target.attr] != value:
+                    dynamic.add(target.attr)
+                attributes[target.attr] = value
+
+    pipeline_type = attributes.get("type", "pipe")
+    # An empty model list is only a placeholder for models listed once the manifold runs
+    metadata["lazy"] = not dynamic and (
+        pipeline_type == "pipe"
+        or (
+            pipeline_type == "manifold"
+            and isinstance(attributes.get("pipelines"), list)
+            and len(attributes["pipelines"]) > 0
+        )
+    )
+    return metadata
+
+
+def assigned_attributes(function: ast.AST) -> set:
+    """The registration attributes a method assigns or mutates on `self`."""
+    names = set()
+    for node in ast.walk(function):
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+            targets = [node.target]
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in ("append", "extend", "insert", "clear", "update")
+        ):
+            # e.g. self.pipelines.append(...)
+            targets = [node.func.value]
+        else:
+            continue
+
+        for target in targets:
+            for element in target.elts if isinstance(target, ast.Tuple) else [target]:
+                if (
+                    isinstance(element, ast.Attribute)
+                    and isinstance(element.value, ast.Name)
+                    and element.value.id == "self"
+                    and element.attr in ("id", "name", "type", "pipelines")
+                ):
+                    names.add(element.attr)
+    return names
+
+
+class PipelineManifest:
+    """
+    Caches the static metadata of pipeline files keyed by content hash, so
+    unchanged files are not even re-parsed on restart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        self.used = set()
+
+    def get(self, module_path: str) -> Optional[dict]:
+        try:
+            digest = file_digest(module_path)
+        except FileNotFoundError:
+            return None
+
+        self.used.add(digest)
+        entry = self.entries.get(digest)
+        if entry is not None and entry.get("version") == METADATA_VERSION:
+            return entry
+
+        try:
+            with open(module_path, "r") as f:
+                entry = read_pipeline_metadata(f.read())
+        except SyntaxError as e:
+            logging.warning(f"Could not read metadata of {module_path}: {e}")
+            return None
+
+        entry["version"] = METADATA_VERSION
+        self.entries[digest] = entry
+        self.save()
+        return entry
+
+    def prune(self):
+        """Drops the entries of files that were not looked up since the last prune."""
+        stale = [digest for digest in self.entries if digest not in self.used]
+        for digest in stale:
+            del self.entries[digest]
+        self.used = set()
+        if stale:
+            self.save()
+
+    def save(self):
+        write_json_atomic(self.path, self.entries)
+
+
+class LazyPipeline:
+    """
+    Stand-in registered for a pipeline that has not been imported yet. It only
+    carries the statically known attributes; the server swaps in the real
+    pipeline on first use or on an explicit warm-up.
+    """
+
+    lazy = True
+
+    def __init__(self, module_name: str, metadata: dict):
+        self.module_name = module_name
+        self.metadata = metadata
+
+        attributes = metadata["attributes"]
+        for attribute in ("id", "name", "pipelines"):
+            if attribute in attributes:
+                setattr(self, attribute, attributes[attribute])
+        if "type" in attributes:
+            self.type = attributes["type"]
+
+    @property
+    def has_valves(self) -> bool:
+        return bool(self.metadata["attributes"].get("valves"))
@@ -0,0 +1,315 @@
+import bisect
+import threading
+import time
+
+from typing import Dict, List, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, labels)} {value}"
+            for labels, value in list(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One slot per bucket, then +Inf, then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, counts in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, collect):
+        """Registers a callable returning metrics that are computed at scrape time."""
+        self.collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+REQUEST_DURATION = metrics.histogram(
+    "pipelines_request_duration_seconds",
+    "Time from receiving a chat completion request to sending its last byte.",
+    ("pipeline", "model", "stream"),
+)
+TIME_TO_FIRST_CHUNK = metrics.histogram(
+    "pipelines_time_to_first_chunk_seconds",
+    "Time from receiving a streaming request to producing its first chunk.",
+    ("pipeline", "model"),
+)
+STREAM_CHUNK_RATE = metrics.histogram(
+    "pipelines_stream_chunks_per_second",
+    "Chunks per second produced after the first chunk of a streaming response.",
+    ("pipeline", "model"),
+    buckets=RATE_BUCKETS,
+)
+STREAM_CHUNKS = metrics.counter(
+    "pipelines_stream_chunks_total",
+    "Chunks sent on streaming responses.",
+    ("pipeline", "model"),
+)
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    "pipelines_requests_in_flight",
+    "Chat completion requests currently being processed.",
+    ("pipeline", "model"),
+)
+REQUESTS = metrics.counter(
+    "pipelines_requests_total",
+    "Chat completion requests by outcome.",
+    ("pipeline", "model", "status"),
+)
+STREAMS_ABORTED = metrics.counter(
+    "pipelines_streams_aborted_total",
+    "Streaming responses abandoned by their client before completion.",
+    ("pipeline", "model"),
+)
+ABANDONED_CHUNKS = metrics.counter(
+    "pipelines_abandoned_chunks_total",
+    "Chunks produced by a pipe after its client had disconnected.",
+    ("pipeline", "model"),
+)
+TIMEOUTS = metrics.counter(
+    "pipelines_timeouts_total",
+    "Chat completions cut short by their deadline, time-to-first-chunk or idle timeout.",
+    ("pipeline", "model", "kind"),
+)
+FILTER_DURATION = metrics.histogram(
+    "pipelines_filter_duration_seconds",
+    "Duration of filter inlet and outlet calls.",
+    ("filter", "hook"),
+)
+
+
+class ServerTiming:
+    """
+    Collects named request phases for the `Server-Timing` response header.
+    Each `mark` records the time elapsed since the previous mark.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, name: str) -> float:
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+        return now - self.start
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def header(self) -> str:
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases
+        )
+
+
+def admission_metrics(stats: Dict[str, dict]) -> List[Metric]:
+    """Exposes the statistics of `AdmissionController.stats()` at scrape time."""
+    collected = {
+        "active": Gauge(
+            "pipelines_admission_active",
+            "Requests holding a concurrency slot.",
+            ("limiter",),
+        ),
+        "queue_depth": Gauge(
+            "pipelines_admission_queue_depth",
+            "Requests waiting for a concurrency slot.",
+            ("limiter",),
+        ),
+        "limit": Gauge(
+            "pipelines_admission_limit",
+            "Configured concurrency limit.",
+            ("limiter",),
+        ),
+        "admitted": Counter(
+            "pipelines_admission_admitted_total",
+            "Requests admitted.",
+            ("limiter",),
+        ),
+        "rejected": Counter(
+            "pipelines_admission_rejected_total",
+            "Requests rejected because the queue was full.",
+            ("limiter",),
+        ),
+        "timed_out": Counter(
+            "pipelines_admission_timed_out_total",
+            "Requests rejected after waiting too long in the queue.",
+            ("limiter",),
+        ),
+        "wait_seconds_total": Counter(
+            "pipelines_admission_wait_seconds_total",
+            "Total time requests spent waiting in the queue.",
+            ("limiter",),
+        ),
+    }
+    for limiter, values in stats.items():
+        for key, metric in collected.items():
+            metric.inc(limiter, amount=values[key])
+    return list(collected.values())
+
+
+def cache_metrics(stats: dict) -> List[Metric]:
+    """Exposes the statistics of `ResponseCache.stats()` at scrape time."""
+    entries = Gauge("pipelines_cache_entries", "Responses held in the in-memory cache.")
+    entries.set(value=stats["entries"])
+
+    collected = [entries]
+    for key, documentation in (
+        ("hits", "Chat completions served from the response cache."),
+        ("misses", "Cacheable chat completions that were not in the response cache."),
+        ("stores", "Responses added to the response cache."),
+        ("evictions", "Responses evicted from the in-memory cache."),
+    ):
+        counter = Counter(f"pipelines_cache_{key}_total", documentation)
+        counter.inc(amount=stats[key])
+        collected.append(counter)
+    return collected
+
+
+def asset_cache_metrics(stats: dict) -> List[Metric]:
+    """Exposes the statistics of `AssetCache.stats()` at scrape time."""
+    entries = Gauge("pipelines_asset_cache_entries", "Images held in the in-memory asset cache.")
+    entries.set(value=stats["entries"])
+    size = Gauge("pipelines_asset_cache_bytes", "Bytes held in the in-memory asset cache.")
+    size.set(value=stats["bytes"])
+
+    collected = [entries, size]
+    for key, documentation in (
+        ("hits", "Images served from the in-memory asset cache."),
+        ("misses", "Images that were not in the in-memory asset cache."),
+        ("fetches", "Remote images downloaded by the asset cache."),
+        ("evictions", "Images evicted from the in-memory asset cache."),
+    ):
+        counter = Counter(f"pipelines_asset_cache_{key}_total", documentation)
+        counter.inc(amount=stats[key])
+        collected.append(counter)
+    return collected
+
+
+def single_flight_metrics(stats: dict) -> List[Metric]:
+    """Exposes the statistics of `SingleFlight.stats()` at scrape time."""
+    in_flight = Gauge(
+        "pipelines_single_flight_in_flight",
+        "Distinct chat completions currently shared by identical requests.",
+    )
+    in_flight.set(value=stats["in_flight"])
+    subscribers = Gauge(
+        "pipelines_single_flight_subscribers",
+        "Clients currently reading a shared streamed response.",
+    )
+    subscribers.set(value=stats["subscribers"])
+    return [in_flight, subscribers]
+
+
+def log_metrics(dropped: int) -> List[Metric]:
+    counter = Counter(
+        "pipelines_log_records_dropped_total",
+        "Log records dropped because the logging queue was full.",
+    )
+    counter.inc(amount=dropped)
+    return [counter]
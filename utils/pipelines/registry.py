@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import threading
+import time
+
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, NamedTuple
+
+
+class RegistrySnapshot(NamedTuple):
+    version: int
+    pipelines: Mapping[str, dict]
+    modules: Mapping[str, object]
+    # model id -> filter ids in execution order, "*" holds the wildcard-only chain
+    filter_chains: Mapping[str, tuple] = MappingProxyType({})
+
+    def get_filter_chain(self, model_id: str) -> tuple:
+        return self.filter_chains.get(model_id, self.filter_chains.get("*", ()))
+
+
+def build_filter_chains(pipelines: Mapping[str, dict]) -> Dict[str, tuple]:
+    """
+    Precomputes, for every model a filter targets, the filters that apply to it
+    sorted by `priority` (lower runs first). Filters targeting "*" apply to every
+    model, including ones that are not served by this instance.
+    """
+    filters = [p for p in pipelines.values() if p["type"] == "filter"]
+
+    targets = {"*"}
+    for f in filters:
+        targets.update(f["pipelines"])
+
+    filter_chains = {}
+    for model_id in targets:
+        chain = [
+            f
+            for f in filters
+            if "*" in f["pipelines"] or (model_id != "*" and model_id in f["pipelines"])
+        ]
+        chain.sort(key=lambda f: f["priority"])
+        filter_chains[model_id] = tuple(f["id"] for f in chain)
+
+    return filter_chains
+
+
+def get_valves(pipeline):
+    if getattr(pipeline, "lazy", False):
+        # Not imported yet, only whether it declares valves is known
+        return True if pipeline.has_valves else None
+    return pipeline.valves if hasattr(pipeline, "valves") else None
+
+
+class PipelineRegistry:
+    """
+    Holds an immutable, versioned snapshot of the loaded pipelines.
+
+    The snapshot is only rebuilt on load, reload or valve update and is swapped
+    in a single assignment, so request handlers can read `registry.snapshot`
+    once and work with a consistent view without any locking.
+
+    Manifolds that expose `pipelines` as a callable (which usually hits the
+    network) are evaluated once and cached for `manifold_ttl` seconds; the
+    cache is refreshed in the background by `run_manifold_refresher`.
+    """
+
+    def __init__(self, manifold_ttl: float = 300):
+        self.manifold_ttl = manifold_ttl
+
+        self._lock = threading.Lock()
+        self._manifolds: Dict[str, tuple] = {}
+        self._listeners: List[Callable[[RegistrySnapshot], None]] = []
+        self._snapshot = RegistrySnapshot(
+            0, MappingProxyType({}), MappingProxyType({})
+        )
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        return self._snapshot
+
+    @property
+    def pipelines(self) -> Mapping[str, dict]:
+        return self._snapshot.pipelines
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def on_rebuild(self, callback: Callable[[RegistrySnapshot], None]):
+        """Registers a callback invoked with every new snapshot."""
+        self._listeners.append(callback)
+        return callback
+
+    def invalidate(self, pipeline_id: str = None):
+        """Drops cached manifold model lists (all of them if no id is given)."""
+        if pipeline_id is None:
+            self._manifolds.clear()
+        else:
+            self._manifolds.pop(pipeline_id, None)
+
+    def get_manifold_pipelines(self, pipeline_id: str, pipeline) -> List[dict]:
+        # Check if pipelines is a function or a list
+        if not callable(pipeline.pipelines):
+            return pipeline.pipelines
+
+        cached = self._manifolds.get(pipeline_id)
+        if cached is not None:
+            return cached[1]
+
+        manifold_pipelines = pipeline.pipelines()
+        self._manifolds[pipeline_id] = (
+            time.monotonic() + self.manifold_ttl,
+            manifold_pipelines,
+        )
+        return manifold_pipelines
+
+    def build(self, modules: Mapping[str, object]) -> Dict[str, dict]:
+        pipelines = {}
+        for pipeline_id, pipeline in modules.items():
+            if hasattr(pipeline, "type"):
+                if pipeline.type == "manifold":
+                    try:
+                        manifold_pipelines = self.get_manifold_pipelines(
+                            pipeline_id, pipeline
+                        )
+                    except Exception as e:
+                        logging.error(
+                            f"Failed to list pipelines of manifold {pipeline_id}: {e}"
+                        )
+                        manifold_pipelines = []
+
+                    for p in manifold_pipelines:
+                        manifold_pipeline_id = f'{pipeline_id}.{p["id"]}'
+
+                        manifold_pipeline_name = p["name"]
+                        if hasattr(pipeline, "name"):
+                            manifold_pipeline_name = (
+                                f"{pipeline.name}{manifold_pipeline_name}"
+                            )
+
+                        pipelines[manifold_pipeline_id] = {
+                            "module": pipeline_id,
+                            "type": pipeline.type,
+                            "id": manifold_pipeline_id,
+                            "name": manifold_pipeline_name,
+                            "valves": get_valves(pipeline),
+                        }
+                if pipeline.type == "filter":
+                    pipelines[pipeline_id] = {
+                        "module": pipeline_id,
+                        "type": pipeline.type,
+                        "id": pipeline_id,
+                        "name": (
+                            pipeline.name if hasattr(pipeline, "name") else pipeline_id
+                        ),
+                        "pipelines": (
+                            pipeline.valves.pipelines
+                            if hasattr(pipeline, "valves")
+                            and hasattr(pipeline.valves, "pipelines")
+                            else []
+                        ),
+                        "priority": (
+                            pipeline.valves.priority
+                            if hasattr(pipeline, "valves")
+                            and hasattr(pipeline.valves, "priority")
+                            else 0
+                        ),
+                        "valves": (
+                            pipeline.valves if hasattr(pipeline, "valves") else None
+                        ),
+                    }
+            else:
+                pipelines[pipeline_id] = {
+                    "module": pipeline_id,
+                    "type": "pipe",
+                    "id": pipeline_id,
+                    "name": (pipeline.name if hasattr(pipeline, "name") else pipeline_id),
+                    "valves": get_valves(pipeline),
+                }
+
+        return pipelines
+
+    def rebuild(self, modules: Mapping[str, object]) -> RegistrySnapshot:
+        """Builds a new snapshot from `modules` and swaps it in atomically."""
+        modules = dict(modules)
+        pipelines = self.build(modules)
+
+        for pipeline_id in list(self._manifolds.keys()):
+            if pipeline_id not in modules:
+                self._manifolds.pop(pipeline_id, None)
+
+        with self._lock:
+            snapshot = RegistrySnapshot(
+                self._snapshot.version + 1,
+                MappingProxyType(pipelines),
+                MappingProxyType(modules),
+                MappingProxyType(build_filter_chains(pipelines)),
+            )
+            self._snapshot = snapshot
+
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Registry listener failed: {e}")
+
+        logging.info(
+            f"Pipeline registry rebuilt: version={snapshot.version} pipelines={len(pipelines)}"
+        )
+        return snapshot
+
+    async def refresh_manifolds(self) -> bool:
+        """
+        Re-evaluates expired manifold model lists off the event loop and swaps in
+        a new snapshot if any of them changed.
+        """
+        snapshot = self._snapshot
+        now = time.monotonic()
+        changed = False
+
+        for pipeline_id, (expires_at, previous) in list(self._manifolds.items()):
+            if expires_at > now:
+                continue
+
+            pipeline = snapshot.modules.get(pipeline_id)
+            if pipeline is None:
+                self._manifolds.pop(pipeline_id, None)
+                continue
+
+            try:
+                manifold_pipelines = await asyncio.to_thread(pipeline.pipelines)
+            except Exception as e:
+                logging.warning(f"Failed to refresh manifold {pipeline_id}: {e}")
+                manifold_pipelines = previous
+
+            self._manifolds[pipeline_id] = (
+                time.monotonic() + self.manifold_ttl,
+                manifold_pipelines,
+            )
+            if manifold_pipelines != previous:
+                changed = True
+
+        # Only swap if nobody rebuilt the registry while we were refreshing.
+        if changed and snapshot is self._snapshot:
+            self.rebuild(snapshot.modules)
+
+        return changed
+
+    async def run_manifold_refresher(self):
+        while True:
+            await asyncio.sleep(self.manifold_ttl)
+            try:
+                await self.refresh_manifolds()
+            except Exception as e:
+                logging.error(f"Manifold refresh failed: {e}")
@@ -0,0 +1,154 @@
+"""
+Fast ingestion of chat completion requests.
+
+Multimodal histories carry base64 images of several megabytes. Validating them
+with pydantic and dumping the model back to dicts for `messages` and `body`
+copies every message a few times per request, so the raw body is parsed once
+and only the fields the router needs are checked: `model`, `stream` and the
+role and content of each message. The parsed dict is passed to the pipe as
+`body`, and its "messages" list as `messages`, without copying.
+"""
+
+import json
+
+from typing import List, Optional
+
+from fastapi.exceptions import RequestValidationError
+
+from schemas import OpenAIChatCompletionForm
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+
+except ImportError:
+    loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+
+def inline_schema(schema, defs: dict):
+    """Replaces the `#/$defs/...` references of a JSON schema by their definitions."""
+    if isinstance(schema, dict):
+        ref = schema.get("$ref", "")
+        if ref.startswith("#/$defs/"):
+            return inline_schema(defs[ref[len("#/$defs/") :]], defs)
+        return {key: inline_schema(value, defs) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [inline_schema(value, defs) for value in schema]
+    return schema
+
+
+def request_schema(model) -> dict:
+    schema = model.model_json_schema()
+    return inline_schema(schema, schema.pop("$defs", {}))
+
+
+# Documents the endpoint's request body, which is no longer declared as a parameter
+OPENAPI_EXTRA = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": request_schema(OpenAIChatCompletionForm)}},
+    }
+}
+
+
+class ChatCompletionRequest:
+    """The parsed body of a chat completion request with its routing fields."""
+
+    __slots__ = ("body", "model", "stream", "messages")
+
+    def __init__(self, body: dict):
+        self.body = body
+        self.model: str = body["model"]
+        self.stream: bool = body["stream"]
+        self.messages: List[dict] = body["messages"]
+
+
+def error(kind: str, loc: tuple, msg: str) -> dict:
+    # Shaped like pydantic's errors, so clients get the usual 422 response
+    return {"type": kind, "loc": ("body", *loc), "msg": msg}
+
+
+TRUE_STRINGS = {"1", "on", "t", "true", "y", "yes"}
+FALSE_STRINGS = {"0", "off", "f", "false", "n", "no"}
+
+
+def coerce_bool(value) -> Optional[bool]:
+    """Reads a boolean the way pydantic's lax mode does, or returns None."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        value = value.lower()
+        if value in TRUE_STRINGS:
+            return True
+        if value in FALSE_STRINGS:
+            return False
+    return None
+
+
+def parse_chat_request(raw: bytes) -> ChatCompletionRequest:
+    """
+    Parses and checks a chat completion body, raising RequestValidationError
+    like FastAPI does for a declared OpenAIChatCompletionForm. `stream`
+    defaults to true.
+    """
+    try:
+        body = loads(raw)
+    except (JSONDecodeError, UnicodeDecodeError) as e:
+        raise RequestValidationError([error("json_invalid", (), f"JSON decode error: {e}")])
+
+    if not isinstance(body, dict):
+        raise RequestValidationError(
+            [error("model_attributes_type", (), "Input should be a valid dictionary")]
+        )
+
+    errors = []
+
+    if "model" not in body:
+        errors.append(error("missing", ("model",), "Field required"))
+    elif not isinstance(body["model"], str):
+        errors.append(error("string_type", ("model",), "Input should be a valid string"))
+
+    stream = coerce_bool(body.setdefault("stream", True))
+    if stream is None:
+        errors.append(
+            error("bool_parsing", ("stream",), "Input should be a valid boolean")
+        )
+    else:
+        # The coerced value is what the pipes see, as with the pydantic model
+        body["stream"] = stream
+
+    messages = body.get("messages")
+    if messages is None:
+        errors.append(error("missing", ("messages",), "Field required"))
+    elif not isinstance(messages, list):
+        errors.append(error("list_type", ("messages",), "Input should be a valid list"))
+    else:
+        for index, message in enumerate(messages):
+            loc = ("messages", index)
+            if not isinstance(message, dict):
+                errors.append(
+                    error("model_type", loc, "Input should be a valid dictionary")
+                )
+                continue
+            if not isinstance(message.get("role"), str):
+                errors.append(
+                    error("string_type", (*loc, "role"), "Input should be a valid string")
+                )
+            if not isinstance(message.get("content"), (str, list)):
+                errors.append(
+                    error(
+                        "union_type",
+                        (*loc, "content"),
+                        "Input should be a valid string or list",
+                    )
+                )
+
+    if errors:
+        raise RequestValidationError(errors)
+
+    return ChatCompletionRequest(body)
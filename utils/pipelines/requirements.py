@@ -0,0 +1,230 @@
+"""
+Installs the `requirements:` listed in pipeline frontmatter.
+
+Requirement sets are hashed and recorded in a marker cache once satisfied, and
+only requirements that are missing from the installed distributions (checked
+with `importlib.metadata`) are installed, in a single resolver invocation.
+
+Usage:
+    python -m utils.pipelines.requirements ./pipelines
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional
+
+from utils.pipelines.coordination import file_lock, write_json_atomic
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:
+    Requirement = None
+
+
+install_lock = threading.Lock()
+
+
+def parse_frontmatter(content):
+    frontmatter = {}
+    for line in content.split("\n"):
+        if ":" in line:
+            key, value = line.split(":", 1)
+            frontmatter[key.strip().lower()] = value.strip()
+    return frontmatter
+
+
+def read_frontmatter(module_path: str) -> dict:
+    with open(module_path, "r") as file:
+        content = file.read()
+
+    if content.startswith('"""'):
+        end = content.find('"""', 3)
+        if end != -1:
+            return parse_frontmatter(content[3:end])
+    return {}
+
+
+def split_requirements(requirements: Optional[str]) -> List[str]:
+    if not requirements:
+        return []
+    return [req.strip() for req in requirements.split(",") if req.strip()]
+
+
+def requirements_hash(requirements: Iterable[str]) -> str:
+    normalized = sorted({re.sub(r"\s+", "", req).lower() for req in requirements})
+    key = "\n".join([sys.executable, *normalized])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def is_satisfied(requirement: str) -> Optional[bool]:
+    """
+    Returns whether an installed distribution satisfies `requirement`, or None
+    when it cannot be checked locally (URLs, VCS and path requirements).
+    """
+    if Requirement is None:
+        match = re.match(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[.*\])?\s*$", requirement)
+        if not match:
+            return None
+        try:
+            importlib.metadata.version(match.group(1))
+            return True
+        except importlib.metadata.PackageNotFoundError:
+            return False
+
+    try:
+        req = Requirement(requirement)
+    except InvalidRequirement:
+        return None
+
+    if req.url:
+        return None
+    if req.marker is not None and not req.marker.evaluate():
+        return True
+
+    try:
+        version = importlib.metadata.version(req.name)
+    except importlib.metadata.PackageNotFoundError:
+        return False
+
+    return not req.specifier or req.specifier.contains(version, prereleases=True)
+
+
+class RequirementsCache:
+    """Marker cache of requirement-set hashes that were fully installed."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[Dict[str, dict]] = None
+
+    @property
+    def entries(self) -> Dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def add(self, key: str, requirements: List[str]):
+        # Pick up entries written by other workers before rewriting the file
+        self._entries = None
+        self.entries[key] = {
+            "requirements": sorted(set(requirements)),
+            "installed_at": int(time.time()),
+        }
+        write_json_atomic(self.path, self.entries)
+
+
+def install_command(requirements: List[str]) -> List[str]:
+    # uv resolves and installs much faster than pip when it is available
+    uv = shutil.which("uv")
+    if uv:
+        return [uv, "pip", "install", "--python", sys.executable, *requirements]
+    return [sys.executable, "-m", "pip", "install", *requirements]
+
+
+def ensure_requirements(requirements: Iterable[str], cache: RequirementsCache) -> List[str]:
+    """
+    Makes sure every requirement is installed and returns the ones that had to
+    be installed. Unchanged requirement sets cost a hash and a few metadata
+    lookups; missing requirements are installed in one batch.
+    """
+    requirements = sorted(set(requirements))
+    if not requirements:
+        return []
+
+    # Workers of the same deployment may start at the same time
+    with install_lock, file_lock(f"{cache.path}.lock"):
+        key = requirements_hash(requirements)
+        cached = key in cache
+
+        missing = []
+        for req in requirements:
+            satisfied = is_satisfied(req)
+            # Requirements that cannot be checked are trusted once the set was installed
+            if satisfied is False or (satisfied is None and not cached):
+                missing.append(req)
+
+        if missing:
+            print(f"Installing requirements: {' '.join(missing)}")
+            subprocess.check_call(install_command(missing))
+            importlib.invalidate_caches()
+        else:
+            logging.info(f"Requirements already satisfied: {', '.join(requirements)}")
+
+        if missing or not cached:
+            cache.add(key, requirements)
+
+        return missing
+
+
+def ensure_module_requirements(
+    requirements: Dict[str, List[str]], cache: RequirementsCache
+) -> Dict[str, str]:
+    """
+    Installs the requirements of many modules in one batch. If the batch fails,
+    e.g. on one bad or conflicting requirement, each module's set is installed
+    on its own so the others are not held back. Returns the error of every
+    module whose requirements could not be installed.
+    """
+    try:
+        ensure_requirements(
+            [req for reqs in requirements.values() for req in reqs], cache
+        )
+        return {}
+    except (subprocess.CalledProcessError, OSError) as e:
+        logging.warning(f"Installing requirements in one batch failed ({e}), retrying per module")
+
+    failed = {}
+    for module_name, reqs in requirements.items():
+        try:
+            ensure_requirements(reqs, cache)
+        except (subprocess.CalledProcessError, OSError) as e:
+            logging.error(f"Failed to install requirements of {module_name}: {e}")
+            failed[module_name] = str(e)
+    return failed
+
+
+def collect_requirements(directory: str) -> Dict[str, List[str]]:
+    requirements = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".py"):
+            frontmatter = read_frontmatter(os.path.join(directory, filename))
+            requirements[filename[:-3]] = split_requirements(
+                frontmatter.get("requirements")
+            )
+    return requirements
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else "./pipelines"
+    cache_path = os.getenv(
+        "PIPELINES_REQUIREMENTS_CACHE", os.path.join(directory, ".requirements.json")
+    )
+
+    requirements = collect_requirements(directory)
+    if not any(requirements.values()):
+        print(f"No requirements found in frontmatter of pipelines in {directory}.")
+        return
+
+    failed = ensure_module_requirements(requirements, RequirementsCache(cache_path))
+    if failed:
+        sys.exit(f"Failed to install requirements of: {', '.join(sorted(failed))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+
+
+# Seconds a stream handed out to a subscriber has to start reading before it no
+# longer keeps the shared upstream alive
+SUBSCRIBE_GRACE = 10.0
+
+
+class Flight:
+    """
+    One in-flight request shared by every identical request that arrives
+    before it completes.
+
+    A streamed response is pumped from its upstream iterator by a background
+    task into a buffer, and each subscriber replays the buffer from the start
+    before following the live stream. The upstream is only cancelled once every
+    subscriber has gone away.
+    """
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.response = None
+        self.exception: Optional[BaseException] = None
+
+        self.chunks: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        # Streams handed out that have not started reading yet
+        self.pending = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def start(self, body_iterator, on_done: Callable[[], None]):
+        self.task = asyncio.create_task(self.pump(body_iterator, on_done))
+
+    async def pump(self, body_iterator, on_done: Callable[[], None]):
+        try:
+            async for chunk in body_iterator:
+                self.chunks.append(chunk)
+                self.notify()
+        except asyncio.CancelledError:
+            self.error = ConnectionAbortedError("Every subscriber disconnected")
+            raise
+        except Exception as e:
+            logging.error(f"Shared stream failed: {e}")
+            self.error = e
+        finally:
+            aclose = getattr(body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.done = True
+            self.notify()
+            on_done()
+
+    def stream(self, response: StreamingResponse) -> StreamingResponse:
+        # A stream handed out is pending until it starts reading, so the upstream is
+        # not cancelled before a slow client starts. One that never starts (e.g. the
+        # client went away before the body was sent) stops counting after a grace period.
+        self.pending += 1
+        claim = {"pending": True}
+
+        def expire():
+            if claim["pending"]:
+                claim["pending"] = False
+                self.pending -= 1
+                self.cancel_if_abandoned()
+
+        asyncio.get_running_loop().call_later(SUBSCRIBE_GRACE, expire)
+        return StreamingResponse(
+            self.subscribe(claim),
+            status_code=response.status_code,
+            media_type=response.media_type,
+        )
+
+    async def subscribe(self, claim: dict):
+        if claim["pending"]:
+            claim["pending"] = False
+            self.pending -= 1
+        self.subscribers += 1
+
+        index = 0
+        try:
+            while True:
+                changed = self._changed
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            self.cancel_if_abandoned()
+
+    def cancel_if_abandoned(self):
+        if self.subscribers == 0 and self.pending == 0 and not self.done:
+            self.task.cancel()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first one for a key (the
+    leader) runs, the ones arriving while it is in flight (followers) share its
+    response. Non-streamed responses are shared as they are; streamed
+    responses are fanned out to every subscriber from one upstream iterator.
+    """
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+
+    def finish(self, key: str, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def run(self, key: str, produce: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Returns the response and whether this request was the leader."""
+        flight = self.flights.get(key)
+        if flight is not None:
+            await flight.ready.wait()
+            if flight.exception is not None:
+                if isinstance(flight.exception, asyncio.CancelledError):
+                    # The leader went away before producing a response
+                    return await self.run(key, produce)
+                raise flight.exception
+            if isinstance(flight.response, StreamingResponse):
+                return flight.stream(flight.response), False
+            return flight.response, False
+
+        flight = self.flights[key] = Flight()
+        try:
+            response = await produce()
+        except BaseException as e:
+            self.finish(key, flight)
+            flight.exception = e
+            flight.ready.set()
+            raise
+
+        flight.response = response
+        if isinstance(response, StreamingResponse):
+            flight.start(response.body_iterator, lambda: self.finish(key, flight))
+            response = flight.stream(response)
+        else:
+            self.finish(key, flight)
+        flight.ready.set()
+        return response, True
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self.flights),
+            "subscribers": sum(flight.subscribers for flight in self.flights.values()),
+        }
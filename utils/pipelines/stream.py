@@ -0,0 +1,220 @@
+import asyncio
+import inspect
+import json
+import logging
+import threading
+import time
+import uuid
+
+from typing import Callable, Iterator, Optional
+from anyio import to_thread
+from pydantic import BaseModel
+
+try:
+    import orjson
+
+    def dumps(value) -> str:
+        return orjson.dumps(value).decode("utf-8")
+
+except ImportError:
+
+    def dumps(value) -> str:
+        return json.dumps(value)
+
+
+# anyio renamed `cancellable` to `abandon_on_cancel` in 4.1
+if "abandon_on_cancel" in inspect.signature(to_thread.run_sync).parameters:
+    ABANDON_ON_CANCEL = {"abandon_on_cancel": True}
+else:
+    ABANDON_ON_CANCEL = {"cancellable": True}
+
+
+class StreamEncoder:
+    """
+    Encodes pipe output as OpenAI `chat.completion.chunk` SSE frames.
+
+    One completion id and timestamp is used for the whole response and the
+    chunk envelope is serialized once, so each token only costs a string
+    escape and a concatenation.
+
+    Tokens can optionally be coalesced into a single frame: they are buffered
+    until `coalesce_bytes` characters are pending or `coalesce_ms` has passed
+    since the first buffered token. The window is checked when the next token
+    arrives, so leave both at 0 for pipes with long gaps between tokens.
+    """
+
+    def __init__(self, model: str, coalesce_ms: float = 0, coalesce_bytes: int = 0):
+        self.model = model
+        self.id = f"{model}-{str(uuid.uuid4())}"
+        self.created = int(time.time())
+
+        self.coalesce_seconds = coalesce_ms / 1000
+        self.coalesce_bytes = coalesce_bytes
+
+        self._buffer = []
+        self._buffered = 0
+        self._buffered_at = 0.0
+
+        head = dumps(
+            {
+                "id": self.id,
+                "object": "chat.completion.chunk",
+                "created": self.created,
+                "model": model,
+            }
+        )
+        self._prefix = f'data: {head[:-1]},"choices":[{{"index":0,"delta":{{"content":'
+        self._suffix = '},"logprobs":null,"finish_reason":null}]}\n\n'
+
+    @property
+    def coalescing(self) -> bool:
+        return self.coalesce_seconds > 0 or self.coalesce_bytes > 0
+
+    def content(self, text: str) -> str:
+        """Returns a single frame carrying `text` as the delta content."""
+        return f"{self._prefix}{dumps(text)}{self._suffix}"
+
+    def encode(self, line) -> str:
+        """
+        Encodes one item yielded by a pipe. Pre-formatted `data:` lines and
+        pydantic models pass through as-is; anything else is treated as content.
+        Returns an empty string while a coalesced frame is still being filled.
+        """
+        if isinstance(line, BaseModel):
+            line = f"data: {line.model_dump_json()}"
+        elif isinstance(line, bytes):
+            line = line.decode("utf-8")
+
+        if line.startswith("data:"):
+            return f"{self.flush()}{line}\n\n"
+
+        if not self.coalescing:
+            return self.content(line)
+
+        if not self._buffer:
+            self._buffered_at = time.monotonic()
+        self._buffer.append(line)
+        self._buffered += len(line)
+
+        if (self.coalesce_bytes and self._buffered >= self.coalesce_bytes) or (
+            self.coalesce_seconds
+            and time.monotonic() - self._buffered_at >= self.coalesce_seconds
+        ):
+            return self.flush()
+        return ""
+
+    def flush(self) -> str:
+        if not self._buffer:
+            return ""
+
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        return self.content(text)
+
+    def finish(
+        self,
+        finish_reason: Optional[str] = "stop",
+        extra: Optional[dict] = None,
+        flush: bool = True,
+    ) -> str:
+        """
+        Flushes pending content and returns the finish chunk and the [DONE]
+        marker. `extra` adds top-level fields to the finish chunk. With
+        `flush=False` the buffer is left alone, e.g. when the producer that
+        fills it may still be running in an abandoned thread.
+        """
+        finish_message = dumps(
+            {
+                "id": self.id,
+                "object": "chat.completion.chunk",
+                "created": self.created,
+                "model": self.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {},
+                        "logprobs": None,
+                        "finish_reason": finish_reason,
+                    }
+                ],
+                **(extra or {}),
+            }
+        )
+        pending = self.flush() if flush else ""
+        return f"{pending}data: {finish_message}\n\ndata: [DONE]\n\n"
+
+
+_EXHAUSTED = object()
+
+
+def close_iterator(iterator):
+    """Closes a pipe's iterator (e.g. a generator holding an upstream connection)."""
+    close = getattr(iterator, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception as e:
+        logging.warning(f"Failed to close stream iterator: {e}")
+
+
+async def aclose_iterator(iterator):
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is None:
+        close_iterator(iterator)
+        return
+    try:
+        await aclose()
+    except Exception as e:
+        logging.warning(f"Failed to close stream iterator: {e}")
+
+
+async def iterate_in_thread(
+    iterator: Iterator,
+    on_abandoned: Optional[Callable[[], None]] = None,
+    hold: Optional[Callable[[], Callable[[], None]]] = None,
+):
+    """
+    Iterates a blocking iterator asynchronously, pulling each item in a worker
+    thread.
+
+    Unlike Starlette's `iterate_in_threadpool`, a pull in progress does not
+    hold up cancellation, e.g. when the client disconnects. The iterator is
+    then closed as soon as the pending `next()` returns, and the item it
+    produced is dropped and reported to `on_abandoned`. `hold` is called at
+    that point and the callback it returns once the iterator is closed, e.g.
+    to keep an admission slot until the thread is free again.
+    """
+    lock = threading.Lock()
+    abandoned = False
+
+    def pull():
+        with lock:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return _EXHAUSTED
+            if abandoned and on_abandoned is not None:
+                on_abandoned()
+            return item
+
+    def close():
+        with lock:
+            close_iterator(iterator)
+
+    try:
+        while True:
+            item = await to_thread.run_sync(pull, **ABANDON_ON_CANCEL)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    except (GeneratorExit, asyncio.CancelledError):
+        abandoned = True
+        # Waits for the pending pull in a thread of its own, as this task is
+        # going away and must not block
+        closing = asyncio.get_running_loop().run_in_executor(None, close)
+        if hold is not None:
+            unhold = hold()
+            closing.add_done_callback(lambda _: unhold())
+        raise
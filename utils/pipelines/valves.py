@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from typing import Dict, List, Optional
+
+
+class ValveStore:
+    """
+    Valves of every pipeline in one SQLite database, keyed by module name.
+
+    Every update is stored as a new version in a single transaction, so a
+    crash never leaves valves half written, and the last `history` versions
+    of each pipeline are kept for rollback. The current valves are read once
+    with `load` and served from memory afterwards. Writes block, so callers on
+    the event loop run them in a thread.
+
+    Pipelines without stored valves are migrated from their legacy
+    `{PIPELINES_DIR}/{module}/valves.json` on first load.
+    """
+
+    def __init__(self, path: str, history: int = 50):
+        self.path = path
+        self.history_size = history
+        self.current: Dict[str, dict] = {}
+
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=30
+            )
+            # Lets other workers read while one of them writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS valves (
+                    module TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (module, version)
+                )
+                """
+            )
+            self._connection = connection
+        return self._connection
+
+    def load(self) -> Dict[str, dict]:
+        """Reads the current valves of every pipeline."""
+        with self._lock:
+            rows = self.connection().execute(
+                """
+                SELECT module, data FROM valves
+                WHERE (module, version) IN (SELECT module, MAX(version) FROM valves GROUP BY module)
+                """
+            ).fetchall()
+        self.current = {module: json.loads(data) for module, data in rows}
+        return self.current
+
+    def get(self, module: str) -> Optional[dict]:
+        return self.current.get(module)
+
+    def refresh(self, module: str) -> Optional[dict]:
+        """Re-reads the current valves of a pipeline, e.g. after another worker changed them."""
+        with self._lock:
+            row = self.connection().execute(
+                "SELECT data FROM valves WHERE module = ? ORDER BY version DESC LIMIT 1",
+                (module,),
+            ).fetchone()
+        if row is None:
+            self.current.pop(module, None)
+            return None
+        self.current[module] = json.loads(row[0])
+        return self.current[module]
+
+    def save(self, module: str, data: dict, source: str = "update") -> int:
+        """Stores `data` as the new current valves of a pipeline and returns its version."""
+        serialized = json.dumps(data, default=str)
+
+        with self._lock:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                (version,) = connection.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM valves WHERE module = ?",
+                    (module,),
+                ).fetchone()
+                connection.execute(
+                    "INSERT INTO valves VALUES (?, ?, ?, ?, ?)",
+                    (module, version, serialized, source, time.time()),
+                )
+                connection.execute(
+                    "DELETE FROM valves WHERE module = ? AND version <= ?",
+                    (module, version - self.history_size),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        self.current[module] = json.loads(serialized)
+        return version
+
+    def history(self, module: str) -> List[dict]:
+        with self._lock:
+            rows = self.connection().execute(
+                """
+                SELECT version, data, source, created_at FROM valves
+                WHERE module = ? ORDER BY version DESC
+                """,
+                (module,),
+            ).fetchall()
+        return [
+            {
+                "version": version,
+                "valves": json.loads(data),
+                "source": source,
+                "created_at": created_at,
+            }
+            for version, data, source, created_at in rows
+        ]
+
+    def rollback(self, module: str, version: int) -> dict:
+        """
+        Makes the valves of an earlier version current again, recorded as a new
+        version. Raises KeyError when the version is not in the history.
+        """
+        with self._lock:
+            row = self.connection().execute(
+                "SELECT data FROM valves WHERE module = ? AND version = ?",
+                (module, version),
+            ).fetchone()
+        if row is None:
+            raise KeyError(version)
+
+        data = json.loads(row[0])
+        self.save(module, data, source=f"rollback:{version}")
+        return data
+
+    def migrate(self, module: str, directory: str) -> Optional[dict]:
+        """Imports the legacy valves.json of a pipeline that has no stored valves."""
+        if module in self.current:
+            return self.current[module]
+
+        legacy_path = os.path.join(directory, module, "valves.json")
+        try:
+            with open(legacy_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable {legacy_path}: {e}")
+            return None
+
+        self.save(module, data, source="valves.json")
+        logging.info(f"Migrated {legacy_path} to the valve store")
+        return data
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
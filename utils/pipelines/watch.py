@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+from typing import AsyncIterator, Dict, List, NamedTuple
+
+
+class PipelineFile(NamedTuple):
+    path: str
+    mtime_ns: int
+    size: int
+    digest: str
+
+
+class PipelineChanges(NamedTuple):
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class PipelineDirectoryTracker:
+    """
+    Tracks the pipeline files in a directory by mtime, size and content hash.
+
+    Files are only re-hashed when their mtime or size changed, and a file is
+    only reported as changed when its content hash differs, so touching a file
+    or rewriting it with identical content does not trigger a reload.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files: Dict[str, PipelineFile] = {}
+
+    def scan(self) -> Dict[str, PipelineFile]:
+        files = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".py"):
+                continue
+
+            module_name = filename[:-3]
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+                previous = self.files.get(module_name)
+                if (
+                    previous
+                    and previous.mtime_ns == stat.st_mtime_ns
+                    and previous.size == stat.st_size
+                ):
+                    digest = previous.digest
+                else:
+                    digest = file_digest(path)
+            except FileNotFoundError:
+                continue
+
+            files[module_name] = PipelineFile(
+                path, stat.st_mtime_ns, stat.st_size, digest
+            )
+
+        return files
+
+    def reset(self):
+        """Records the current directory contents as the loaded state."""
+        self.files = self.scan()
+
+    def changes(self) -> PipelineChanges:
+        """Returns the files added, changed and removed since the last call."""
+        files = self.scan()
+
+        added = [name for name in files if name not in self.files]
+        removed = [name for name in self.files if name not in files]
+        changed = [
+            name
+            for name, file in files.items()
+            if name in self.files and self.files[name].digest != file.digest
+        ]
+
+        self.files = files
+        return PipelineChanges(added, changed, removed)
+
+    async def watch(self, interval: float = 2) -> AsyncIterator[None]:
+        """
+        Yields whenever a pipeline file may have changed. Uses `watchfiles` when
+        it is installed and falls back to polling every `interval` seconds.
+        """
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            awatch = None
+
+        if awatch is None:
+            logging.info(f"Polling {self.directory} for pipeline changes")
+            while True:
+                await asyncio.sleep(interval)
+                yield
+        else:
+            logging.info(f"Watching {self.directory} for pipeline changes")
+            # Also yield on timeout so changes made before the watcher was
+            # registered are still picked up by the next scan.
+            async for _ in awatch(
+                self.directory,
+                watch_filter=lambda change, path: path.endswith(".py"),
+                recursive=False,
+                rust_timeout=int(interval * 1000),
+                yield_on_timeout=True,
+            ):
+                yield